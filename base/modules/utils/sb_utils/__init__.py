@@ -1,12 +1,27 @@
-from .amqp_tools import Consumer, Producer
+from .amqp_tools import Consumer, Producer, ThreadConsumer, broker_url, make_consumer, make_producer
 from .general import prefixUUID, default_decode, default_encode, safe_cast, safe_json, toStr
+from .expiry import EXPIRED_KEY, get_expires, is_expired, time_to_live
 from .ext_dicts import FrozenDict, ObjectDict, QueryDict
-from .message import decode_msg, encode_msg
+from .journal import Journal, read_journal
+from .local_bus import LocalBus, LocalConsumer, LocalProducer
+from .message import decode_msg, encode_msg, EncodeCache
+from .metrics import Metrics
+from .sharding import shard, shard_routing_key, shard_routing_keys
+from .tracing import TraceStore, fork as fork_trace, get_trace, mark as mark_trace, new_trace, server_timing
+from .transport import BatchPublisher, TransportRuntime
 
 __all__ = [
     # AMQP Tools
     'Consumer',
     'Producer',
+    'ThreadConsumer',
+    'broker_url',
+    'make_consumer',
+    'make_producer',
+    # Local Bus
+    'LocalBus',
+    'LocalConsumer',
+    'LocalProducer',
     # General Utils
     'default_decode',
     'default_encode',
@@ -14,11 +29,35 @@ __all__ = [
     'safe_cast',
     'safe_json',
     'toStr',
+    # Command Expiry
+    'EXPIRED_KEY',
+    'get_expires',
+    'is_expired',
+    'time_to_live',
     # Extended Dictionaries
     'FrozenDict',
     'ObjectDict',
     'QueryDict',
+    # Capture Journal
+    'Journal',
+    'read_journal',
     # Message Utils
     'decode_msg',
     'encode_msg',
+    'EncodeCache',
+    # Transport Utils
+    'BatchPublisher',
+    'Metrics',
+    'TransportRuntime',
+    # Sharding
+    'shard',
+    'shard_routing_key',
+    'shard_routing_keys',
+    # Tracing
+    'TraceStore',
+    'fork_trace',
+    'get_trace',
+    'mark_trace',
+    'new_trace',
+    'server_timing',
 ]
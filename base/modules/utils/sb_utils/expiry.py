@@ -0,0 +1,52 @@
+"""
+expiry.py
+Deadlines of commands, carried in the message headers as `headers["source"]["expires"]`, the epoch time (seconds) after which the command is dropped.
+Commands that expire in an AMQP transport queue are dead-lettered to the orchestrator, transports drop the commands that expire before they are sent.
+"""
+import time
+
+from typing import Optional
+
+# Routing key, on the orchestrator exchange, of the commands dropped as expired
+EXPIRED_KEY = "expired"
+
+# Policy of the transport queues, messages past their TTL are routed to the orchestrator.
+# A policy applies to queues already declared, RabbitMQ rejects redeclaring a queue with different arguments
+DEAD_LETTER_POLICY = {
+    "dead-letter-exchange": "orchestrator",
+    "dead-letter-routing-key": EXPIRED_KEY
+}
+
+
+def get_expires(headers: Optional[dict]) -> Optional[float]:
+    """
+    Get the deadline of a command from its message headers
+    :param headers: command message headers
+    :return: epoch deadline, None if the command does not expire
+    """
+    expires = (headers or {}).get("source", {}).get("expires")
+    return float(expires) if isinstance(expires, (int, float)) else None
+
+
+def time_to_live(headers: Optional[dict], now: float = None) -> Optional[float]:
+    """
+    Time remaining until a command expires
+    :param headers: command message headers
+    :param now: epoch time, default now
+    :return: seconds remaining, 0 if expired, None if the command does not expire
+    """
+    expires = get_expires(headers)
+    if expires is None:
+        return None
+    return max(expires - (time.time() if now is None else now), 0)
+
+
+def is_expired(headers: Optional[dict], now: float = None) -> bool:
+    """
+    Check if a command is past its deadline
+    :param headers: command message headers
+    :param now: epoch time, default now
+    :return: command expired
+    """
+    expires = get_expires(headers)
+    return expires is not None and expires <= (time.time() if now is None else now)
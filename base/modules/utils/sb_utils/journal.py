@@ -0,0 +1,189 @@
+"""
+journal.py
+Rotating on-disk journal of the messages published to and consumed from the message broker, for capture and replay.
+Each process appends JSON lines to its own segment, full segments are gzip compressed and the oldest are removed.
+"""
+import base64
+import glob
+import gzip
+import heapq
+import json
+import os
+import shutil
+import threading
+import time
+
+from typing import Iterable, Iterator, Optional
+
+# Environment variable with the capture directory, capture is disabled if not set
+CAPTURE_ENV = "QUEUE_CAPTURE"
+
+
+def _encode_body(body) -> dict:
+    if isinstance(body, (bytes, bytearray)):
+        return {"bytes": base64.b64encode(body).decode()}
+    if isinstance(body, str):
+        return {"str": body}
+    return {"json": body}
+
+
+def _decode_body(body: dict):
+    if "bytes" in body:
+        return base64.b64decode(body["bytes"])
+    if "str" in body:
+        return body["str"]
+    return body.get("json")
+
+
+class Journal(object):
+    """
+    Appends messages to a rotating journal, safe to share between threads and reopened in forked processes
+    """
+    def __init__(self, directory: str, name: str = "journal", max_bytes: int = 64 * 1024 ** 2, max_files: int = 20):
+        """
+        :param directory: directory of the journal segments, created if it does not exist
+        :param name: prefix of the segment files - Ex) producer, consumer
+        :param max_bytes: size, in bytes, of an uncompressed segment before it is rotated
+        :param max_files: number of segments of a process to keep, 0 to keep all
+        """
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self._seq = 0
+
+    def record(self, side: str, body, headers: dict = None, exchange: str = "", routing_key: str = "", timestamp: float = None) -> None:
+        """
+        Append a message to the journal
+        :param side: publish or consume
+        :param body: message body
+        :param headers: message headers
+        :param exchange: exchange of the message
+        :param routing_key: routing key of the message
+        :param timestamp: epoch time of the message, default now
+        """
+        line = json.dumps({
+            "ts": time.time() if timestamp is None else timestamp,
+            "side": side,
+            "exchange": exchange,
+            "routing_key": routing_key,
+            "headers": headers or {},
+            "body": _encode_body(body)
+        }, separators=(",", ":"), default=str) + "\n"
+
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+            self._pid = None
+
+    def _open(self) -> None:
+        # A forked process inherits the file of its parent, which the parent keeps writing
+        os.makedirs(self.directory, exist_ok=True)
+        self._pid = os.getpid()
+        self._seq += 1
+        path = os.path.join(self.directory, f"{self.name}-{self._pid}-{int(time.time())}-{self._seq:04d}.jsonl")
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _rotate(self) -> None:
+        path = self._file.name
+        self._file.close()
+        self._open()
+        threading.Thread(target=self._compress, args=(path, ), daemon=True).start()
+
+    def _compress(self, path: str) -> None:
+        try:
+            with open(path, "rb") as src, gzip.open(f"{path}.gz.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(f"{path}.gz.tmp", f"{path}.gz")
+            os.remove(path)
+        except OSError as e:
+            print(f"Cannot compress journal segment {path}: {e}")
+            return
+
+        if self.max_files:
+            segments = sorted(glob.glob(os.path.join(self.directory, f"{self.name}-{os.getpid()}-*.jsonl*")), key=os.path.getmtime)
+            for old in segments[:-self.max_files]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+
+def capture_journal(name: str, directory: str = None) -> Optional[Journal]:
+    """
+    Get the journal of a producer/consumer if capture is enabled
+    :param name: prefix of the segment files
+    :param directory: capture directory, default `QUEUE_CAPTURE`
+    :return: journal, None if capture is disabled
+    """
+    directory = directory or os.environ.get(CAPTURE_ENV)
+    return Journal(directory, name) if directory else None
+
+
+def journal_files(paths: Iterable[str]) -> list:
+    """
+    Expand journal directories into their segment files
+    :param paths: segment files and/or journal directories
+    :return: segment files
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            compressed = glob.glob(os.path.join(path, "*.jsonl.gz"))
+            # A rotated segment is briefly kept next to its compressed copy, which is read instead
+            raw = [f for f in glob.glob(os.path.join(path, "*.jsonl")) if f"{f}.gz" not in compressed]
+            files.extend(sorted(raw + compressed))
+        else:
+            files.append(path)
+    return files
+
+
+def _read_file(path: str) -> Iterator[dict]:
+    if not path.endswith(".gz") and not os.path.exists(path) and os.path.exists(f"{path}.gz"):
+        # Compressed since the segments were listed
+        path = f"{path}.gz"
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                # Partially written line of a segment still being written
+                continue
+            rec["body"] = _decode_body(rec.get("body", {}))
+            yield rec
+
+
+def read_journal(paths: Iterable[str]) -> Iterator[dict]:
+    """
+    Read the messages of journal segments in time order, the segments of each process are read in sequence and merged
+    :param paths: segment files and/or journal directories
+    :return: iterator of message records - ts, side, exchange, routing_key, headers, body
+    """
+    streams = {}
+    for path in journal_files(paths):
+        # <name>-<pid>-<start>-<seq>.jsonl[.gz]
+        stem = os.path.basename(path).split(".jsonl")[0]
+        parts = stem.rsplit("-", 3)
+        key = tuple(parts[:2]) if len(parts) == 4 else (stem, )
+        order = (int(parts[2]), int(parts[3])) if len(parts) == 4 and parts[2].isdigit() and parts[3].isdigit() else (0, 0)
+        streams.setdefault(key, []).append((order, path))
+
+    def stream(segments):
+        for _, path in sorted(segments):
+            yield from _read_file(path)
+
+    return heapq.merge(*(stream(segments) for segments in streams.values()), key=lambda r: r["ts"])
@@ -0,0 +1,256 @@
+"""
+local_bus.py
+In-process message bus for single-node deployments where the orchestrator and transports run in one process.
+Messages are passed by reference without serialization, the consumer and producer match the AMQP tools interface.
+"""
+import datetime
+import queue
+import threading
+
+from functools import lru_cache, partial
+from inspect import isfunction, ismethod
+from typing import Dict, List, Optional, Tuple, Union
+
+from .journal import capture_journal
+
+
+@lru_cache(maxsize=1024)
+def topic_matches(binding_key: str, routing_key: str) -> bool:
+    """
+    Check if a routing key matches an AMQP topic binding key, `*` matches one word and `#` matches zero or more words
+    :param binding_key: dot separated binding key
+    :param routing_key: dot separated routing key
+    :return: key matches
+    """
+    def match(b_words: Tuple[str, ...], r_words: Tuple[str, ...]) -> bool:
+        if not b_words:
+            return not r_words
+        if b_words[0] == "#":
+            return any(match(b_words[1:], r_words[idx:]) for idx in range(len(r_words) + 1))
+        if not r_words or b_words[0] not in ("*", r_words[0]):
+            return False
+        return match(b_words[1:], r_words[1:])
+    return match(tuple(binding_key.split(".")), tuple(routing_key.split(".")))
+
+
+class LocalMessage(object):
+    """
+    Message delivered on the local bus, mirrors the attributes of a kombu message used by callbacks
+    """
+    __slots__ = ("body", "headers", "delivery_info")
+
+    def __init__(self, body, headers: dict, exchange: str, routing_key: str):
+        self.body = body
+        self.headers = headers
+        self.delivery_info = {"exchange": exchange, "routing_key": routing_key}
+
+    def ack(self) -> None:
+        """
+        Messages are removed from the queue on delivery, nothing to acknowledge
+        """
+
+
+class LocalBus(object):
+    """
+    Topic exchanges and queues held in memory, queues are bound by name so consumers of the same queue share its messages
+    """
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queues: Dict[str, queue.Queue] = {}
+        self._bindings: Dict[str, List[Tuple[str, str]]] = {}
+
+    @classmethod
+    def default(cls) -> "LocalBus":
+        """
+        Bus shared by all local consumers and producers of the process
+        :return: process bus
+        """
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = cls()
+            return cls._instance
+
+    def bind(self, name: str, exchange: str, routing_key: str, into: queue.Queue = None) -> queue.Queue:
+        """
+        Declare a queue and bind it to an exchange
+        :param name: queue name
+        :param exchange: exchange to bind to
+        :param routing_key: binding key, may contain `*` and `#` wildcards
+        :param into: deliver the messages of the queue to this queue, for consumers of several queues
+        :return: bound queue
+        """
+        with self._lock:
+            que = self._queues.setdefault(name, into or queue.Queue())
+            if into is not None and que is not into:
+                # Move the messages published before the consumer bound
+                while not que.empty():
+                    into.put(que.get_nowait())
+                que = self._queues[name] = into
+            binding = (routing_key, name)
+            if binding not in self._bindings.setdefault(exchange, []):
+                self._bindings[exchange].append(binding)
+            return que
+
+    def depth(self, name: str) -> int:
+        """
+        Get the number of messages waiting in a queue
+        :param name: queue name
+        :return: number of messages, 0 if the queue does not exist
+        """
+        que = self._queues.get(name)
+        return que.qsize() if que is not None else 0
+
+    def publish(self, message, headers: dict, exchange: str, routing_key: str) -> int:
+        """
+        Deliver a message to each queue bound to the exchange with a matching key
+        :param message: message to deliver, passed by reference
+        :param headers: message headers, passed by reference
+        :param exchange: exchange to publish to
+        :param routing_key: routing key of the message
+        :return: number of queues the message was delivered to
+        """
+        with self._lock:
+            # Mirror publishing with `declare`, the queue named by the routing key holds the message until consumed
+            bindings = self._bindings.setdefault(exchange, [])
+            if (routing_key, routing_key) not in bindings:
+                bindings.append((routing_key, routing_key))
+            queues = {name for key, name in bindings if topic_matches(key, routing_key)}
+            targets = [self._queues.setdefault(name, queue.Queue()) for name in queues]
+
+        msg = LocalMessage(message, headers, exchange, routing_key)
+        for que in targets:
+            que.put(msg)
+        return len(targets)
+
+
+class LocalConsumer(threading.Thread):
+    """
+    Consumes messages from a queue of the local bus on a thread of the current process
+    """
+    EXCHANGE = "transport"
+    ROUTING_KEY = "*"
+
+    def __init__(self, exchange: str = EXCHANGE, routing_key: Union[str, List[str]] = ROUTING_KEY, callbacks: Union[list, tuple] = None, debug: bool = False, bus: LocalBus = None, capture: str = None, **kwargs):
+        """
+        Consume message from queue exchange.
+        :param exchange: specifies where to read messages from
+        :param routing_key: binding key and name of the queue, or a list of them to consume from several queues
+        :param callbacks: list of callback functions which are called upon receiving a message
+        :param debug: print debugging messages
+        :param bus: bus to consume from, default the process bus
+        :param capture: directory to journal consumed messages to, default `QUEUE_CAPTURE`
+        :param kwargs: connection options of the AMQP consumer, unused
+        """
+        super().__init__(name=f"LocalConsumer-{exchange}-{routing_key}", daemon=True)
+        self._exit = threading.Event()
+        self._exchange_name = exchange
+        self._routing_key = routing_key
+        self._callbacks = ()
+        self._debug = debug
+        self._journal = capture_journal("consumer", capture)
+        bus = bus or LocalBus.default()
+        keys = [routing_key] if isinstance(routing_key, str) else list(routing_key)
+        self._queue = bus.bind(keys[0], exchange, keys[0])
+        for key in keys[1:]:
+            bus.bind(key, exchange, key, into=self._queue)
+
+        if isinstance(callbacks, (list, tuple)):
+            for func in callbacks:
+                self.add_callback(func)
+
+        self.start()
+        if self._debug:
+            print(f"Consuming local://{exchange}/{routing_key}")
+
+    def run(self) -> None:
+        """
+        Runs the consumer until stopped.
+        """
+        while not self._exit.is_set():
+            try:
+                msg = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            if self._debug:
+                print(f"Message Received @ {datetime.datetime.now()}")
+
+            if self._journal:
+                self._journal.record("consume", msg.body, msg.headers, self._exchange_name, msg.delivery_info["routing_key"])
+            for func in self._callbacks:
+                try:
+                    func(msg.body, msg)
+                except Exception as e:  # pylint: disable=broad-except
+                    print(f"Local consumer callback error: {e}")
+
+    def add_callback(self, fun):
+        """
+        Add a function to the list of callback functions.
+        :param fun: function, bound method or partial to add to callbacks
+        """
+        if isfunction(fun) or ismethod(fun) or isinstance(fun, partial):
+            if fun in self._callbacks:
+                raise ValueError("Duplicate function found in callbacks")
+            self._callbacks = (*self._callbacks, fun)
+
+    def shutdown(self):
+        """
+        Shutdown the consumer
+        """
+        self._exit.set()
+        print("The consumer has shutdown.")
+
+
+class LocalProducer(object):
+    """
+    Publishes messages to the local bus
+    """
+    EXCHANGE = "transport"
+    ROUTING_KEY = "*"
+
+    def __init__(self, debug: bool = False, bus: LocalBus = None, capture: str = None, **kwargs):
+        """
+        :param debug: print debugging messages
+        :param bus: bus to publish to, default the process bus
+        :param capture: directory to journal published messages to, default `QUEUE_CAPTURE`
+        :param kwargs: connection options of the AMQP producer, unused
+        """
+        self._debug = debug
+        self._journal = capture_journal("producer", capture)
+        self._bus = bus or LocalBus.default()
+
+    def publish(self, message: Union[dict, str] = "", headers: dict = None, exchange: str = EXCHANGE, routing_key: str = ROUTING_KEY):
+        """
+        Publish a message to the local bus
+        :param message: message to be published
+        :param headers: header key-values to publish with the message
+        :param exchange: specifies the top level specifier for message publish
+        :param routing_key: determines which queue the message is published to
+        """
+        self._bus.publish(message, headers or {}, exchange, routing_key)
+        if self._journal:
+            self._journal.record("publish", message, headers, exchange, routing_key)
+
+    def queue_depth(self, routing_key: str, exchange: str = EXCHANGE) -> Tuple[int, Optional[int]]:
+        """
+        Get the number of messages waiting in the queue of a routing key, the bus does not count consumers
+        :param routing_key: routing key/name of the queue
+        :param exchange: exchange of the queue, unused
+        :return: number of messages, None
+        """
+        return self._bus.depth(routing_key), None
+
+    def publish_batch(self, messages: List[Tuple[Union[dict, str], dict]], exchange: str = EXCHANGE, routing_key: str = ROUTING_KEY):
+        """
+        Publish multiple messages to the local bus
+        :param messages: message, headers pairs to be published
+        :param exchange: specifies the top level specifier for message publish
+        :param routing_key: determines which queue the messages are published to
+        """
+        for message, headers in messages:
+            self._bus.publish(message, headers or {}, exchange, routing_key)
+            if self._journal:
+                self._journal.record("publish", message, headers, exchange, routing_key)
@@ -10,6 +10,8 @@ import shutil
 import ubjson
 import yaml
 
+from typing import Dict, Union
+
 from .. import (
     ext_dicts,
     general
@@ -113,3 +115,62 @@ def decode_msg(msg: str, enc: str) -> dict:
 
     msg = serializations["decode"].get(enc, serializations.decode["json"])(msg)
     return general.default_decode(msg)
+
+
+class EncodeCache(object):
+    """
+    Message that is decoded at most once and encoded at most once per serialization,
+    the encodings are reused for every destination of the message
+    """
+    def __init__(self, msg: Union[bytes, bytearray, dict, str], enc: str = "json"):
+        """
+        :param msg: message, either decoded or encoded using the given serialization
+        :param enc: serialization of the given message
+        """
+        enc = enc.lower()
+        self._msg = msg if isinstance(msg, dict) else None
+        self._raw = None if isinstance(msg, dict) else msg
+        self._raw_enc = enc
+        self._encoded: Dict[str, Union[str, Exception]] = {}
+        self._bytes: Dict[str, bytes] = {}
+
+        # An encoded message is its own encoding, it does not need to be re-encoded
+        if self._raw is not None:
+            self._encoded[enc] = general.toStr(self._raw) if isinstance(self._raw, (bytes, bytearray)) else self._raw
+
+    @property
+    def message(self) -> dict:
+        """
+        Decoded message, decoded on first access
+        """
+        if self._msg is None:
+            self._msg = decode_msg(self._raw, self._raw_enc)
+        return self._msg
+
+    def encode(self, enc: str) -> str:
+        """
+        Encode the message using the serialization specified, errors are cached as well
+        :param enc: serialization to encode
+        :return: encoded message
+        """
+        enc = enc.lower()
+        if enc not in self._encoded:
+            try:
+                self._encoded[enc] = encode_msg(self.message, enc)
+            except (KeyError, ReferenceError, TypeError, ValueError) as e:
+                self._encoded[enc] = e
+
+        if isinstance(self._encoded[enc], Exception):
+            raise self._encoded[enc]
+        return self._encoded[enc]
+
+    def encode_bytes(self, enc: str) -> bytes:
+        """
+        Encode the message using the serialization specified as UTF-8 bytes
+        :param enc: serialization to encode
+        :return: encoded message
+        """
+        enc = enc.lower()
+        if enc not in self._bytes:
+            self._bytes[enc] = self.encode(enc).encode("utf-8")
+        return self._bytes[enc]
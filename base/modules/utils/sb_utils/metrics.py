@@ -0,0 +1,88 @@
+"""
+metrics.py
+Lightweight in-process counters and latency summaries for transports.
+"""
+import threading
+import time
+
+from contextlib import contextmanager
+from typing import Dict, Union
+
+
+class Metrics(object):
+    """
+    Thread-safe counters and latency summaries
+    """
+    def __init__(self, name: str = ""):
+        """
+        :param name: name of the component the metrics are for
+        """
+        self.name = name
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {}
+        self._timers: Dict[str, list] = {}  # name -> [count, total, max]
+        self._started = time.time()
+
+    def incr(self, key: str, value: int = 1) -> None:
+        """
+        Increment a counter
+        :param key: name of the counter
+        :param value: amount to increment by, negative to decrement
+        """
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, key: str, seconds: float) -> None:
+        """
+        Record a latency observation
+        :param key: name of the timer
+        :param seconds: observed latency
+        """
+        with self._lock:
+            timer = self._timers.setdefault(key, [0, 0.0, 0.0])
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = max(timer[2], seconds)
+
+    @contextmanager
+    def time(self, key: str):
+        """
+        Record the latency of the wrapped block
+        :param key: name of the timer
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(key, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Union[int, float, dict]]:
+        """
+        Current value of all counters and timers
+        :return: counter name -> value, timer name -> count, mean/max in milliseconds
+        """
+        with self._lock:
+            snap = dict(self._counters)
+            for key, (count, total, peak) in self._timers.items():
+                snap[key] = {
+                    "count": count,
+                    "mean_ms": round(total / count * 1000, 3) if count else 0,
+                    "max_ms": round(peak * 1000, 3)
+                }
+        snap["uptime"] = round(time.time() - self._started, 1)
+        return snap
+
+    def reporter(self, interval: float) -> threading.Thread:
+        """
+        Start a thread printing a snapshot of the metrics at the given interval
+        :param interval: time, in seconds, between reports
+        :return: reporting thread
+        """
+        def report():
+            while True:
+                time.sleep(interval)
+                print(f"Metrics [{self.name}]: {self.snapshot()}")
+
+        thread = threading.Thread(target=report, name=f"{self.name}Metrics", daemon=True)
+        thread.start()
+        return thread
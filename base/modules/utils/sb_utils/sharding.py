@@ -0,0 +1,48 @@
+"""
+sharding.py
+Shard the commands of a transport by device so replicas of the transport can consume in parallel while each device receives its commands in order.
+A protocol has a fixed number of shards, `<transport>.<shard>` routing keys, and each replica consumes a subset of them.
+Adding replicas reassigns shards to replicas without moving devices between shards.
+"""
+import zlib
+
+from typing import List
+
+
+def shard(key: str, shards: int) -> int:
+    """
+    Shard of a key, stable across processes and hosts
+    :param key: shard key - Ex) device ID
+    :param shards: number of shards
+    :return: shard index
+    """
+    return zlib.crc32(str(key).encode()) % shards if shards > 1 else 0
+
+
+def shard_routing_key(name: str, key: str, shards: int) -> str:
+    """
+    Routing key of the shard of a key
+    :param name: transport name/routing key
+    :param key: shard key - Ex) device ID
+    :param shards: number of shards, the transport name is used unsharded if 1
+    :return: routing key
+    """
+    return f"{name}.{shard(key, shards)}" if shards > 1 else name
+
+
+def shard_routing_keys(name: str, shards: int, replica: int = 0, replicas: int = 1) -> List[str]:
+    """
+    Routing keys of the shards consumed by a replica of a transport, shards are assigned to replicas round robin
+    :param name: transport name/routing key
+    :param shards: number of shards
+    :param replica: index of the replica, 0 to replicas - 1
+    :param replicas: number of replicas
+    :return: routing keys
+    """
+    if shards <= 1:
+        return [name]
+    if not 0 <= replica < replicas:
+        raise ValueError(f"Replica {replica} is not within the {replicas} replicas")
+    if replicas > shards:
+        raise ValueError(f"{replicas} replicas cannot share {shards} shards, replicas without a shard would be idle")
+    return [f"{name}.{s}" for s in range(replica, shards, replicas)]
@@ -0,0 +1,145 @@
+"""
+tracing.py
+Trace context propagated with a command from the orchestrator through a transport and back with its responses.
+A trace is a dict of a trace ID and hop name -> epoch timestamp (seconds), carried in the message headers.
+"""
+import copy
+import threading
+import time
+import uuid
+
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+# Hops of a command, in order
+HOPS = (
+    "core_received",            # orchestrator received the command
+    "core_published",           # orchestrator published the command to the transport
+    "transport_received",       # transport consumed the command
+    "transport_encoded",        # transport encoded the command for its destinations
+    "transport_sent",           # transport started sending to the device
+    "transport_responded",      # transport received the response of the device
+    "core_response_received",   # orchestrator consumed the response
+)
+
+
+def new_trace(trace_id: str = None, **hops: float) -> dict:
+    """
+    Create a trace context
+    :param trace_id: ID of the trace, random if not given, empty if the ID is joined later
+    :param hops: hop name, timestamp pairs
+    :return: trace context
+    """
+    return {"traceID": uuid.uuid4().hex if trace_id is None else trace_id, "hops": dict(hops)}
+
+
+def get_trace(headers: dict) -> Optional[dict]:
+    """
+    Get the trace context of a command from its message headers
+    :param headers: command message headers
+    :return: trace context, None if the command is not traced
+    """
+    trace = headers.get("source", {}).get("trace")
+    return trace if isinstance(trace, dict) and isinstance(trace.get("hops"), dict) else None
+
+
+def mark(trace: Optional[dict], hop: str, timestamp: float = None) -> Optional[dict]:
+    """
+    Record the time of a hop, the first time is kept if a hop is recorded again
+    :param trace: trace context, ignored if None
+    :param hop: name of the hop
+    :param timestamp: epoch timestamp, default now
+    :return: trace context
+    """
+    if trace is not None:
+        trace["hops"].setdefault(hop, time.time() if timestamp is None else timestamp)
+    return trace
+
+
+def fork(trace: Optional[dict], **extra) -> Optional[dict]:
+    """
+    Copy a trace for a single destination of a command
+    :param trace: trace context of the command
+    :param extra: additional values of the destination trace - Ex) actuator_ms
+    :return: destination trace context, None if the command is not traced
+    """
+    if trace is None:
+        return None
+    trace = copy.deepcopy(trace)
+    trace.update(extra)
+    return trace
+
+
+def server_timing(value: Optional[str], metric: str = "actuator") -> Optional[float]:
+    """
+    Get the duration of a metric from a Server-Timing header
+    :param value: header value - Ex) actuator;dur=12.5, db;dur=3
+    :param metric: name of the metric
+    :return: duration in milliseconds, None if not given
+    """
+    for entry in (value or "").split(","):
+        name, *params = [p.strip() for p in entry.split(";")]
+        if name == metric:
+            for param in params:
+                key, _, val = param.partition("=")
+                if key.strip() == "dur":
+                    try:
+                        return float(val.strip('" '))
+                    except ValueError:
+                        return None
+    return None
+
+
+class TraceStore(object):
+    """
+    Traces of commands awaiting a device response, keyed by correlation ID and device socket.
+    Bounded to the most recent traces, unanswered traces are dropped
+    """
+    def __init__(self, size: int = 10000):
+        """
+        :param size: max number of traces held
+        """
+        self._size = size
+        self._lock = threading.Lock()
+        self._traces: Dict[Tuple[str, str], dict] = OrderedDict()
+        # Correlation ID -> sockets holding a trace, in the order put
+        self._sockets: Dict[str, OrderedDict] = {}
+
+    def put(self, correlation_id: str, socket: str, trace: Optional[dict]) -> None:
+        if trace is None:
+            return
+        key = (str(correlation_id), socket)
+        with self._lock:
+            self._traces[key] = trace
+            sockets = self._sockets.setdefault(key[0], OrderedDict())
+            sockets.pop(socket, None)
+            sockets[socket] = None
+            while len(self._traces) > self._size:
+                old, _ = self._traces.popitem(last=False)
+                self._forget(old)
+
+    def pop(self, correlation_id: str, socket: str = None) -> Optional[dict]:
+        """
+        Remove the trace of a response, matched by socket or the most recent trace of the correlation ID
+        :param correlation_id: correlation ID of the response
+        :param socket: socket of the responding device
+        :return: trace context, None if not found
+        """
+        correlation_id = str(correlation_id)
+        with self._lock:
+            key = (correlation_id, socket)
+            if key not in self._traces:
+                sockets = self._sockets.get(correlation_id)
+                if not sockets:
+                    return None
+                key = (correlation_id, next(reversed(sockets)))
+            self._forget(key)
+            return self._traces.pop(key, None)
+
+    def _forget(self, key: Tuple[str, str]) -> None:
+        # The sockets left for the correlation ID are the fallback of later responses, must be called holding the lock
+        sockets = self._sockets.get(key[0])
+        if sockets is not None:
+            sockets.pop(key[1], None)
+            if not sockets:
+                del self._sockets[key[0]]
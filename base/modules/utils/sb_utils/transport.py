@@ -0,0 +1,394 @@
+"""
+transport.py
+Shared runtime for the orchestrator-side transports.
+Consumes commands from the internal buffer, sends them to each destination device and publishes responses back to the orchestrator.
+"""
+import collections
+import os
+import queue
+import re
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple, Union
+
+from .amqp_tools import Consumer, Producer, ThreadConsumer, make_consumer, make_producer, set_policy
+from .expiry import DEAD_LETTER_POLICY, EXPIRED_KEY, is_expired
+from .general import safe_cast
+from .local_bus import LocalConsumer, LocalProducer
+from .message import EncodeCache
+from .metrics import Metrics
+from .sharding import shard_routing_keys
+from .tracing import TraceStore, fork, get_trace, mark
+
+Payload = Union[bytes, str]
+
+
+class BatchPublisher(threading.Thread):
+    """
+    Publish messages to the orchestrator in batches over a shared producer
+    """
+    def __init__(self, producer: Union[Producer, LocalProducer], exchange: str = "orchestrator", routing_key: str = "response", batch_size: int = 100, interval: float = 0.05):
+        """
+        :param producer: producer to publish with
+        :param exchange: exchange to publish to
+        :param routing_key: routing key to publish to
+        :param batch_size: max number of messages in a batch
+        :param interval: max time, in seconds, to wait for a batch to fill
+        """
+        super().__init__(name="BatchPublisher", daemon=True)
+        self._producer = producer
+        self._exchange = exchange
+        self._routing_key = routing_key
+        self._batch_size = batch_size
+        self._interval = interval
+        self._queue = queue.Queue()
+
+    def put(self, message, headers: dict, routing_key: str = None) -> None:
+        """
+        Queue a message to publish
+        :param message: message to publish
+        :param headers: message headers
+        :param routing_key: routing key to publish to, default the routing key of the publisher
+        """
+        self._queue.put((message, headers, routing_key or self._routing_key))
+
+    def run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._interval
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            keys: Dict[str, list] = {}
+            for message, headers, routing_key in batch:
+                keys.setdefault(routing_key, []).append((message, headers))
+            for routing_key, messages in keys.items():
+                try:
+                    self._producer.publish_batch(messages, exchange=self._exchange, routing_key=routing_key)
+                except Exception as e:  # pylint: disable=broad-except
+                    print(f"Failed to publish {len(messages)} {routing_key} messages: {e}")
+
+
+class TransportRuntime(object):
+    """
+    Base orchestrator-side transport.
+    The runtime owns the consumer, a pooled response publisher, per-destination concurrency limits and metrics,
+    commands are parsed once and encoded once per encoding for all of their destinations.
+    Subclasses implement `send` to deliver a command to a device and optionally `receive` to listen for device responses
+    """
+    HOST = os.environ.get("QUEUE_HOST", "localhost")
+    PORT = os.environ.get("QUEUE_PORT", 5672)
+
+    # Name of the transport, used as the routing key of the commands to consume
+    name: str = ""
+    # Keys each destination must specify
+    required_keys = frozenset({"encoding", "profile", "socket"})
+    # Send commands encoded as bytes, otherwise as str
+    binary_payload: bool = True
+
+    def __init__(self, host: str = HOST, port: int = PORT, url: str = None, max_workers: int = None, max_per_destination: int = None, metrics_interval: float = None, debug: bool = None,
+                 shards: int = None, replica: int = None, replicas: int = None, ordered: bool = None):
+        """
+        :param host: host running RabbitMQ
+        :param port: port which handles AMQP (default 5672)
+        :param url: broker URL, overrides the host and port, default `QUEUE_URL` - Ex) redis://localhost:6379/0, local://
+        :param max_workers: max number of concurrent sends, default `TRANSPORT_MAX_WORKERS` or 32
+        :param max_per_destination: max number of concurrent sends to a single device, default `TRANSPORT_MAX_PER_DESTINATION` or 4
+        :param metrics_interval: time, in seconds, between metrics reports, default `TRANSPORT_METRICS_INTERVAL` or 0 (disabled)
+        :param debug: print debugging messages, default `TRANSPORT_DEBUG` or false
+        :param shards: number of shards the orchestrator publishes the commands of the transport to, default `TRANSPORT_SHARDS` or 1
+        :param replica: index of this replica of the transport, default `TRANSPORT_REPLICA` or 0
+        :param replicas: number of replicas of the transport sharing the shards, default `TRANSPORT_REPLICAS` or 1
+        :param ordered: send to each device one command at a time in the order consumed, default `TRANSPORT_ORDERED` or when sharded
+        """
+        self._host = host
+        self._port = port
+        self._url = url
+        self._max_workers = max_workers or safe_cast(os.environ.get("TRANSPORT_MAX_WORKERS", 32), int, 32)
+        self._max_per_destination = max_per_destination or safe_cast(os.environ.get("TRANSPORT_MAX_PER_DESTINATION", 4), int, 4)
+        self._metrics_interval = metrics_interval if metrics_interval is not None else safe_cast(os.environ.get("TRANSPORT_METRICS_INTERVAL", 0), float, 0)
+        self._debug = debug if debug is not None else os.environ.get("TRANSPORT_DEBUG", "").lower() in ("1", "true", "yes")
+        self._shards = shards or safe_cast(os.environ.get("TRANSPORT_SHARDS", 1), int, 1)
+        self._replica = replica if replica is not None else safe_cast(os.environ.get("TRANSPORT_REPLICA", 0), int, 0)
+        self._replicas = replicas or safe_cast(os.environ.get("TRANSPORT_REPLICAS", 1), int, 1)
+        if ordered is None:
+            ordered = os.environ.get("TRANSPORT_ORDERED", str(self._shards > 1)).lower() in ("1", "true", "yes")
+        self._ordered = ordered
+
+        self.metrics = Metrics(self.name.upper())
+        self._consumer = None
+        self._executor = None
+        self._publisher = None
+        self._lock = threading.Lock()
+        self._limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._pending: Dict[str, collections.deque] = {}
+        # Traces of sent commands, attached to the device response
+        self.traces = TraceStore()
+
+    # Lifecycle
+    def start(self) -> Union[Consumer, ThreadConsumer, LocalConsumer]:
+        """
+        Start consuming commands from the internal buffer, the consumer runs as a separate process unless the broker is in-process
+        :return: command consumer
+        """
+        if self._consumer is None:
+            # Commands that expire in the queues of the transport, sharded or not, are returned to the orchestrator
+            set_policy(f"{self.name}-expired", rf"^{re.escape(self.name)}(\.\d+)?$", DEAD_LETTER_POLICY, url=self._url, host=self._host, port=self._port)
+            self._consumer = make_consumer(
+                url=self._url,
+                host=self._host,
+                port=self._port,
+                exchange="transport",
+                routing_key=self.routing_keys,
+                callbacks=[self.process],
+                debug=self._debug
+            )
+        return self._consumer
+
+    def run(self) -> None:
+        """
+        Start consuming commands and receiving responses, blocks until the transport is shutdown
+        """
+        print("Connecting to message broker...")
+        self.start()
+        try:
+            self.receive()
+            self._consumer.join()
+        except KeyboardInterrupt:
+            self.shutdown()
+
+    @property
+    def routing_keys(self) -> List[str]:
+        """
+        Routing keys of the commands consumed by this replica of the transport
+        :return: routing keys, the transport name if not sharded
+        """
+        return shard_routing_keys(self.name, self._shards, self._replica, self._replicas)
+
+    def shutdown(self) -> None:
+        """
+        Stop consuming commands
+        """
+        if self._consumer is not None:
+            self._consumer.shutdown()
+
+    def _setup(self) -> None:
+        """
+        Create the worker pool and response publisher, called lazily from the process they are used in
+        """
+        with self._lock:
+            if self._publisher is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix=f"{self.name}Send")
+                self._publisher = BatchPublisher(make_producer(self._url, self._host, self._port), interval=0)
+                self._publisher.start()
+                if self._metrics_interval > 0:
+                    self.metrics.reporter(self._metrics_interval)
+
+    # Protocol specific
+    def send(self, device: dict, profile: str, payload: Payload, headers: dict) -> None:
+        """
+        Send an encoded command to an actuator of a device, raising an exception sends an error response for the command
+        :param device: destination device from the message headers
+        :param profile: actuator profile to send to
+        :param payload: command encoded with the device encoding
+        :param headers: headers of the AMQP message
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not implement send")
+
+    def receive(self) -> None:
+        """
+        Receive responses from devices, blocks while receiving if the protocol has a separate listener
+        """
+
+    def targets(self, device: dict) -> List[str]:
+        """
+        Actuator profiles of a device that a command is sent to, each is sent separately
+        :param device: destination device from the message headers
+        :return: profiles to send to
+        """
+        return device.get("profile", [])
+
+    # Command handling
+    def process(self, body, message) -> None:
+        """
+        AMQP Callback when we receive a message from internal buffer to be sent
+        :param body: Contains the message to be sent.
+        :param message: Contains data about the message as well as headers
+        """
+        received = time.time()
+        self._setup()
+        self.metrics.incr("commands")
+        headers = dict(message.headers)
+        trace = mark(get_trace(headers), "transport_received", received)
+        if is_expired(headers, received):
+            self.expire(body, headers)
+            return
+
+        payloads = EncodeCache(body, "json")
+        try:
+            cmd = payloads.message
+        except ValueError as e:
+            self.send_error(f"Cannot parse command - {e}", headers)
+            return
+
+        destinations = []
+        for device in headers.get("destination", []):
+            missing = self.required_keys.difference(k for k, v in device.items() if v)
+            if missing:
+                self.send_error(f"Missing required header data to successfully transport message - {', '.join(sorted(missing))}", dict(headers, destination=[device]))
+                continue
+
+            try:
+                payload = payloads.encode_bytes(device["encoding"]) if self.binary_payload else payloads.encode(device["encoding"])
+            except (KeyError, ReferenceError, TypeError, ValueError) as e:
+                self.send_error(f"Cannot encode command as {device['encoding']} - {e}", dict(headers, destination=[device]))
+                continue
+            destinations.append((device, payload))
+
+        mark(trace, "transport_encoded")
+        self.dispatch(cmd, headers, destinations)
+
+    def dispatch(self, cmd: dict, headers: dict, destinations: List[Tuple[dict, Payload]]) -> None:
+        """
+        Send a command to its destinations concurrently, without waiting for the devices
+        :param cmd: OpenC2 command
+        :param headers: headers of the AMQP message
+        :param destinations: destination device, encoded command pairs
+        """
+        for device, payload in destinations:
+            for profile in self.targets(device):
+                if self._ordered:
+                    self._enqueue(device["socket"], (device, profile, payload, headers))
+                else:
+                    self._executor.submit(self._deliver, device, profile, payload, headers)
+
+    def _enqueue(self, destination: str, send: tuple) -> None:
+        """
+        Queue a send to a destination, sends to the same destination run one at a time in order
+        :param destination: socket of the destination device
+        :param send: _deliver args
+        """
+        with self._lock:
+            pending = self._pending.get(destination)
+            if pending is not None:
+                pending.append(send)
+                return
+            self._pending[destination] = collections.deque([send])
+        self._executor.submit(self._drain, destination)
+
+    def _drain(self, destination: str) -> None:
+        while True:
+            with self._lock:
+                pending = self._pending[destination]
+                if not pending:
+                    del self._pending[destination]
+                    return
+                send = pending.popleft()
+            self._deliver(*send)
+
+    def _deliver(self, device: dict, profile: str, payload: Payload, headers: dict) -> None:
+        if self.drop_expired(headers, [device]):
+            return
+        with self.limit(device["socket"]):
+            self.metrics.incr("inflight")
+            correlation_id = headers.get("source", {}).get("correlationID", "")
+            self.trace_sent(correlation_id, device["socket"], headers)
+            try:
+                with self.metrics.time("send"):
+                    self.send(device, profile, payload, headers)
+                self.metrics.incr("sent")
+            except Exception as e:  # pylint: disable=broad-except
+                self.metrics.incr("errors")
+                self.send_failed(f"{self.name.upper()} error sending to {profile}@{device['socket']} - {getattr(e, 'message', str(e)) or e.__class__.__name__}", device, headers)
+            finally:
+                self.metrics.incr("inflight", -1)
+
+    def drop_expired(self, headers: dict, devices: List[dict]) -> bool:
+        """
+        Expire a command for its devices if its deadline passed while waiting to be sent
+        :param headers: headers of the AMQP message
+        :param devices: destination devices the command is about to be sent to
+        :return: command expired, not to be sent
+        """
+        if not is_expired(headers):
+            return False
+        # The encoded command is not returned as it may be binary
+        self.expire("", dict(headers, destination=devices))
+        return True
+
+    def send_failed(self, err: str, device: dict, headers: dict) -> None:
+        """
+        Send an error for a device the command could not be sent to, with the trace recorded when the send started
+        :param err: error message
+        :param device: destination device
+        :param headers: headers of the AMQP message
+        """
+        trace = self.traces.pop(headers.get("source", {}).get("correlationID", ""), device["socket"])
+        # The error is for this device only, the orchestrator frees its in-flight slot
+        err_headers = dict(headers, destination=[device])
+        self.send_error(err, dict(err_headers, trace=trace) if trace is not None else err_headers)
+
+    def limit(self, destination: str) -> threading.BoundedSemaphore:
+        """
+        Concurrency limit of a destination
+        :param destination: socket of the destination device
+        :return: semaphore limiting the concurrent sends to the destination
+        """
+        with self._lock:
+            if destination not in self._limits:
+                self._limits[destination] = threading.BoundedSemaphore(self._max_per_destination)
+            return self._limits[destination]
+
+    def trace_sent(self, correlation_id: str, socket: str, headers: dict) -> None:
+        """
+        Record a command being sent to a device, the trace is attached to the response of the device
+        :param correlation_id: correlation ID the device responds with
+        :param socket: socket of the device
+        :param headers: headers of the AMQP message
+        """
+        self.traces.put(correlation_id, socket, mark(fork(get_trace(headers)), "transport_sent"))
+
+    # Responses
+    def respond(self, message, headers: dict) -> None:
+        """
+        Publish a response to the orchestrator, the trace of the command is attached if the command was traced
+        :param message: response to publish
+        :param headers: response headers
+        """
+        responded = time.time()
+        self._setup()
+        self.metrics.incr("errors_reported" if headers.get("error") else "responses")
+
+        trace = headers.get("trace") or self.traces.pop(headers.get("correlationID", ""), headers.get("socket"))
+        if trace is None and headers.get("error"):
+            trace = fork(get_trace(headers))
+        if trace is not None:
+            headers = dict(headers, trace=mark(trace, "transport_responded", responded))
+        else:
+            # Untraced commands are sent without a trace, rather than a null one
+            headers = {k: v for k, v in headers.items() if k != "trace"}
+        self._publisher.put(message, headers)
+
+    def expire(self, message, headers: dict) -> None:
+        """
+        Drop a command past its deadline, it is returned to the orchestrator to be recorded as expired
+        :param message: command, as consumed
+        :param headers: headers of the AMQP message, limited to the destinations the command expired for
+        """
+        self._setup()
+        self.metrics.incr("expired")
+        self._publisher.put(message, headers, EXPIRED_KEY)
+
+    def send_error(self, err: str, headers: dict) -> None:
+        """
+        Send an error back to the orchestrator for the command
+        :param err: error message
+        :param headers: headers of the AMQP message, limited to the destinations the error is for
+        """
+        print(f"Error: {err}")
+        self.respond(err, dict(headers, error=True))
@@ -11,6 +11,8 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 
 # Local imports
+from command.archive import archived_command
+from command.filters import HistoryFilter
 from command.models import SentHistory, HistorySerializer
 from utils import get_or_none, IsAdminOrIsSelf, OrcSchema
 from ..models import UserSerializer, PasswordSerializer
@@ -55,7 +57,10 @@ class UserHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = HistorySerializer
     lookup_field = 'command_id'
 
-    queryset = SentHistory.objects.order_by('-received_on')
+    queryset = HistorySerializer.setup_eager_loading(SentHistory.objects.order_by('-received_on'))
+    # Keyset pagination with `?cursor=`, newest first
+    cursor_ordering = ('-received_on', '-pk')
+    filter_backends = (*viewsets.ReadOnlyModelViewSet.filter_backends, HistoryFilter)
 
     schema = OrcSchema(
         manual_fields=[
@@ -105,11 +110,18 @@ class UserHistoryViewSet(viewsets.ReadOnlyModelViewSet):
         """
         Return a specific user's command
         """
-        username = kwargs.get('username', None)
-        instance = self.get_object()
+        username = bleach.clean(kwargs.get('username', None))
+        try:
+            instance = self.get_object()
+        except Http404:
+            archived = archived_command(kwargs.get(self.lookup_field))
+            if archived is None or archived[0].user.username != username:
+                raise
+            if not request.user.is_staff and request.user.username != username:
+                raise PermissionDenied
+            return Response(archived[1])
 
         if not request.user.is_staff:  # Standard User
-            username = bleach.clean(username)
             if request.user.username != username or request.user != instance.user:
                 raise PermissionDenied
 
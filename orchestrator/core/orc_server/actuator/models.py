@@ -1,9 +1,11 @@
 import uuid
 
+from typing import Iterable, Tuple
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
 from django.dispatch import receiver
 from drf_queryfields import QueryFieldsMixin
 from jsonfield import JSONField
@@ -12,7 +14,7 @@ from rest_framework.exceptions import ValidationError
 
 # Local imports
 from device.models import Device, DeviceSerializer
-from utils import prefixUUID
+from utils import invalidate_responses, prefixUUID
 
 
 def defaultName():
@@ -143,29 +145,39 @@ class ActuatorProfile(AbstractGroup):
         verbose_name_plural = 'profiles'
 
 
-@receiver(pre_save, sender=Actuator)
-def actuator_pre_save(sender, instance=None, **kwargs):
+def schema_profile(schema: dict, schema_format: str = 'jadn') -> Tuple[str, str]:
     """
-    Set the profile name base on the actuators schema
-    :param sender: model "sending" the action - Actuator
-    :param instance: SENDER instance
-    :param kwargs: key/value args
-    :return: None
+    Get the format and profile name of an actuator schema
+    :param schema: schema of the actuator
+    :param schema_format: format if the schema is not a dict
+    :return: schema format, profile name
     """
     profile = 'None'
-    schema_keys = set(instance.schema.keys())
+    schema_keys = set(schema.keys())
 
-    if isinstance(instance.schema, dict):
+    if isinstance(schema, dict):
         if len(schema_keys - {"meta", "types"}) == 0:  # JADN
-            instance.schema_format = 'jadn'
-            profile = instance.schema.get('meta', {}).get('title', '').replace(' ', '_')
+            schema_format = 'jadn'
+            profile = schema.get('meta', {}).get('title', '').replace(' ', '_')
             profile = 'None' if profile in ('', ' ', None) else profile
         else:  # JSON
-            instance.schema_format = 'json'
-            profile = instance.schema.get('title', '').replace(' ', '_')
+            schema_format = 'json'
+            profile = schema.get('title', '').replace(' ', '_')
             profile = 'None' if profile in ('', ' ', None) else profile
 
-    instance.profile = profile
+    return schema_format, profile
+
+
+@receiver(pre_save, sender=Actuator)
+def actuator_pre_save(sender, instance=None, **kwargs):
+    """
+    Set the profile name base on the actuators schema
+    :param sender: model "sending" the action - Actuator
+    :param instance: SENDER instance
+    :param kwargs: key/value args
+    :return: None
+    """
+    instance.schema_format, instance.profile = schema_profile(instance.schema, instance.schema_format)
 
 
 @receiver(post_save, sender=Actuator)
@@ -198,6 +210,39 @@ def actuator_post_save(sender, instance=None, **kwargs):
             pass
 
 
+def add_profiles(actuators: Iterable[Actuator], batch_size: int = 1000) -> None:
+    """
+    Add actuators saved without their model signals, such as by a bulk create, to the groups of their profiles
+    :param actuators: saved actuators, not in a profile group
+    :param batch_size: max number of group memberships created at a time
+    :return: None
+    """
+    actuators = list(actuators)
+    names = {act.profile.replace('_', ' ') for act in actuators}
+    ActuatorProfile.objects.bulk_create([ActuatorProfile(name=name) for name in names], ignore_conflicts=True)
+    profiles = dict(ActuatorProfile.objects.filter(name__in=names).values_list('name', 'pk'))
+
+    through = ActuatorProfile.actuators.through
+    through.objects.bulk_create([
+        through(actuatorprofile_id=profiles[act.profile.replace('_', ' ')], actuator_id=act.pk) for act in actuators
+    ], batch_size=batch_size)
+
+
+@receiver([post_save, post_delete], sender=Actuator)
+@receiver([post_save, post_delete], sender=ActuatorGroup)
+@receiver(m2m_changed, sender=ActuatorGroup.users.through)
+@receiver(m2m_changed, sender=ActuatorGroup.actuators.through)
+def actuator_changed(sender, **kwargs):
+    """
+    Invalidate the cached actuator responses, the groups set which users can see an actuator profile
+    :param sender: model "sending" the action - Actuator, ActuatorGroup or its relations
+    :param kwargs: key/value args
+    :return: None
+    """
+    if kwargs.get("action", "post_").startswith("post_"):
+        invalidate_responses("actuator")
+
+
 class ActuatorSerializer(QueryFieldsMixin, serializers.ModelSerializer):
     """
     Actuator API Serializer
@@ -6,6 +6,8 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
+# Local imports
+from utils import cached_response
 from ..models import Actuator, ActuatorGroup, ActuatorSerializer
 
 
@@ -20,6 +22,8 @@ class ActuatorViewSet(viewsets.ModelViewSet):
     queryset = Actuator.objects.order_by('name')
     filter_backends = (filters.OrderingFilter,)
     ordering_fields = ('actuator_id', 'name', 'profile', 'type')
+    # Keyset pagination with `?cursor=`
+    cursor_ordering = ('name', 'pk')
 
     permissions = {
         'create':  (IsAdminUser,),
@@ -35,6 +39,7 @@ class ActuatorViewSet(viewsets.ModelViewSet):
         """
         return [permission() for permission in self.permissions.get(self.action, self.permission_classes)]
 
+    @cached_response('actuator', 'device')
     def list(self, request, *args, **kwargs):
         """
         Return a list of all actuators that the user has permissions for
@@ -60,6 +65,7 @@ class ActuatorViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @cached_response('actuator', 'device')
     def retrieve(self, request, *args, **kwargs):
         """
         Return a specific actuators that the user has permissions for
@@ -100,7 +106,8 @@ class ActuatorViewSet(viewsets.ModelViewSet):
             'refresh': refresh
         })
 
-    @action(methods=['GET'], detail=False)
+    @action(methods=['GET'], detail=True)
+    @cached_response('actuator')
     def profile(self, request, *args, **kwargs):
         """
         API endpoint that allows for Actuator profile retrieval
@@ -108,7 +115,7 @@ class ActuatorViewSet(viewsets.ModelViewSet):
         actuator = self.get_object()
 
         if not request.user.is_staff:  # Standard User
-            actuator_groups = [g.name for g in ActuatorGroup.objects.filter(actuator=actuator).filter(users__in=[request.user])]
+            actuator_groups = [g.name for g in ActuatorGroup.objects.filter(actuators=actuator).filter(users__in=[request.user])]
 
             if len(actuator_groups) == 0:
                 raise PermissionDenied(detail='User not authorised to access actuator', code=401)
@@ -127,12 +134,12 @@ class ActuatorViewSet(viewsets.ModelViewSet):
         actuator = self.get_object()
 
         if not request.user.is_staff:  # Standard User
-            actuator_groups = [g.name for g in ActuatorGroup.objects.filter(actuator=actuator).filter(users__in=[request.user])]
+            actuator_groups = [g.name for g in ActuatorGroup.objects.filter(actuators=actuator).filter(users__in=[request.user])]
 
             if len(actuator_groups) == 0:
                 raise PermissionDenied(detail='User not authorised to access actuator', code=401)
 
-        group_users = [[u.username for u in ag.users.all()] for ag in ActuatorGroup.objects.filter(actuator=actuator)]
+        group_users = [[u.username for u in ag.users.all()] for ag in ActuatorGroup.objects.filter(actuators=actuator)]
 
         rtn = {
             'users': sum(group_users, [])
@@ -0,0 +1,273 @@
+"""
+Bulk import of devices and actuators, rows are validated in batches and written with bulk inserts in one transaction.
+Bulk inserts do not send the model signals, their side effects (actuator profile groups, cached responses, the Elasticsearch mirror) are applied once per import
+"""
+import json
+import uuid
+
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+# Local imports
+from actuator.models import Actuator, add_profiles, defaultName as actuatorName, schema_profile
+from device.models import Device, Transport, defaultName as deviceName, shortID
+from es_mirror.apps import ES_Hooks
+from orchestrator.reference import REFERENCE
+from utils import invalidate_responses, safe_cast
+
+BATCH_SIZE = 1000
+
+
+def _batches(items: list, size: int = BATCH_SIZE) -> Iterator[list]:
+    for idx in range(0, len(items), size):
+        yield items[idx:idx + size]
+
+
+def _keys(queryset, field: str, values: Iterable) -> dict:
+    """
+    Primary keys of the rows with the given values of a unique field, queried in batches
+    :param queryset: rows to search
+    :param field: unique field
+    :param values: values of the field
+    :return: value -> primary key
+    """
+    keys = {}
+    for batch in _batches(list(values)):
+        keys.update(queryset.filter(**{f'{field}__in': batch}).values_list(field, 'pk'))
+    return keys
+
+
+def _instances(queryset, pks: List[int]) -> Iterator:
+    for batch in _batches(pks):
+        yield from queryset.filter(pk__in=batch)
+
+
+def _as_list(value) -> list:
+    if value in (None, ''):
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _uuid(row: dict, errors: dict, field: str) -> Optional[uuid.UUID]:
+    value = row.get(field)
+    if value in (None, ''):
+        return uuid.uuid4()
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        errors[field] = ['Must be a valid UUID.']
+    return None
+
+
+def _string(row: dict, errors: dict, field: str, max_length: Optional[int], default: Union[str, Callable] = '') -> str:
+    value = row.get(field)
+    if value is None:
+        value = default() if callable(default) else default
+    value = str(value)
+    if max_length and len(value) > max_length:
+        errors[field] = [f'Ensure this field has no more than {max_length} characters.']
+    return value
+
+
+def _number(row: dict, errors: dict, field: str, cast: type, min_value=None, max_value=None, default=None):
+    value = row.get(field)
+    if value in (None, ''):
+        return default
+    num = safe_cast(value, cast)
+    if num is None or (min_value is not None and num < min_value) or (max_value is not None and num > max_value):
+        errors[field] = [f'A valid {cast.__name__} between {min_value} and {max_value if max_value is not None else "-"} is required.']
+    return num
+
+
+def _unique(errors: List[dict], values: list, field: str, existing: set) -> None:
+    """
+    Flag the rows with a value of a unique field that is repeated in the import or already exists
+    :param errors: errors of each row
+    :param values: value of each row, None if invalid
+    :param field: unique field
+    :param existing: values that already exist
+    """
+    seen = set()
+    for err, value in zip(errors, values):
+        if value is None:
+            continue
+        if value in existing:
+            err[field] = [f'{field} with this value already exists.']
+        elif value in seen:
+            err[field] = [f'{field} is repeated in the import.']
+        seen.add(value)
+
+
+def import_devices(rows: List[dict]) -> int:
+    """
+    Import devices with their transports
+    :param rows: serialized devices, as exported
+    :return: number of devices imported
+    :raise ValidationError: a row is invalid, errors are listed per row
+    """
+    protocols = {p.name: p for p in REFERENCE.protocols}
+    serializations = {s.name: s.pk for s in REFERENCE.serializations}
+    errors: List[dict] = []
+    devices: List[Device] = []
+    # Transport of each row, with the row and the serialization pks
+    transports = []
+
+    for idx, row in enumerate(rows):
+        err = {}
+        errors.append(err)
+        if not isinstance(row, dict):
+            err['non_field_errors'] = ['Invalid data. Expected a dictionary.']
+            devices.append(None)
+            continue
+
+        devices.append(Device(
+            device_id=_uuid(row, err, 'device_id'),
+            name=_string(row, err, 'name', 30, deviceName),
+            note=_string(row, err, 'note', None),
+            rate_limit=_number(row, err, 'rate_limit', float, 0),
+            rate_burst=_number(row, err, 'rate_burst', int, 0),
+            max_in_flight=_number(row, err, 'max_in_flight', int, 0)
+        ))
+
+        trans_errors = []
+        for trans in _as_list(row.get('transport')):
+            t_err = {}
+            trans_errors.append(t_err)
+            if not isinstance(trans, dict):
+                t_err['non_field_errors'] = ['Invalid data. Expected a dictionary.']
+                continue
+
+            proto = protocols.get(str(trans.get('protocol')))
+            if proto is None:
+                t_err['protocol'] = [f'Object with name={trans.get("protocol")} does not exist.']
+            serials = [serializations.get(str(name)) for name in _as_list(trans.get('serialization'))]
+            if None in serials:
+                t_err['serialization'] = ['Object with name does not exist.']
+
+            transports.append((idx, proto, serials, Transport(
+                transport_id=shortID(),
+                host=_string(trans, t_err, 'host', 60, '127.0.0.1'),
+                port=_number(trans, t_err, 'port', int, 1, 65535, 8080),
+                protocol_id=getattr(proto, 'pk', None),
+                topic=_string(trans, t_err, 'topic', 30, 'topic'),
+                channel=_string(trans, t_err, 'channel', 30, 'channel'),
+                group=_string(trans, t_err, 'group', 60, '')
+            )))
+        if not trans_errors:
+            err['transport'] = ['This field is required.']
+        elif any(trans_errors):
+            err['transport'] = trans_errors
+
+    device_ids = [getattr(dev, 'device_id', None) for dev in devices]
+    names = [getattr(dev, 'name', None) for dev in devices]
+    _unique(errors, device_ids, 'device_id', set(_keys(Device.objects, 'device_id', filter(None, device_ids))))
+    _unique(errors, names, 'name', set(_keys(Device.objects, 'name', filter(None, names))))
+
+    # Host, port and protocol are unique unless the protocol is pub/sub
+    sockets = [(t.host, t.port, t.protocol_id) for _, proto, _, t in transports if proto and not proto.pub_sub]
+    existing = set()
+    for batch in _batches(sorted({host for host, _, _ in sockets})):
+        existing.update(Transport.objects.filter(protocol__pub_sub=False, host__in=batch).values_list('host', 'port', 'protocol_id'))
+    seen = set()
+    for idx, proto, _, trans in transports:
+        socket = (trans.host, trans.port, trans.protocol_id)
+        if proto and not proto.pub_sub and (socket in existing or socket in seen):
+            errors[idx]['transport'] = ['host, port, and protocol must make a unique pair unless a pub/sub protocol']
+        seen.add(socket)
+
+    if any(errors):
+        raise ValidationError(errors)
+
+    with transaction.atomic():
+        Device.objects.bulk_create(devices, batch_size=BATCH_SIZE)
+        Transport.objects.bulk_create([t for _, _, _, t in transports], batch_size=BATCH_SIZE)
+        # Bulk created rows do not get their keys on MySQL, they are looked up by their unique IDs
+        device_pks = _keys(Device.objects, 'device_id', device_ids)
+        transport_pks = _keys(Transport.objects, 'transport_id', [t.transport_id for _, _, _, t in transports])
+
+        DeviceTransport = Device.transport.through
+        DeviceTransport.objects.bulk_create([
+            DeviceTransport(device_id=device_pks[device_ids[idx]], transport_id=transport_pks[t.transport_id]) for idx, _, _, t in transports
+        ], batch_size=BATCH_SIZE)
+        TransportSerialization = Transport.serialization.through
+        TransportSerialization.objects.bulk_create([
+            TransportSerialization(transport_id=transport_pks[t.transport_id], serialization_id=pk) for _, _, serials, t in transports for pk in serials
+        ], batch_size=BATCH_SIZE)
+
+        invalidate_responses('device')
+        pks = list(device_pks.values())
+        transaction.on_commit(lambda: ES_Hooks.bulk_save(Device, _instances(Device.objects, pks)))
+    return len(devices)
+
+
+def import_actuators(rows: List[dict]) -> int:
+    """
+    Import actuators, added to the groups of their profiles
+    :param rows: serialized actuators, as exported
+    :return: number of actuators imported
+    :raise ValidationError: a row is invalid, errors are listed per row
+    """
+    errors: List[dict] = []
+    actuators: List[Actuator] = []
+    devices: Dict[int, uuid.UUID] = {}
+
+    for idx, row in enumerate(rows):
+        err = {}
+        errors.append(err)
+        if not isinstance(row, dict):
+            err['non_field_errors'] = ['Invalid data. Expected a dictionary.']
+            actuators.append(None)
+            continue
+
+        schema = row.get('schema')
+        if isinstance(schema, str):
+            try:
+                schema = json.loads(schema)
+            except ValueError:
+                schema = None
+        if not isinstance(schema, dict):
+            err['schema'] = ['Value must be valid JSON.']
+            schema = {}
+
+        if row.get('device') not in (None, ''):
+            devices[idx] = _uuid(row, err, 'device')
+
+        act = Actuator(
+            actuator_id=_uuid(row, err, 'actuator_id'),
+            name=_string(row, err, 'name', 30, actuatorName),
+            schema=schema
+        )
+        act.schema_format, act.profile = schema_profile(schema)
+        if len(act.profile) > 60:
+            err['schema'] = ['Ensure the profile of the schema has no more than 60 characters.']
+        actuators.append(act)
+
+    device_pks = _keys(Device.objects, 'device_id', filter(None, devices.values()))
+    for idx, device_id in devices.items():
+        if device_id is not None and device_id not in device_pks:
+            errors[idx]['device'] = [f'Object with device_id={device_id} does not exist.']
+        elif actuators[idx] is not None:
+            actuators[idx].device_id = device_pks.get(device_id)
+
+    actuator_ids = [getattr(act, 'actuator_id', None) for act in actuators]
+    names = [getattr(act, 'name', None) for act in actuators]
+    _unique(errors, actuator_ids, 'actuator_id', set(_keys(Actuator.objects, 'actuator_id', filter(None, actuator_ids))))
+    _unique(errors, names, 'name', set(_keys(Actuator.objects, 'name', filter(None, names))))
+
+    if any(errors):
+        raise ValidationError(errors)
+
+    with transaction.atomic():
+        Actuator.objects.bulk_create(actuators, batch_size=BATCH_SIZE)
+        # Bulk created rows do not get their keys on MySQL, they are looked up by their unique IDs
+        actuator_pks = _keys(Actuator.objects, 'actuator_id', actuator_ids)
+        for act in actuators:
+            act.pk = actuator_pks[act.actuator_id]
+        add_profiles(actuators, BATCH_SIZE)
+
+        invalidate_responses('actuator')
+        pks = list(actuator_pks.values())
+        transaction.on_commit(lambda: ES_Hooks.bulk_save(Actuator, _instances(Actuator.objects, pks)))
+    return len(actuators)
@@ -6,6 +6,7 @@ from . import views
 router = routers.ImportExportRouter()
 router.register('actuator', views.ActuatorImportExport)
 router.register('device', views.DeviceImportExport)
+router.register('history', views.HistoryExport)
 
 
 urlpatterns = [
@@ -4,12 +4,20 @@ from rest_framework_msgpack.renderers import MessagePackRenderer
 from rest_framework_xml.parsers import XMLParser
 from rest_framework_xml.renderers import XMLRenderer
 
+from .stream import CSVRenderer, MessagePackStreamRenderer, NDJSONRenderer, StreamRenderer, serialized_rows, stream_response
 from .xls import XLSParser, XLSRenderer
 
 __all__ = [
     # MsgPack
     'MessagePackParser',
     'MessagePackRenderer',
+    # Stream
+    'CSVRenderer',
+    'MessagePackStreamRenderer',
+    'NDJSONRenderer',
+    'StreamRenderer',
+    'serialized_rows',
+    'stream_response',
     # XLS
     'XLSParser',
     'XLSRenderer',
@@ -0,0 +1,167 @@
+"""
+Streamed export formats, rows are serialized and encoded a chunk at a time as the response is sent, so the memory used does not grow with the number of rows
+"""
+import csv
+import io
+import json
+import uuid
+import zlib
+
+from typing import Iterable, Iterator, Type
+
+import msgpack
+
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+from rest_framework.serializers import Serializer
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_msgpack.renderers import MessagePackEncoder
+
+# Local imports
+from utils.pagination import keyset_after
+from .xls import simpleType
+
+
+class StreamRenderer(BaseRenderer):
+    """
+    Renderer of a format written one row at a time, `render` encodes all the data at once for the responses that are not streamed
+    """
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return b''.join(self.stream(data if isinstance(data, list) else [data]))
+
+    def stream(self, rows: Iterable[dict]) -> Iterator[bytes]:
+        """
+        Encode rows
+        :param rows: serialized rows
+        :return: encoded rows
+        """
+        raise NotImplementedError('StreamRenderer.stream must be implemented')
+
+
+class NDJSONRenderer(StreamRenderer):
+    """
+    Newline delimited JSON, one row per line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def stream(self, rows):
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        for row in rows:
+            yield (encoder.encode(row) + '\n').encode('utf-8')
+
+
+class CSVRenderer(StreamRenderer):
+    """
+    CSV with a header of the fields of the first row, nested values are JSON as in the XLS format
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        headers = None
+        for row in rows:
+            row = dict(row)
+            if headers is None:
+                headers = list(row.keys())
+                writer.writerow(headers)
+            writer.writerow([simpleType(row.get(h, '')) for h in headers])
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+
+class MessagePackStreamRenderer(StreamRenderer):
+    """
+    MessagePack objects one after another, one per row, read with `msgpack.Unpacker`
+    """
+    media_type = 'application/x-msgpack-stream'
+    format = 'msgpack-stream'
+
+    def stream(self, rows):
+        packer = msgpack.Packer(default=self._encode)
+        for row in rows:
+            yield packer.pack(row)
+
+    @staticmethod
+    def _encode(obj):
+        # Related UUID fields are not converted to strings by the serializers
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        return MessagePackEncoder().encode(obj)
+
+
+def serialized_rows(queryset: QuerySet, serializer_class: Type[Serializer], context: dict, chunk_size: int = 2000) -> Iterator[dict]:
+    """
+    Serialize the rows of a queryset a chunk at a time, in the ordering of the queryset with the primary key as the tiebreaker.
+    Each chunk is its own query continuing after the last row of the previous chunk (keyset), as drivers without server side cursors buffer a whole result.
+    The related objects the queryset prefetches are loaded for each chunk
+    :param queryset: rows to serialize, ordered by fields of the model
+    :param serializer_class: serializer of the rows
+    :param context: serializer context
+    :param chunk_size: number of rows read and serialized at a time
+    :return: serialized rows
+    """
+    fields = list(queryset.query.order_by or queryset.model._meta.ordering)
+    pk = queryset.model._meta.pk.name
+    if not fields or fields[-1].lstrip('-') not in ('pk', pk):
+        fields.append('-pk' if fields and fields[-1].startswith('-') else 'pk')
+    queryset = queryset.order_by(*fields)
+
+    position = None
+    while True:
+        chunk = list((queryset if position is None else queryset.filter(keyset_after(fields, position)))[:chunk_size])
+        if not chunk:
+            break
+        yield from serializer_class(chunk, many=True, context=context).data
+        position = [getattr(chunk[-1], field.lstrip('-')) for field in fields]
+
+
+def _buffered(chunks: Iterable[bytes], size: int) -> Iterator[bytes]:
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+
+def _gzipped(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_response(rows: Iterable[dict], renderer: StreamRenderer, filename: str, gzip: bool = False, buffer_size: int = 64 * 1024) -> StreamingHttpResponse:
+    """
+    Stream rows as a file download
+    :param rows: serialized rows
+    :param renderer: renderer of the file format
+    :param filename: name of the file, without the extension
+    :param gzip: gzip the file
+    :param buffer_size: min size, in bytes, of the chunks sent
+    :return: streamed response
+    """
+    content = _buffered(renderer.stream(rows), buffer_size)
+    filename = f'{filename}.{renderer.format}'
+    content_type = renderer.media_type
+    if gzip:
+        content = _gzipped(content)
+        filename += '.gz'
+        content_type = 'application/gzip'
+
+    rtn = StreamingHttpResponse(content, content_type=content_type)
+    rtn['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return rtn
@@ -4,7 +4,8 @@ from .api import (
 
 from .import_export import (
     ActuatorImportExport,
-    DeviceImportExport
+    DeviceImportExport,
+    HistoryExport
 )
 
 __all__ = [
@@ -13,5 +14,6 @@ __all__ = [
     # APIViews
     # Import/Export
     'ActuatorImportExport',
-    'DeviceImportExport'
+    'DeviceImportExport',
+    'HistoryExport'
 ]
@@ -43,7 +43,11 @@ def backupRoot(request):
         "backupFormats": [
             "json",
             "xml",
-            "yaml"
+            "yaml",
+            # Streamed
+            "ndjson",
+            "csv",
+            "msgpack-stream"
         ],
         "models": backupModels
     })
@@ -1,18 +1,35 @@
 """
 Save and load data for the Orchestrator
 """
-from rest_framework import permissions
+import io
+
+from django.conf import settings
+from rest_framework import permissions, viewsets
+from rest_framework.exceptions import ParseError, ValidationError
 from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+from rest_framework.status import HTTP_201_CREATED
+from rest_framework_files.mixins import ExportMixin
 from rest_framework_files.viewsets import ImportExportModelViewSet
 
 # Local imports
 from actuator.models import Actuator, ActuatorSerializer
+from command.filters import HistoryFilter
+from command.models import HistorySerializer, SentHistory
 from device.models import Device, DeviceSerializer
+from ..bulk import import_actuators, import_devices
 from ..utils import (
     # MsgPack
     MessagePackParser,
     MessagePackRenderer,
+    # Stream
+    CSVRenderer,
+    MessagePackStreamRenderer,
+    NDJSONRenderer,
+    StreamRenderer,
+    serialized_rows,
+    stream_response,
     # XLS
     XLSParser,
     XLSRenderer,
@@ -26,12 +43,32 @@ from ..utils import (
 )
 
 
-class ImportExportBase(ImportExportModelViewSet):
+class StreamExportMixin(ExportMixin):
+    """
+    Download the rows streamed a chunk at a time with the stream formats, `?format=ndjson|csv|msgpack-stream`, gzipped with `?gzip=true`
+    """
+    stream_renderer_classes = (NDJSONRenderer, CSVRenderer, MessagePackStreamRenderer)
+
+    def download(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if not isinstance(renderer, StreamRenderer):
+            return super().download(request, *args, **kwargs)
+
+        opts = settings.EXPORT
+        queryset = self.filter_queryset(self.get_queryset())
+        rows = serialized_rows(queryset, self.get_serializer_class(), self.get_serializer_context(), opts['chunk_size'])
+        gzip = request.query_params.get('gzip', '').lower() in ('1', 'true')
+        return stream_response(rows, renderer, self.filename, gzip=gzip, buffer_size=opts['buffer_size'])
+
+
+class ImportExportBase(StreamExportMixin, ImportExportModelViewSet):
     permission_classes = (permissions.IsAdminUser,)
     parser_classes = (MultiPartParser,)
-    renderer_classes = (JSONRenderer, MessagePackRenderer, XLSRenderer, XMLRenderer)
+    renderer_classes = (JSONRenderer, MessagePackRenderer, XLSRenderer, XMLRenderer, *StreamExportMixin.stream_renderer_classes)
     file_content_parser_classes = (JSONParser, MessagePackParser, XLSParser, XMLParser)
     filename = 'Backup'
+    # Bulk import function, used for uploads with `?bulk=true`
+    bulk_import = None
 
     _removeActions = [
         "create",
@@ -46,14 +83,54 @@ class ImportExportBase(ImportExportModelViewSet):
         self.filename = self.__class__.__name__.replace("ImportExport", "") + "s"
         super().__init__(*args, **kwargs)
 
+    def upload(self, request, *args, **kwargs):
+        """
+        Import the file uploaded with the key `file`, with `?bulk=true` the rows are written with bulk inserts rather than one at a time
+        """
+        if self.bulk_import is None or request.query_params.get('bulk', '').lower() not in ('1', 'true'):
+            return super().upload(request, *args, **kwargs)
+
+        if 'file' not in request.data:
+            raise ValidationError({'file': ["Upload a file with the key 'file'"]})
+        content = b''.join(request.data['file'].chunks())
+
+        # try the parsers as the default upload does
+        for parser_cls in self.file_content_parser_classes:
+            try:
+                data = parser_cls().parse(io.BytesIO(content))
+                break
+            except (ParseError, ValidationError):
+                continue
+        else:
+            raise ParseError('Could not parse content of the file to any of the parsers provided.')
+
+        if not isinstance(data, list):
+            raise ValidationError({'non_field_errors': ['Expected a list of items.']})
+        return Response(data={'created': self.bulk_import(data)}, status=HTTP_201_CREATED)
+
 
 class ActuatorImportExport(ImportExportBase):
     lookup_field = 'actuator_id'
-    queryset = Actuator.objects.order_by('actuator_id')
+    queryset = Actuator.objects.order_by('actuator_id').select_related('device')
     serializer_class = ActuatorSerializer
+    bulk_import = staticmethod(import_actuators)
 
 
 class DeviceImportExport(ImportExportBase):
     lookup_field = 'device_id'
-    queryset = Device.objects.order_by('device_id')
+    queryset = Device.objects.order_by('device_id').prefetch_related('transport__protocol', 'transport__serialization')
     serializer_class = DeviceSerializer
+    bulk_import = staticmethod(import_devices)
+
+
+class HistoryExport(StreamExportMixin, viewsets.GenericViewSet):
+    """
+    Export of the command history, only streamed as it can be too large to hold in memory
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = StreamExportMixin.stream_renderer_classes
+    filter_backends = (HistoryFilter,)
+    queryset = HistorySerializer.setup_eager_loading(SentHistory.objects.order_by('-received_on'))
+    serializer_class = HistorySerializer
+    lookup_field = 'command_id'
+    filename = 'History'
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import SentHistory, ResponseHistory
+from utils import ReadOnlyModelAdmin
+from .models import ArchivedHistory, CommandOutbox, CommandStats, SentHistory, ResponseHistory
 
 
 class ResponseInline(admin.TabularInline):
@@ -15,9 +16,9 @@ class SentHistoryAdmin(admin.ModelAdmin):
     """
     Command Sent admin
     """
-    list_display = ('command_id', '_coap_id', 'user', 'received_on', 'command')
+    list_display = ('command_id', '_coap_id', 'user', 'received_on', 'expired_on', 'command')
     filter_horizontal = ('actuators', )
-    readonly_fields = ('received_on', 'actuators')
+    readonly_fields = ('received_on', 'actuators', 'expires_on', 'expired_on')
     inlines = [ResponseInline, ]
 
 
@@ -29,6 +30,33 @@ class ResponseHistoryAdmin(admin.ModelAdmin):
     readonly_fields = ('received_on', )
 
 
+class CommandOutboxAdmin(ReadOnlyModelAdmin):
+    """
+    Command Outbox admin
+    """
+    list_display = ('command', 'routing_key', 'created_on', 'sent_on', 'attempts', 'failed_on')
+    list_filter = ('routing_key', )
+
+
+class ArchivedHistoryAdmin(ReadOnlyModelAdmin):
+    """
+    Command Archive admin
+    """
+    list_display = ('command_id', 'user', 'received_on', 'archived_on', 'segment')
+    search_fields = ('command_id', )
+
+
+class CommandStatsAdmin(ReadOnlyModelAdmin):
+    """
+    Command Stats admin
+    """
+    list_display = ('bucket', 'kind', 'action', 'target_type', 'protocol', 'profile', 'status', 'count')
+    list_filter = ('kind', 'protocol', 'profile')
+
+
 # Register models
 admin.site.register(SentHistory, SentHistoryAdmin)
 admin.site.register(ResponseHistory, ResponseHistoryAdmin)
+admin.site.register(CommandOutbox, CommandOutboxAdmin)
+admin.site.register(ArchivedHistory, ArchivedHistoryAdmin)
+admin.site.register(CommandStats, CommandStatsAdmin)
@@ -0,0 +1,146 @@
+"""
+Admission control of the command API, commands are rejected before they are persisted when a quota is exceeded
+or the transports are falling behind
+"""
+import datetime
+import threading
+import time
+
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from django.conf import settings
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+from rest_framework.exceptions import Throttled
+
+# Local imports
+from tracking import log
+from utils.metrics import REGISTRY
+from .exceptions import TransportUnavailable
+from .models import CommandOutbox, SentHistory
+
+REJECTED = REGISTRY.counter('orc_commands_rejected_total', 'Commands rejected by admission control', ('reason', ))
+
+
+class QueueDepth(NamedTuple):
+    messages: int                # messages waiting in the broker queue of the transport
+    consumers: Optional[int]     # consumers of the broker queue, None if the broker does not count them
+    pending: int                 # outbox messages not yet published
+    lag: float                   # time, in seconds, the oldest publishable outbox message has waited
+
+
+class QueueMonitor:
+    """
+    Per transport queue depths, cached for a short time so checks do not query the broker and database on every command
+    """
+    def __init__(self, ttl: float = 2):
+        """
+        :param ttl: time, in seconds, depths are cached
+        """
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._outbox = (0, {})
+        self._depths: Dict[str, tuple] = {}
+
+    def depth(self, routing_key: str) -> QueueDepth:
+        """
+        Get the depth of the queue of a transport
+        :param routing_key: routing key of the transport
+        :return: queue depth
+        """
+        now = time.time()
+        with self._lock:
+            checked, depth = self._depths.get(routing_key, (0, None))
+            if depth is not None and now - checked < self._ttl:
+                return depth
+
+        messages, consumers = 0, None
+        if settings.MESSAGE_QUEUE is not None:
+            try:
+                messages, consumers = settings.MESSAGE_QUEUE.queue_depth(routing_key)
+            # TODO: change to more specific exceptions
+            except Exception as e:  # pylint: disable=broad-except
+                log.error(msg=f'Cannot get the queue depth of {routing_key}: {e}')
+
+        pending, oldest = self._pending(now).get(routing_key, (0, None))
+        depth = QueueDepth(messages, consumers, pending, now - oldest.timestamp() if oldest else 0)
+        with self._lock:
+            self._depths[routing_key] = (now, depth)
+        return depth
+
+    def _pending(self, now: float) -> dict:
+        checked, pending = self._outbox
+        if now - checked >= self._ttl:
+            # Messages delayed by a device rate limit are queued but do not count as lag until they can be published
+            rows = CommandOutbox.objects.filter(sent_on__isnull=True, failed_on__isnull=True).values('routing_key').annotate(
+                count=Count('id'),
+                oldest=Min('available_on', filter=Q(available_on__lte=timezone.now()))
+            )
+            pending = {row['routing_key']: (row['count'], row['oldest']) for row in rows}
+            self._outbox = (now, pending)
+        return pending
+
+
+MONITOR = QueueMonitor(settings.ADMISSION['ttl'])
+
+
+def _quota_wait(queryset, quota: int, window: float) -> Optional[float]:
+    """
+    Seconds until a command is allowed under a quota
+    :param queryset: commands counted against the quota
+    :param quota: max commands within the window
+    :param window: time, in seconds, of the quota window
+    :return: seconds to wait, None if the quota is not exceeded
+    """
+    since = timezone.now() - datetime.timedelta(seconds=window)
+    usage = queryset.filter(received_on__gte=since).aggregate(count=Count('command_id', distinct=True), oldest=Min('received_on'))
+    if usage['count'] < quota:
+        return None
+    return max((usage['oldest'] - since).total_seconds(), 1)
+
+
+def check_quotas(usr, profiles: Iterable[str]) -> None:
+    """
+    Enforce the per user and per profile command quotas
+    :param usr: user sending the command
+    :param profiles: profiles of the actuators receiving the command
+    :raise Throttled: a quota is exceeded
+    """
+    opts = settings.ADMISSION
+    window = opts['quota_window']
+    if opts['user_quota']:
+        wait = _quota_wait(SentHistory.objects.filter(user=usr), opts['user_quota'], window)
+        if wait:
+            REJECTED.inc(reason='user_quota')
+            raise Throttled(wait, detail=f'User command quota of {opts["user_quota"]} per {window:g}s exceeded')
+
+    if opts['profile_quota']:
+        for profile in set(profiles):
+            wait = _quota_wait(SentHistory.objects.filter(actuators__profile=profile), opts['profile_quota'], window)
+            if wait:
+                REJECTED.inc(reason='profile_quota')
+                raise Throttled(wait, detail=f'Profile {profile} command quota of {opts["profile_quota"]} per {window:g}s exceeded')
+
+
+def check_transports(routing_keys: Iterable[str]) -> None:
+    """
+    Enforce the queue depth and lag thresholds of the transports a command is sent through
+    :param routing_keys: routing keys of the transports
+    :raise TransportUnavailable: a transport has no consumer or is lagging
+    :raise Throttled: a transport queue is full
+    """
+    opts = settings.ADMISSION
+    for routing_key in set(routing_keys):
+        depth = MONITOR.depth(routing_key)
+        if depth.consumers == 0:
+            REJECTED.inc(reason='no_consumer')
+            raise TransportUnavailable(f'Transport {routing_key} is not running', wait=opts['retry_after'])
+
+        if opts['max_lag'] and depth.lag > opts['max_lag']:
+            REJECTED.inc(reason='lag')
+            raise TransportUnavailable(f'Transport {routing_key} is lagging {depth.lag:.0f}s behind', wait=opts['retry_after'])
+
+        queued = depth.messages + depth.pending
+        if opts['max_depth'] and queued >= opts['max_depth']:
+            REJECTED.inc(reason='depth')
+            raise Throttled(opts['retry_after'], detail=f'Transport {routing_key} has {queued} commands queued')
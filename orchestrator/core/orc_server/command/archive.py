@@ -0,0 +1,220 @@
+"""
+Command history retention, commands past the retention age or over the row cap are moved with their responses to compressed archive files
+"""
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+
+from typing import List, Optional, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+# Local imports
+from orchestrator.reference import REFERENCE
+from tracking import log
+from utils.metrics import REGISTRY
+from .models import ArchivedHistory, CommandOutbox, HistorySerializer, SentHistory
+
+ARCHIVED = REGISTRY.counter('orc_history_archived_total', 'Commands moved to the history archive')
+
+
+class HistoryArchive:
+    """
+    Append-only archive of commands, each process appends gzip compressed batches of JSON lines to its own segment files.
+    Each batch is a separate gzip member, so a command is read by decompressing only the batch holding it
+    """
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 ** 2):
+        """
+        :param directory: directory of the archive segments, created if it does not exist
+        :param max_bytes: size, in bytes, of a segment before a new one is started
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment = None
+        self._pid = None
+        self._seq = 0
+
+    def append(self, records: List[dict]) -> Tuple[str, int]:
+        """
+        Append a batch of commands, the batch is on disk when this returns
+        :param records: serialized commands
+        :return: segment and offset of the batch
+        """
+        data = gzip.compress(''.join(json.dumps(rec, separators=(',', ':'), default=str) + '\n' for rec in records).encode('utf-8'))
+        with self._lock:
+            if self._pid != os.getpid() or self._file.tell() >= self.max_bytes:
+                self._open()
+            offset = self._file.tell()
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            return self._segment, offset
+
+    def read(self, segment: str, offset: int, command_id: str) -> Optional[dict]:
+        """
+        Read a command from the archive
+        :param segment: segment holding the command
+        :param offset: offset of the batch holding the command
+        :param command_id: ID of the command
+        :return: serialized command, None if not in the batch
+        """
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        data = []
+        with open(os.path.join(self.directory, os.path.basename(segment)), 'rb') as archive:
+            archive.seek(offset)
+            while not decompressor.eof:
+                chunk = archive.read(64 * 1024)
+                if not chunk:
+                    break
+                data.append(decompressor.decompress(chunk))
+
+        for line in b''.join(data).splitlines():
+            record = json.loads(line)
+            if record.get('command_id') == command_id:
+                return record
+        return None
+
+    def _open(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._seq = 0
+        os.makedirs(self.directory, exist_ok=True)
+        self._seq += 1
+        self._segment = f'history-{self._pid}-{int(time.time())}-{self._seq}.ndjson.gz'
+        self._file = open(os.path.join(self.directory, self._segment), 'ab')
+        self._file.seek(0, os.SEEK_END)
+
+
+ARCHIVE = HistoryArchive(settings.ARCHIVE['directory'], settings.ARCHIVE['max_bytes'])
+
+
+class HistoryArchiver(threading.Thread):
+    """
+    Moves the commands past the `command__retention_days`/`command__retention_rows` preferences to the archive in batches.
+    Each server process runs an archiver, the commands of a batch are locked by the archiver moving them
+    """
+    def __init__(self, batch_size: int = 500, interval: float = 3600, archive: HistoryArchive = ARCHIVE, **kwargs):
+        """
+        :param batch_size: max number of commands archived at a time
+        :param interval: time, in seconds, between checks for commands to archive
+        :param archive: archive to move the commands to
+        :param kwargs: archive options, unused
+        """
+        super().__init__(name='HistoryArchiver', daemon=True)
+        self._batch_size = batch_size
+        self._interval = interval
+        self._archive = archive
+        self._exit = threading.Event()
+        self.start()
+
+    def run(self) -> None:
+        while not self._exit.wait(self._interval):
+            try:
+                self.archive()
+            # TODO: change to more specific exceptions
+            except Exception as e:  # pylint: disable=broad-except
+                log.error(msg=f'Command history archiver error: {e}')
+            finally:
+                close_old_connections()
+
+    def cutoff(self) -> Optional[datetime.datetime]:
+        """
+        Time up to which commands are archived, the later of the retention age and the time of the newest command over the row cap
+        :return: cutoff time, None if all commands are retained
+        """
+        cutoffs = []
+        days = REFERENCE.preference('command__retention_days', 0)
+        if days:
+            cutoffs.append(timezone.now() - datetime.timedelta(days=days))
+
+        rows = REFERENCE.preference('command__retention_rows', 0)
+        if rows:
+            over = SentHistory.objects.order_by('-received_on', '-pk').values_list('received_on', flat=True)[rows:rows + 1]
+            cutoffs.extend(over)
+        return max(cutoffs) if cutoffs else None
+
+    def archive(self) -> int:
+        """
+        Archive the commands past the retention
+        :return: number of commands archived
+        """
+        cutoff = self.cutoff()
+        archived = 0
+        while cutoff is not None and not self._exit.is_set():
+            count = self._archive_batch(cutoff)
+            archived += count
+            if count < self._batch_size:
+                break
+        return archived
+
+    def _archive_batch(self, cutoff: datetime.datetime) -> int:
+        """
+        Move a batch of commands, with their actuators and responses, to the archive and remove them from the history
+        :param cutoff: time up to which commands are archived
+        :return: number of commands archived
+        """
+        lock_opts = dict(skip_locked=True) if connection.features.has_select_for_update_skip_locked else {}
+        # Deleting a command deletes its outbox messages, commands with messages still to publish are kept until they are sent or fail
+        pending = CommandOutbox.objects.filter(sent_on__isnull=True, failed_on__isnull=True).values('command_id')
+        with transaction.atomic():
+            commands = list(SentHistory.objects.filter(received_on__lte=cutoff).exclude(pk__in=pending).select_for_update(**lock_opts).order_by('received_on').values_list(
+                'command_id', 'user_id', 'received_on', 'trace'
+            )[:self._batch_size])
+            if not commands:
+                return 0
+
+            traces = {str(command_id): trace for command_id, _, _, trace in commands}
+            queryset = HistorySerializer.setup_eager_loading(SentHistory.objects.filter(pk__in=[c[0] for c in commands]))
+            records = [dict(rec, trace=traces.get(rec['command_id'])) for rec in HistorySerializer(queryset, many=True, context={}).data]
+            # Written before the commands are removed, a failed transaction leaves an unindexed copy rather than losing them
+            segment, offset = self._archive.append(records)
+
+            ArchivedHistory.objects.bulk_create([
+                ArchivedHistory(command_id=command_id, user_id=user_id, received_on=received_on, segment=segment, offset=offset)
+                for command_id, user_id, received_on, _ in commands
+            ], ignore_conflicts=True)
+            SentHistory.objects.filter(pk__in=[c[0] for c in commands]).delete()
+
+        ARCHIVED.inc(len(commands))
+        return len(commands)
+
+    def shutdown(self) -> None:
+        """
+        Stop the archiver
+        """
+        self._exit.set()
+
+
+def archived_command(command_id) -> Optional[Tuple[ArchivedHistory, dict]]:
+    """
+    Get a command from the history archive
+    :param command_id: ID of the command
+    :return: archive index entry and serialized command, None if the command is not archived
+    """
+    try:
+        command_id = uuid.UUID(str(command_id))
+    except ValueError:
+        return None
+
+    entry = ArchivedHistory.objects.filter(command_id=command_id).first()
+    if entry is None:
+        return None
+
+    try:
+        record = ARCHIVE.read(entry.segment, entry.offset, str(command_id))
+    # Missing segments are on another server if the archive directory is not shared, truncated or corrupt segments fail to decompress or parse
+    except (OSError, EOFError, ValueError, zlib.error) as e:
+        log.error(msg=f'Archived command {command_id} cannot be read from {entry.segment}@{entry.offset}: {e}')
+        return None
+    return (entry, dict(record, archived=True)) if record else None
@@ -0,0 +1,157 @@
+"""
+Command stats counters, hourly counts by protocol, profile, action, target type and status, updated as commands and responses are saved
+"""
+import atexit
+import datetime
+import os
+import threading
+import time
+
+from collections import Counter
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+# Local imports
+from tracking import log
+from .models import CommandStats
+
+CACHE_KEY = 'command_stats'
+DIMENSIONS = ('bucket', 'kind', 'action', 'target_type', 'protocol', 'profile', 'status')
+
+
+def stats_bucket(when: datetime.datetime) -> datetime.datetime:
+    """
+    Hour bucket of a time
+    :param when: time to bucket
+    :return: start of the hour
+    """
+    return when.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+class StatsRecorder:
+    """
+    Counts buffered per process and added to the `CommandStats` rows at an interval, so saving a command does not lock a shared counter row
+    """
+    def __init__(self, interval: float = 5):
+        """
+        :param interval: time, in seconds, between writes of the buffered counts
+        """
+        self._interval = interval
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._pid = None
+
+    def add(self, kind: str, when: datetime.datetime = None, count: int = 1, action: str = '', target_type: str = '', protocol: str = '',
+            profile: str = '', status: Optional[int] = None) -> None:
+        """
+        Count commands, destinations or responses
+        :param kind: command, dispatch or response
+        :param when: time counted, default now
+        :param count: number to count
+        :param action: action of the command
+        :param target_type: target type of the command
+        :param protocol: protocol of the destination/response
+        :param profile: profile of the actuator
+        :param status: status code of the response
+        """
+        key = (stats_bucket(when or timezone.now()), kind, action or '', target_type or '', protocol or '', profile or '', status or 0)
+        with self._lock:
+            self._pending[key] += count
+            # Forked processes start their own writer
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                threading.Thread(target=self._run, name='StatsRecorder', daemon=True).start()
+                atexit.register(self.flush)
+
+    def flush(self) -> None:
+        """
+        Add the buffered counts to the counters, counts that fail to write are kept for the next flush
+        """
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+        if not pending:
+            return
+
+        try:
+            with transaction.atomic():
+                CommandStats.objects.bulk_create([CommandStats(**dict(zip(DIMENSIONS, key))) for key in pending], ignore_conflicts=True)
+                # Consistent order, so concurrent flushes do not deadlock
+                for key, count in sorted(pending.items()):
+                    CommandStats.objects.filter(**dict(zip(DIMENSIONS, key))).update(count=F('count') + count)
+        # TODO: change to more specific exceptions
+        except Exception as e:  # pylint: disable=broad-except
+            log.error(msg=f'Command stats failed to save: {e}')
+            with self._lock:
+                self._pending.update(pending)
+            return
+        cache.delete(CACHE_KEY)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self._interval)
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+STATS = StatsRecorder(settings.STATS['interval'])
+
+
+def command_stats() -> dict:
+    """
+    Command and response counts, in total and by action, target type, protocol, profile and response status, and per hour for the latest hours.
+    Served from the cache, at most `STATS['ttl']` seconds old
+    :return: command stats
+    """
+    stats = cache.get(CACHE_KEY)
+    if stats is not None:
+        return stats
+
+    stats = dict(sent=0, responses=0, actions=Counter(), targets=Counter(), statuses=Counter(), protocols={}, profiles={})
+    rows = CommandStats.objects.values(*DIMENSIONS[1:]).annotate(total=Sum('count')).order_by()
+    for row in rows:
+        _count(stats, row)
+
+    since = stats_bucket(timezone.now()) - datetime.timedelta(hours=settings.STATS['buckets'] - 1)
+    buckets = {}
+    for row in CommandStats.objects.filter(bucket__gte=since).values(*DIMENSIONS).annotate(total=Sum('count')).order_by('bucket'):
+        bucket = buckets.setdefault(row['bucket'], dict(
+            bucket=row['bucket'], sent=0, responses=0, actions=Counter(), targets=Counter(), statuses=Counter(), protocols={}, profiles={}
+        ))
+        _count(bucket, row)
+
+    stats = _plain(dict(stats, buckets=list(buckets.values())))
+    cache.set(CACHE_KEY, stats, settings.STATS['ttl'])
+    return stats
+
+
+def _count(stats: dict, row: dict) -> None:
+    kind, total = row['kind'], row['total']
+    if kind == 'command':
+        stats['sent'] += total
+        stats['actions'][row['action']] += total
+        stats['targets'][row['target_type']] += total
+        return
+
+    # Destinations count as sent to their protocol/profile
+    name = 'sent' if kind == 'dispatch' else 'responses'
+    if kind == 'response':
+        stats['responses'] += total
+        stats['statuses'][row['status'] or None] += total
+    for dim, group in (('protocol', 'protocols'), ('profile', 'profiles')):
+        counts = stats[group].setdefault(row[dim], dict(sent=0, responses=0))
+        counts[name] += total
+
+
+def _plain(stats):
+    if isinstance(stats, dict):
+        return {k: _plain(v) for k, v in stats.items()}
+    if isinstance(stats, list):
+        return [_plain(v) for v in stats]
+    return stats
@@ -0,0 +1,12 @@
+from rest_framework.exceptions import APIException
+
+
+class TransportUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Transport unavailable, the command was not sent'
+    default_code = 'transport_unavailable'
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        # Seconds until the command should be retried, sent as the Retry-After header
+        self.wait = wait
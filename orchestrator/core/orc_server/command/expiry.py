@@ -0,0 +1,56 @@
+"""
+Command deadlines, commands not sent to their actuators by their deadline are dropped and recorded as expired
+"""
+import datetime
+
+from typing import Iterable, Optional
+
+from django.utils import timezone
+
+# Local imports
+from orchestrator.reference import REFERENCE
+from tracking import log
+from utils import safe_cast
+from utils.metrics import REGISTRY
+from .limiter import release_devices
+from .models import SentHistory
+
+EXPIRED = REGISTRY.counter('orc_commands_expired_total', 'Command destinations dropped as expired', ('stage', ))
+
+
+def command_deadline(cmd: dict, received_on: datetime.datetime) -> Optional[datetime.datetime]:
+    """
+    Deadline of a command, the OpenC2 stop time, the start time plus the duration or the default time to live
+    :param cmd: OpenC2 command
+    :param received_on: time the command was received
+    :return: deadline, None if the command does not expire
+    """
+    args = cmd.get('args') if isinstance(cmd.get('args'), dict) else {}
+    # OpenC2 times and durations are in milliseconds
+    stop = safe_cast(args.get('stop_time'), int)
+    start = safe_cast(args.get('start_time'), int)
+    duration = safe_cast(args.get('duration'), int)
+
+    if stop:
+        return datetime.datetime.fromtimestamp(stop / 1000, tz=datetime.timezone.utc)
+    if duration:
+        start = datetime.datetime.fromtimestamp(start / 1000, tz=datetime.timezone.utc) if start else received_on
+        return start + datetime.timedelta(milliseconds=duration)
+
+    ttl = REFERENCE.preference('command__ttl', 0)
+    return received_on + datetime.timedelta(seconds=ttl) if ttl else None
+
+
+def expire_command(command_id: str, device_ids: Iterable[str], stage: str) -> None:
+    """
+    Record a command as expired for its destinations and free their in-flight slots
+    :param command_id: ID of the command
+    :param device_ids: IDs of the devices the command was dropped for
+    :param stage: where the command was dropped - outbox, broker or transport
+    """
+    device_ids = set(device_ids)
+    EXPIRED.inc(len(device_ids) or 1, stage=stage)
+    log.warn(msg=f'Command {command_id} expired in the {stage} before it was sent to {", ".join(sorted(device_ids)) or "its actuators"}')
+
+    SentHistory.objects.filter(command_id=command_id, expired_on__isnull=True).update(expired_on=timezone.now())
+    release_devices(command_id, device_ids)
@@ -0,0 +1,52 @@
+import coreapi
+import coreschema
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend
+
+# Local imports
+from utils import safe_cast
+from .models import ResponseHistory
+
+
+class HistoryFilter(BaseFilterBackend):
+    """
+    Filter the command history on the indexed action, target type and response status columns
+    """
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        if params.get('action'):
+            queryset = queryset.filter(action=params['action'])
+
+        if params.get('target_type'):
+            queryset = queryset.filter(target_type=params['target_type'])
+
+        if params.get('status'):
+            status = safe_cast(params['status'], int)
+            if status is None:
+                raise ValidationError({'status': ['A valid integer is required.']})
+            # Subquery rather than a join, so commands with several matching responses are listed once
+            queryset = queryset.filter(command_id__in=ResponseHistory.objects.filter(status=status).values('command_id'))
+        return queryset
+
+    def get_schema_fields(self, view):
+        return [
+            coreapi.Field(
+                name='action',
+                required=False,
+                location='query',
+                schema=coreschema.String(description='Action of the commands')
+            ),
+            coreapi.Field(
+                name='target_type',
+                required=False,
+                location='query',
+                schema=coreschema.String(description='Target type of the commands')
+            ),
+            coreapi.Field(
+                name='status',
+                required=False,
+                location='query',
+                schema=coreschema.Integer(description='Status code of a response to the commands')
+            )
+        ]
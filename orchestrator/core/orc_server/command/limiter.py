@@ -0,0 +1,137 @@
+"""
+Per device rate limit (token bucket) and in-flight window of the commands published by the outbox relay.
+The state of each limited device is held in the database and locked while a batch is admitted, so the limits hold across server processes
+"""
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import transaction
+
+# Local imports
+from device.models import Device
+from orchestrator.reference import REFERENCE
+from .models import DeviceDispatch
+
+
+class DispatchLimiter:
+    """
+    Admits the destinations of commands as their devices' rate limits and in-flight windows allow
+    """
+    def __init__(self, recheck: float = 1):
+        """
+        :param recheck: max time, in seconds, a destination waits for a full in-flight window before it is checked again
+        """
+        self._recheck = recheck
+
+    def admit(self, commands: List[Tuple[str, List[str]]], now: float) -> List[Dict[str, float]]:
+        """
+        Take a token and an in-flight slot of each destination device, must be called within a transaction
+        :param commands: command ID, destination device IDs pairs, in publish order
+        :param now: epoch time of the publish
+        :return: per command, device ID -> seconds the destination must wait, 0 if admitted
+        """
+        device_ids = {dev for _, devs in commands for dev in devs}
+        limits = self._limits(device_ids)
+        if not limits:
+            return [dict.fromkeys(devs, 0) for _, devs in commands]
+
+        # New devices start with a full bucket
+        DeviceDispatch.objects.bulk_create([
+            DeviceDispatch(device_id=pk, tokens=burst, refilled_on=now) for pk, _, burst, _ in limits.values()
+        ], ignore_conflicts=True)
+        states = {s.device_id: s for s in DeviceDispatch.objects.select_for_update().filter(device_id__in=[lim[0] for lim in limits.values()])}
+        timeout = REFERENCE.preference('command__in_flight_timeout', 30)
+
+        admitted = []
+        for command_id, devs in commands:
+            waits = {}
+            for dev in devs:
+                if dev in limits:
+                    pk, rate, burst, window = limits[dev]
+                    waits[dev] = self._take(states[pk], command_id, rate, burst, window, timeout, now)
+                else:
+                    waits[dev] = 0
+            admitted.append(waits)
+
+        DeviceDispatch.objects.bulk_update(states.values(), ['tokens', 'refilled_on', 'in_flight'])
+        return admitted
+
+    def refund(self, commands: List[Tuple[str, List[str]]]) -> None:
+        """
+        Return the token and in-flight slot taken for admitted destinations that were not published, must be called within a transaction
+        :param commands: command ID, admitted destination device IDs pairs
+        """
+        device_ids = {dev for _, devs in commands for dev in devs}
+        limits = self._limits(device_ids)
+        if not limits:
+            return
+
+        states = {s.device_id: s for s in DeviceDispatch.objects.select_for_update().filter(device_id__in=[lim[0] for lim in limits.values()])}
+        for command_id, devs in commands:
+            for dev in devs:
+                if dev in limits and limits[dev][0] in states:
+                    pk, rate, burst, _ = limits[dev]
+                    state = states[pk]
+                    if rate:
+                        state.tokens = min(burst, state.tokens + 1)
+                    state.in_flight.pop(command_id, None)
+
+        DeviceDispatch.objects.bulk_update(states.values(), ['tokens', 'in_flight'])
+
+    def _limits(self, device_ids) -> Dict[str, Tuple[int, float, int, int]]:
+        """
+        Effective limits of the limited devices, the orchestrator defaults apply to devices without their own
+        :param device_ids: device IDs
+        :return: device ID -> device pk, rate, burst, in-flight window
+        """
+        rate = REFERENCE.preference('command__device_rate', 0)
+        burst = REFERENCE.preference('command__device_burst', 10)
+        window = REFERENCE.preference('command__device_in_flight', 0)
+
+        limits = {}
+        devices = Device.objects.filter(device_id__in=device_ids).values_list('id', 'device_id', 'rate_limit', 'rate_burst', 'max_in_flight')
+        for pk, dev_id, dev_rate, dev_burst, dev_window in devices:
+            dev_rate = rate if dev_rate is None else dev_rate
+            dev_window = window if dev_window is None else dev_window
+            if dev_rate or dev_window:
+                limits[str(dev_id)] = (pk, dev_rate, max(dev_burst or burst, 1), dev_window)
+        return limits
+
+    def _take(self, state: DeviceDispatch, command_id: str, rate: float, burst: int, window: int, timeout: float, now: float) -> float:
+        if rate:
+            state.tokens = min(burst, state.tokens + max(now - state.refilled_on, 0) * rate)
+            state.refilled_on = now
+        if window:
+            state.in_flight = {cmd: expires for cmd, expires in state.in_flight.items() if expires > now}
+            if len(state.in_flight) >= window:
+                # Responses free slots before the oldest command expires
+                return min(min(state.in_flight.values()) - now, self._recheck)
+        if rate:
+            if state.tokens < 1:
+                return (1 - state.tokens) / rate
+            state.tokens -= 1
+        if window:
+            state.in_flight[command_id] = now + timeout
+        return 0
+
+
+def release_devices(command_id: str, device_ids: Iterable[str]) -> None:
+    """
+    Free the in-flight slots of a command on the given devices
+    :param command_id: ID of the command
+    :param device_ids: IDs of the devices
+    """
+    for pk in Device.objects.filter(device_id__in=set(device_ids)).values_list('id', flat=True):
+        release_in_flight(command_id, pk)
+
+
+def release_in_flight(command_id: str, device: int) -> None:
+    """
+    Free the in-flight slot of a command once its device responded
+    :param command_id: ID of the command
+    :param device: pk of the device
+    """
+    with transaction.atomic():
+        state = DeviceDispatch.objects.select_for_update().filter(device_id=device).first()
+        if state is not None and command_id in state.in_flight:
+            del state.in_flight[command_id]
+            state.save(update_fields=['in_flight'])
@@ -0,0 +1,91 @@
+import datetime
+import random
+import time
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from command.models import SentHistory
+from utils import uuid7
+
+KEYS = {
+    'uuid4': uuid.uuid4,
+    'uuid7': uuid7
+}
+
+
+class Command(BaseCommand):
+    """
+    Custom django command - benchmark_history
+    Benchmark inserting and range scanning the command history with random (uuid4) and time ordered (uuid7) primary keys,
+    run in a test database created from the configured database so the history is not modified
+    """
+    help = 'Benchmark command history inserts and range scans by primary key type'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Commands to insert for each key type')
+        parser.add_argument('--batch', type=int, default=5000, help='Commands inserted per transaction')
+        parser.add_argument('--scans', type=int, default=20, help='Range scans for each key type')
+        parser.add_argument('--scan-rows', type=int, default=10000, help='Commands read by each range scan')
+        parser.add_argument('--keys', nargs='+', choices=tuple(KEYS), default=list(KEYS), help='Key types to benchmark')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs')
+
+    def handle(self, *args, **kwargs):
+        """
+        Handle command execution
+        :param args:
+        :param kwargs:
+        :return: None
+        """
+        db_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=kwargs['keepdb'])
+        try:
+            user, _ = User.objects.get_or_create(username='benchmark')
+            for key in kwargs['keys']:
+                self._clear()
+                inserted = self._insert(user, KEYS[key], kwargs['rows'], kwargs['batch'])
+                scanned = self._scan(kwargs['rows'], kwargs['scans'], kwargs['scan_rows'])
+                self.stdout.write(f'{key}: {inserted}, {scanned}')
+            self._clear()
+        finally:
+            connection.creation.destroy_test_db(db_name, verbosity=0, keepdb=kwargs['keepdb'])
+
+    def _clear(self) -> None:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {connection.ops.quote_name(SentHistory._meta.db_table)}')
+
+    def _insert(self, user: User, key, rows: int, batch: int) -> str:
+        """
+        Insert commands received a millisecond apart, the rate of the last tenth shows the slowdown as the index grows
+        :return: insert rates
+        """
+        start = timezone.now() - datetime.timedelta(milliseconds=rows)
+        began = last = time.perf_counter()
+        tail = max(rows - rows // 10, 0)
+        for offset in range(0, rows, batch):
+            if offset >= tail > offset - batch:
+                last = time.perf_counter()
+            with transaction.atomic():
+                SentHistory.objects.bulk_create([
+                    SentHistory(command_id=key(), user=user, received_on=start + datetime.timedelta(milliseconds=idx), command={'action': 'query', 'target': {'features': []}})
+                    for idx in range(offset, min(offset + batch, rows))
+                ])
+        end = time.perf_counter()
+        return f'{rows / (end - began):.0f} inserts/s, last 10% {(rows - tail) / max(end - last, 1e-9):.0f} inserts/s'
+
+    def _scan(self, rows: int, scans: int, scan_rows: int) -> str:
+        """
+        Read consecutive commands by time, as history pages do, the rows are scattered through the table with random keys
+        :return: scan rates
+        """
+        start = SentHistory.objects.order_by('received_on').values_list('received_on', flat=True).first()
+        elapsed = 0
+        for _ in range(scans):
+            since = start + datetime.timedelta(milliseconds=random.randrange(max(rows - scan_rows, 1)))
+            began = time.perf_counter()
+            list(SentHistory.objects.filter(received_on__gte=since).order_by('received_on').values_list('command_id', 'received_on', 'command')[:scan_rows])
+            elapsed += time.perf_counter() - began
+        return f'{scans * scan_rows / elapsed:.0f} scanned rows/s ({elapsed / scans * 1000:.1f} ms/scan of {scan_rows})'
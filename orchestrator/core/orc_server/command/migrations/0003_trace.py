@@ -0,0 +1,24 @@
+# Generated by Django 2.2.10 on 2026-10-19 16:20
+
+from django.db import migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('command', '0002_senthistory__coap_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='senthistory',
+            name='trace',
+            field=jsonfield.fields.JSONField(blank=True, help_text='Trace ID and hop timestamps of the command', null=True),
+        ),
+        migrations.AddField(
+            model_name='responsehistory',
+            name='trace',
+            field=jsonfield.fields.JSONField(blank=True, help_text='Hop timestamps of the command and response', null=True),
+        ),
+    ]
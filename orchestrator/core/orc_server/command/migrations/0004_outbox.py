@@ -0,0 +1,32 @@
+# Generated by Django 2.2.10 on 2026-10-19 16:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('command', '0003_trace'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandOutbox',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('routing_key', models.CharField(help_text='Routing key of the transport', max_length=60)),
+                ('message', models.TextField(help_text='Serialized command')),
+                ('headers', jsonfield.fields.JSONField(help_text='Headers of the message')),
+                ('created_on', models.DateTimeField(default=django.utils.timezone.now, help_text='Time the message was queued')),
+                ('sent_on', models.DateTimeField(blank=True, db_index=True, help_text='Time the message was published, empty while pending', null=True)),
+                ('attempts', models.PositiveIntegerField(default=0, help_text='Number of failed publish attempts')),
+                ('command', models.ForeignKey(help_text='Command the message is for', on_delete=django.db.models.deletion.CASCADE, to='command.SentHistory')),
+            ],
+            options={
+                'verbose_name_plural': 'Command Outbox',
+            },
+        ),
+    ]
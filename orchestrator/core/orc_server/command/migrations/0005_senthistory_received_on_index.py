@@ -0,0 +1,19 @@
+# Generated by Django 2.2.10 on 2026-10-19 17:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('command', '0004_outbox'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='senthistory',
+            name='received_on',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='Time the command was received'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.10 on 2026-10-19 17:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0008_device_rate_limit'),
+        ('command', '0005_senthistory_received_on_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceDispatch',
+            fields=[
+                ('device', models.OneToOneField(help_text='Device the state is for', on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='device.Device')),
+                ('tokens', models.FloatField(default=0, help_text='Commands that can be sent to the device now')),
+                ('refilled_on', models.FloatField(default=0, help_text='Epoch time the tokens were last refilled')),
+                ('in_flight', jsonfield.fields.JSONField(default=dict, help_text='Commands awaiting a response, command ID -> epoch time the command stops counting')),
+            ],
+            options={
+                'verbose_name_plural': 'Device Dispatch',
+            },
+        ),
+        migrations.AddField(
+            model_name='commandoutbox',
+            name='available_on',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='Time the message can be published, later than queued if delayed by a device rate limit'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 2.2.10 on 2026-10-19 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('command', '0006_device_dispatch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='senthistory',
+            name='expired_on',
+            field=models.DateTimeField(blank=True, help_text='Time the command was dropped as expired, empty if it was sent to all actuators', null=True),
+        ),
+        migrations.AddField(
+            model_name='senthistory',
+            name='expires_on',
+            field=models.DateTimeField(blank=True, help_text='Time the command is dropped if not yet sent, empty if it does not expire', null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.10 on 2026-10-19 19:05
+
+from django.db import migrations, models
+import utils.general
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('command', '0007_expiry'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='senthistory',
+            name='command_id',
+            field=models.UUIDField(default=utils.general.uuid7, editable=False, help_text='Unique UUID of the command, time ordered if created by the orchestrator', primary_key=True, serialize=False),
+        ),
+    ]
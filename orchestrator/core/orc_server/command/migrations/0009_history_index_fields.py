@@ -0,0 +1,61 @@
+# Generated by Django 2.2.10 on 2026-10-19 19:30
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    """
+    Copy the action/target type of the existing commands and the status of the existing responses to their indexed columns
+    """
+    SentHistory = apps.get_model('command', 'SentHistory')
+    ResponseHistory = apps.get_model('command', 'ResponseHistory')
+
+    batch = []
+    for com in SentHistory.objects.only('command_id', 'command').iterator(chunk_size=BATCH_SIZE):
+        cmd = com.command if isinstance(com.command, dict) else {}
+        target = cmd.get('target')
+        com.action = str(cmd.get('action', ''))[:30]
+        com.target_type = str(next(iter(target), ''))[:60] if isinstance(target, dict) else ''
+        batch.append(com)
+        if len(batch) >= BATCH_SIZE:
+            SentHistory.objects.bulk_update(batch, ['action', 'target_type'])
+            batch = []
+    SentHistory.objects.bulk_update(batch, ['action', 'target_type'])
+
+    batch = []
+    for rsp in ResponseHistory.objects.only('id', 'response').iterator(chunk_size=BATCH_SIZE):
+        status = rsp.response.get('status') if isinstance(rsp.response, dict) else None
+        rsp.status = status if isinstance(status, int) and not isinstance(status, bool) and 0 <= status <= 32767 else None
+        batch.append(rsp)
+        if len(batch) >= BATCH_SIZE:
+            ResponseHistory.objects.bulk_update(batch, ['status'])
+            batch = []
+    ResponseHistory.objects.bulk_update(batch, ['status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('command', '0008_command_id_uuid7'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='responsehistory',
+            name='status',
+            field=models.PositiveSmallIntegerField(blank=True, db_index=True, editable=False, help_text='Status code of the response, copied from the response for filtering', null=True),
+        ),
+        migrations.AddField(
+            model_name='senthistory',
+            name='action',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Action of the command, copied from the command for filtering', max_length=30),
+        ),
+        migrations.AddField(
+            model_name='senthistory',
+            name='target_type',
+            field=models.CharField(blank=True, db_index=True, editable=False, help_text='Target type of the command, copied from the command for filtering', max_length=60),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.10 on 2026-10-19 20:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('command', '0009_history_index_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedHistory',
+            fields=[
+                ('command_id', models.UUIDField(editable=False, help_text='Unique UUID of the command', primary_key=True, serialize=False)),
+                ('received_on', models.DateTimeField(db_index=True, help_text='Time the command was received')),
+                ('archived_on', models.DateTimeField(default=django.utils.timezone.now, help_text='Time the command was archived')),
+                ('segment', models.CharField(help_text='Archive file holding the command', max_length=100)),
+                ('offset', models.BigIntegerField(help_text='Offset, in bytes, of the compressed batch holding the command within the archive file')),
+                ('user', models.ForeignKey(help_text='User that sent the command', on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Archived History',
+            },
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.10 on 2026-10-19 20:30
+import datetime
+
+from collections import Counter
+
+from django.db import migrations, models
+
+BATCH_SIZE = 1000
+
+
+def backfill(apps, schema_editor):
+    """
+    Count the existing commands, destinations and responses per hour, the protocol of past commands is not known
+    """
+    SentHistory = apps.get_model('command', 'SentHistory')
+    ResponseHistory = apps.get_model('command', 'ResponseHistory')
+    CommandStats = apps.get_model('command', 'CommandStats')
+
+    def bucket(when):
+        return when.astimezone(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+    counts = Counter()
+    for received_on, action, target_type in SentHistory.objects.values_list('received_on', 'action', 'target_type').iterator(chunk_size=BATCH_SIZE):
+        counts[(bucket(received_on), 'command', action, target_type, '', 0)] += 1
+
+    dispatched = SentHistory.actuators.through.objects.values_list('senthistory__received_on', 'actuator__profile')
+    for received_on, profile in dispatched.iterator(chunk_size=BATCH_SIZE):
+        counts[(bucket(received_on), 'dispatch', '', '', profile, 0)] += 1
+
+    responses = ResponseHistory.objects.values_list('received_on', 'actuator__profile', 'status')
+    for received_on, profile, status in responses.iterator(chunk_size=BATCH_SIZE):
+        counts[(bucket(received_on), 'response', '', '', profile or '', status or 0)] += 1
+
+    CommandStats.objects.bulk_create([
+        CommandStats(bucket=b, kind=kind, action=action, target_type=target_type, profile=profile, status=status, count=count)
+        for (b, kind, action, target_type, profile, status), count in counts.items()
+    ], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('command', '0010_archived_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommandStats',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(help_text='Start of the hour counted')),
+                ('kind', models.CharField(choices=[('command', 'Command'), ('dispatch', 'Dispatch'), ('response', 'Response')], help_text='Counted commands, command destinations (actuators) or responses', max_length=10)),
+                ('action', models.CharField(blank=True, default='', help_text='Action of the commands', max_length=30)),
+                ('target_type', models.CharField(blank=True, default='', help_text='Target type of the commands', max_length=60)),
+                ('protocol', models.CharField(blank=True, default='', help_text='Protocol the commands were sent or the responses received with', max_length=30)),
+                ('profile', models.CharField(blank=True, default='', help_text='Profile of the actuators', max_length=60)),
+                ('status', models.PositiveSmallIntegerField(default=0, help_text='Status code of the responses, 0 if none')),
+                ('count', models.BigIntegerField(default=0, help_text='Number counted')),
+            ],
+            options={
+                'verbose_name_plural': 'Command Stats',
+                'unique_together': {('bucket', 'kind', 'action', 'target_type', 'protocol', 'profile', 'status')},
+            },
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.10 on 2026-10-19 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('command', '0011_command_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='commandoutbox',
+            name='failed_on',
+            field=models.DateTimeField(blank=True, help_text='Time the message was set aside after its max publish attempts, empty while pending', null=True),
+        ),
+    ]
@@ -3,6 +3,7 @@ import uuid
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 from django.db import models
+from django.db.models import Prefetch
 from django.db.models.signals import pre_save
 from django.utils import timezone
 from jsonfield import JSONField
@@ -10,9 +11,10 @@ from rest_framework import serializers
 
 # Local Imports
 from actuator.models import Actuator, ActuatorSerializer
+from device.models import Device
 from es_mirror.decorators import ElasticModel
 from tracking import log
-from utils import randBytes, get_or_none
+from utils import randBytes, get_or_none, uuid7
 from .documents import CommandDocument, ResponseDocument
 
 
@@ -22,9 +24,9 @@ class SentHistory(models.Model):
     Command Sent History model
     """
     command_id = models.UUIDField(
-        default=uuid.uuid4,
+        default=uuid7,
         editable=False,
-        help_text="Unique UUID of the command",
+        help_text="Unique UUID of the command, time ordered if created by the orchestrator",
         primary_key=True,
     )
     _coap_id = models.CharField(
@@ -40,6 +42,7 @@ class SentHistory(models.Model):
         help_text="User that sent the command"
     )
     received_on = models.DateTimeField(
+        db_index=True,
         default=timezone.now,
         help_text="Time the command was received"
     )
@@ -52,6 +55,35 @@ class SentHistory(models.Model):
         help_text="Command that was received",
         null=True
     )
+    action = models.CharField(
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Action of the command, copied from the command for filtering",
+        max_length=30
+    )
+    target_type = models.CharField(
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Target type of the command, copied from the command for filtering",
+        max_length=60
+    )
+    trace = JSONField(
+        blank=True,
+        help_text="Trace ID and hop timestamps of the command",
+        null=True
+    )
+    expires_on = models.DateTimeField(
+        blank=True,
+        help_text="Time the command is dropped if not yet sent, empty if it does not expire",
+        null=True
+    )
+    expired_on = models.DateTimeField(
+        blank=True,
+        help_text="Time the command was dropped as expired, empty if it was sent to all actuators",
+        null=True
+    )
 
     class Meta:
         verbose_name_plural = "Sent History"
@@ -59,10 +91,10 @@ class SentHistory(models.Model):
     @property
     def responses(self):
         """
-        Command responses received from actuators
+        Command responses received from actuators, from the prefetched responses if the command was loaded with them
         :return: command responses
         """
-        return ResponseSerializer(ResponseHistory.objects.filter(command=self), many=True).data
+        return ResponseSerializer(self.responsehistory_set.all(), many=True).data
 
     @property
     def coap_id(self):
@@ -112,6 +144,18 @@ class ResponseHistory(models.Model):
         help_text="Response that was received",
         null=True
     )
+    status = models.PositiveSmallIntegerField(
+        blank=True,
+        db_index=True,
+        editable=False,
+        help_text="Status code of the response, copied from the response for filtering",
+        null=True
+    )
+    trace = JSONField(
+        blank=True,
+        help_text="Hop timestamps of the command and response",
+        null=True
+    )
 
     class Meta:
         verbose_name_plural = "Response History"
@@ -120,6 +164,184 @@ class ResponseHistory(models.Model):
         return "Response History: command_id {}".format(self.command.command_id)
 
 
+class ArchivedHistory(models.Model):
+    """
+    Index of the commands moved to the history archive, locating each in its archive segment
+    """
+    command_id = models.UUIDField(
+        editable=False,
+        help_text="Unique UUID of the command",
+        primary_key=True
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        help_text="User that sent the command"
+    )
+    received_on = models.DateTimeField(
+        db_index=True,
+        help_text="Time the command was received"
+    )
+    archived_on = models.DateTimeField(
+        default=timezone.now,
+        help_text="Time the command was archived"
+    )
+    segment = models.CharField(
+        help_text="Archive file holding the command",
+        max_length=100
+    )
+    offset = models.BigIntegerField(
+        help_text="Offset, in bytes, of the compressed batch holding the command within the archive file"
+    )
+
+    class Meta:
+        verbose_name_plural = "Archived History"
+
+    def __str__(self):
+        return "Archived History: {} - {}".format(self.command_id, self.segment)
+
+
+class CommandOutbox(models.Model):
+    """
+    Command messages awaiting publishing to the transports, written in the transaction of their command
+    """
+    command = models.ForeignKey(
+        SentHistory,
+        on_delete=models.CASCADE,
+        help_text="Command the message is for"
+    )
+    routing_key = models.CharField(
+        help_text="Routing key of the transport",
+        max_length=60
+    )
+    message = models.TextField(
+        help_text="Serialized command"
+    )
+    headers = JSONField(
+        help_text="Headers of the message"
+    )
+    created_on = models.DateTimeField(
+        default=timezone.now,
+        help_text="Time the message was queued"
+    )
+    available_on = models.DateTimeField(
+        db_index=True,
+        default=timezone.now,
+        help_text="Time the message can be published, later than queued if delayed by a device rate limit"
+    )
+    sent_on = models.DateTimeField(
+        blank=True,
+        db_index=True,
+        help_text="Time the message was published, empty while pending",
+        null=True
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of failed publish attempts"
+    )
+    failed_on = models.DateTimeField(
+        blank=True,
+        help_text="Time the message was set aside after its max publish attempts, empty while pending",
+        null=True
+    )
+
+    class Meta:
+        verbose_name_plural = "Command Outbox"
+
+    def __str__(self):
+        return "Command Outbox: {} - {}".format(self.command_id, self.routing_key)
+
+
+class DeviceDispatch(models.Model):
+    """
+    Rate limit and in-flight window state of a device, updated as commands are published to it
+    """
+    device = models.OneToOneField(
+        Device,
+        on_delete=models.CASCADE,
+        help_text="Device the state is for",
+        primary_key=True
+    )
+    tokens = models.FloatField(
+        default=0,
+        help_text="Commands that can be sent to the device now"
+    )
+    refilled_on = models.FloatField(
+        default=0,
+        help_text="Epoch time the tokens were last refilled"
+    )
+    in_flight = JSONField(
+        default=dict,
+        help_text="Commands awaiting a response, command ID -> epoch time the command stops counting"
+    )
+
+    class Meta:
+        verbose_name_plural = "Device Dispatch"
+
+    def __str__(self):
+        return "Device Dispatch: {}".format(self.device_id)
+
+
+class CommandStats(models.Model):
+    """
+    Hourly counts of the commands sent, their destinations and the responses received, by their indexed columns.
+    Updated as commands and responses are saved, so the stats never scan the history
+    """
+    KINDS = (
+        ('command', 'Command'),
+        ('dispatch', 'Dispatch'),
+        ('response', 'Response')
+    )
+
+    bucket = models.DateTimeField(
+        help_text="Start of the hour counted"
+    )
+    kind = models.CharField(
+        choices=KINDS,
+        help_text="Counted commands, command destinations (actuators) or responses",
+        max_length=10
+    )
+    action = models.CharField(
+        blank=True,
+        default='',
+        help_text="Action of the commands",
+        max_length=30
+    )
+    target_type = models.CharField(
+        blank=True,
+        default='',
+        help_text="Target type of the commands",
+        max_length=60
+    )
+    protocol = models.CharField(
+        blank=True,
+        default='',
+        help_text="Protocol the commands were sent or the responses received with",
+        max_length=30
+    )
+    profile = models.CharField(
+        blank=True,
+        default='',
+        help_text="Profile of the actuators",
+        max_length=60
+    )
+    status = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Status code of the responses, 0 if none"
+    )
+    count = models.BigIntegerField(
+        default=0,
+        help_text="Number counted"
+    )
+
+    class Meta:
+        unique_together = (('bucket', 'kind', 'action', 'target_type', 'protocol', 'profile', 'status'), )
+        verbose_name_plural = "Command Stats"
+
+    def __str__(self):
+        return "Command Stats: {} {} - {}".format(self.bucket, self.kind, self.count)
+
+
 @receiver(pre_save, sender=SentHistory)
 def check_command_id(sender, instance=None, **kwargs):
     """
@@ -131,11 +353,12 @@ def check_command_id(sender, instance=None, **kwargs):
     """
     if instance.command_id is None:
         log.info(msg=f"Command submitted without command id, command id generated")
-        instance.command_id = uuid.uuid4()
+        instance.command_id = uuid7()
         instance.command.update({"id": str(instance.command_id)})
     else:
         try:
-            val = uuid.UUID(str(instance.command_id), version=4)
+            # Client supplied IDs can be any UUID version
+            val = uuid.UUID(str(instance.command_id))
         except ValueError:
             log.info(msg=f"Invalid command id received: {instance.command_id}")
             raise ValueError("Invalid command id")
@@ -146,6 +369,35 @@ def check_command_id(sender, instance=None, **kwargs):
             raise ValueError("command id has been used")
 
 
+@receiver(pre_save, sender=SentHistory)
+def index_command(sender, instance=None, **kwargs):
+    """
+    Copy the action and target type of the command to their indexed columns
+    :param sender: sender instance - SentHistory
+    :param instance: SENDER instance
+    :param kwargs: key/value args
+    :return: None
+    """
+    cmd = instance.command if isinstance(instance.command, dict) else {}
+    target = cmd.get("target")
+    instance.action = str(cmd.get("action", ""))[:30]
+    instance.target_type = str(next(iter(target), ""))[:60] if isinstance(target, dict) else ""
+
+
+@receiver(pre_save, sender=ResponseHistory)
+def index_response(sender, instance=None, **kwargs):
+    """
+    Copy the status code of the response to its indexed column
+    :param sender: sender instance - ResponseHistory
+    :param instance: SENDER instance
+    :param kwargs: key/value args
+    :return: None
+    """
+    rsp = instance.response if isinstance(instance.response, dict) else {}
+    status = rsp.get("status")
+    instance.status = status if isinstance(status, int) and not isinstance(status, bool) and 0 <= status <= 32767 else None
+
+
 class ResponseSerializer(serializers.ModelSerializer):
     """
     Command Response API Serializer
@@ -184,12 +436,26 @@ class HistorySerializer(serializers.ModelSerializer):
 
     class Meta:
         model = SentHistory
-        fields = ("command_id", "user", "received_on", "actuators", "command", "responses", "status")
+        fields = ("command_id", "user", "received_on", "actuators", "command", "responses", "status", "expires_on", "expired_on")
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """
+        Load the relations serialized for each command with the commands,
+        so a page of commands is serialized in a constant number of queries
+        :param queryset: commands to serialize
+        :return: queryset with the related objects loaded
+        """
+        return queryset.select_related("user").prefetch_related(
+            Prefetch("actuators", queryset=Actuator.objects.select_related("device")),
+            Prefetch("responsehistory_set", queryset=ResponseHistory.objects.select_related("actuator"))
+        )
 
     def get_status(self, obj):
-        rtn = "processing"
+        rtn = "expired" if obj.expired_on else "processing"
 
-        num_rsps = len(obj.responses)
+        # Counted from the prefetched responses, rather than serializing them
+        num_rsps = len(obj.responsehistory_set.all())
         if num_rsps >= 1:
             rtn = f"processed {num_rsps} response{'s' if num_rsps>1 else ''}"
 
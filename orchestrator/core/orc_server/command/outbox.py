@@ -0,0 +1,274 @@
+"""
+Command outbox relay, publishes the command messages written in the transaction of their command to the transports
+"""
+import copy
+import datetime
+import threading
+import time
+
+from typing import Dict, List, Tuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+# Local imports
+from tracking import log
+from utils import get_expires, mark_trace
+from utils.metrics import REGISTRY
+from .expiry import expire_command
+from .limiter import DispatchLimiter
+from .models import CommandOutbox
+
+PUBLISH_SECONDS = REGISTRY.histogram('orc_amqp_publish_seconds', 'Time to publish a batch of commands to the transport queue', ('routing_key', ))
+OUTBOX_DELAY = REGISTRY.histogram('orc_outbox_delay_seconds', 'Time from a command being queued in the outbox to it being published', ('routing_key', ))
+OUTBOX_FAILURES = REGISTRY.counter('orc_outbox_publish_failures_total', 'Failed publishes of outbox batches', ('routing_key', ))
+OUTBOX_FAILED = REGISTRY.counter('orc_outbox_failed_total', 'Messages set aside after their max publish attempts', ('routing_key', ))
+OUTBOX_DEFERRED = REGISTRY.counter('orc_outbox_deferred_total', 'Command destinations delayed by a device rate limit or in-flight window', ('routing_key', ))
+
+
+class OutboxRelay(threading.Thread):
+    """
+    Publishes pending outbox messages in batches, woken when a command is committed and polling for the rest.
+    Each server process runs a relay, pending messages are locked by the relay publishing them.
+    A message is only published once the earlier messages to its devices are, whichever relay publishes them
+    """
+    def __init__(self, queue, batch_size: int = 200, interval: float = 1, retention: float = 86400, max_attempts: int = 10, max_backoff: float = 300):
+        """
+        :param queue: MessageQueue to publish with
+        :param batch_size: max number of messages published at a time
+        :param interval: time, in seconds, between checks for pending messages
+        :param retention: time, in seconds, published and set aside messages are kept
+        :param max_attempts: failed publishes of a message before it is set aside
+        :param max_backoff: max time, in seconds, between the retries of a failed publish
+        """
+        super().__init__(name='OutboxRelay', daemon=True)
+        self._queue = queue
+        self._batch_size = batch_size
+        self._interval = interval
+        self._retention = retention
+        self._max_attempts = max_attempts
+        self._max_backoff = max_backoff
+        self._wake = threading.Event()
+        self._exit = threading.Event()
+        self._purged = 0
+        self._limiter = DispatchLimiter(recheck=interval)
+        self.start()
+
+    def wake(self) -> None:
+        """
+        Publish pending messages now rather than at the next check
+        """
+        self._wake.set()
+
+    def run(self) -> None:
+        while not self._exit.is_set():
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            try:
+                while self.relay() == self._batch_size:
+                    pass
+                if time.time() - self._purged > min(self._retention, 3600):
+                    self.purge()
+            # TODO: change to more specific exceptions
+            except Exception as e:  # pylint: disable=broad-except
+                log.error(msg=f'Command outbox relay error: {e}')
+                self._exit.wait(self._interval)
+            finally:
+                close_old_connections()
+
+    def relay(self) -> int:
+        """
+        Publish a batch of pending messages and mark them sent, messages that fail to publish are retried after a backoff
+        :return: number of messages published
+        """
+        lock_opts = dict(skip_locked=True) if connection.features.has_select_for_update_skip_locked else {}
+        with transaction.atomic():
+            pending = CommandOutbox.objects.filter(sent_on__isnull=True, failed_on__isnull=True, available_on__lte=timezone.now())
+            rows = list(pending.select_for_update(**lock_opts).order_by('created_on', 'id')[:self._batch_size])
+            if not rows:
+                return 0
+
+            published = time.time()
+            rows = self._hold(rows)
+            rows = self._limit(self._expire(rows, published), published) if rows else rows
+            batches: Dict[str, List[Tuple[str, dict, CommandOutbox]]] = {}
+            for row in rows:
+                headers = row.headers or {}
+                trace = headers.get('source', {}).get('trace')
+                if isinstance(trace, dict) and isinstance(trace.get('hops'), dict):
+                    mark_trace(trace, 'core_published', published)
+                batches.setdefault(row.routing_key, []).append((row.message, headers, row))
+
+            sent, failed = [], []
+            for routing_key, batch in batches.items():
+                try:
+                    with PUBLISH_SECONDS.time(routing_key=routing_key):
+                        self._queue.send_batch([(msg, headers) for msg, headers, _ in batch], routing_key=routing_key)
+                # TODO: change to more specific exceptions
+                except Exception as e:  # pylint: disable=broad-except
+                    OUTBOX_FAILURES.inc(routing_key=routing_key)
+                    log.error(msg=f'Command outbox publish to {routing_key} failed: {e}')
+                    failed.extend(row for _, _, row in batch)
+                    # The destinations were admitted but not sent, their tokens and in-flight slots are returned
+                    self._limiter.refund([
+                        (str(row.command_id), [dest.get('deviceID') for dest in (row.headers or {}).get('destination', [])]) for _, _, row in batch
+                    ])
+                    continue
+
+                sent.extend(row.id for _, _, row in batch)
+                for _, _, row in batch:
+                    OUTBOX_DELAY.observe(published - row.created_on.timestamp(), routing_key=routing_key)
+
+            if sent:
+                CommandOutbox.objects.filter(id__in=sent).update(sent_on=timezone.now())
+            if failed:
+                self._retry(failed)
+        return len(sent)
+
+    def _retry(self, rows: List[CommandOutbox]) -> None:
+        """
+        Delay the messages that failed to publish, the wait doubles with each attempt.
+        Messages past the max attempts are set aside, they stay in the outbox until the retention but are not published
+        :param rows: messages that failed to publish
+        """
+        now = timezone.now()
+        retries: Dict[int, List[int]] = {}
+        for row in rows:
+            attempts = row.attempts + 1
+            if attempts >= self._max_attempts:
+                OUTBOX_FAILED.inc(routing_key=row.routing_key)
+                log.error(msg=f'Command outbox message for {row.command_id} to {row.routing_key} set aside after {attempts} failed publishes')
+            retries.setdefault(attempts, []).append(row.id)
+
+        for attempts, ids in retries.items():
+            if attempts >= self._max_attempts:
+                CommandOutbox.objects.filter(id__in=ids).update(attempts=attempts, failed_on=now)
+            else:
+                backoff = min(self._max_backoff, self._interval * 2 ** attempts)
+                CommandOutbox.objects.filter(id__in=ids).update(attempts=attempts, available_on=now + datetime.timedelta(seconds=backoff))
+
+    def _hold(self, rows: List[CommandOutbox]) -> List[CommandOutbox]:
+        """
+        Hold back the messages to a device with an earlier message still pending, so each device is sent its commands in order.
+        The earlier message may be delayed by a device limit or a failed publish, or locked by another relay, held messages wait until it is available
+        :param rows: pending messages, in publish order
+        :return: messages to publish
+        """
+        last = rows[-1]
+        earlier = CommandOutbox.objects.filter(sent_on__isnull=True, failed_on__isnull=True).filter(
+            Q(created_on__lt=last.created_on) | Q(created_on=last.created_on, id__lt=last.id)
+        ).exclude(id__in=[row.id for row in rows]).values_list('created_on', 'id', 'available_on', 'headers')
+
+        messages = [((created_on, pk), available_on, headers, None) for created_on, pk, available_on, headers in earlier]
+        messages.extend(((row.created_on, row.id), row.available_on, row.headers, row) for row in rows)
+        messages.sort(key=lambda msg: msg[0])
+
+        # Device ID -> time the earliest pending message to the device is available
+        blocked: Dict[str, datetime.datetime] = {}
+        publish, held = [], {}
+        for _, available_on, headers, row in messages:
+            devices = [dest.get('deviceID') for dest in (headers or {}).get('destination', [])]
+            if row is not None:
+                waits = [blocked[dev] for dev in devices if dev in blocked]
+                if not waits:
+                    publish.append(row)
+                    continue
+                available_on = max(waits)
+                held.setdefault(available_on, []).append(row.id)
+            for dev in devices:
+                blocked[dev] = max(blocked.get(dev, available_on), available_on)
+
+        now = timezone.now()
+        for available_on, ids in held.items():
+            if available_on > now:
+                CommandOutbox.objects.filter(id__in=ids).update(available_on=available_on)
+        return publish
+
+    def _expire(self, rows: List[CommandOutbox], now: float) -> List[CommandOutbox]:
+        """
+        Drop the messages past the deadline of their command, they are not published
+        :param rows: pending messages
+        :param now: epoch time of the publish
+        :return: messages to publish
+        """
+        publish, expired = [], []
+        for row in rows:
+            expires = get_expires(row.headers)
+            (expired if expires is not None and expires <= now else publish).append(row)
+
+        for row in expired:
+            expire_command(str(row.command_id), [dest.get('deviceID') for dest in row.headers.get('destination', [])], 'outbox')
+        if expired:
+            CommandOutbox.objects.filter(id__in=[row.id for row in expired]).delete()
+        return publish
+
+    def _limit(self, rows: List[CommandOutbox], now: float) -> List[CommandOutbox]:
+        """
+        Apply the device rate limits and in-flight windows, destinations that must wait are delayed in the outbox
+        :param rows: pending messages, in publish order
+        :param now: epoch time of the publish
+        :return: messages to publish now, limited to their admitted destinations
+        """
+        admitted = self._limiter.admit([
+            (str(row.command_id), [dest.get('deviceID') for dest in (row.headers or {}).get('destination', [])]) for row in rows
+        ], now)
+
+        publish, delayed = [], []
+        for row, waits in zip(rows, admitted):
+            deferred = {dev: wait for dev, wait in waits.items() if wait > 0}
+            if not deferred:
+                publish.append(row)
+                continue
+
+            OUTBOX_DEFERRED.inc(len(deferred), routing_key=row.routing_key)
+            available_on = timezone.now() + datetime.timedelta(seconds=min(deferred.values()))
+            dests = row.headers.get('destination', [])
+            if len(deferred) == len(dests):
+                CommandOutbox.objects.filter(id=row.id).update(available_on=available_on)
+                continue
+
+            # The waiting destinations are split into a new message, the admitted ones are published now
+            headers = copy.deepcopy(row.headers)
+            headers['destination'] = [dest for dest in dests if dest.get('deviceID') in deferred]
+            row.headers['destination'] = [dest for dest in dests if dest.get('deviceID') not in deferred]
+            CommandOutbox.objects.filter(id=row.id).update(headers=row.headers)
+            delayed.append(CommandOutbox(
+                command_id=row.command_id,
+                routing_key=row.routing_key,
+                message=row.message,
+                headers=headers,
+                created_on=row.created_on,
+                available_on=available_on
+            ))
+            publish.append(row)
+
+        CommandOutbox.objects.bulk_create(delayed)
+        return publish
+
+    def purge(self) -> int:
+        """
+        Remove the messages published or set aside longer ago than the retention
+        :return: number of messages removed
+        """
+        self._purged = time.time()
+        before = timezone.now() - datetime.timedelta(seconds=self._retention)
+        removed, _ = CommandOutbox.objects.filter(Q(sent_on__lt=before) | Q(failed_on__lt=before)).delete()
+        return removed
+
+    def shutdown(self) -> None:
+        """
+        Stop the relay, pending messages are published by another relay or on restart
+        """
+        self._exit.set()
+        self._wake.set()
+
+
+def notify_relay() -> None:
+    """
+    Wake the relay of the process, called once a transaction with outbox messages is committed
+    """
+    relay = getattr(settings, 'OUTBOX_RELAY', None)
+    if relay is not None:
+        relay.wake()
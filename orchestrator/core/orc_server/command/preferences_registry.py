@@ -1,5 +1,5 @@
 from django.forms import ValidationError
-from dynamic_preferences.types import IntegerPreference
+from dynamic_preferences.types import FloatPreference, IntegerPreference
 from dynamic_preferences.preferences import Section
 from dynamic_preferences.registries import global_preferences_registry as global_registry
 
@@ -28,3 +28,159 @@ class CommandWait(IntegerPreference):
 
         if value > 30:
             raise ValidationError('Wait cannot be greater than 30 seconds')
+
+
+@global_registry.register
+class RetentionDays(IntegerPreference):
+    """
+    Dynamic Preference for the command history retention age
+    Commands older than the retention are moved to the history archive
+    """
+    section = command
+    name = 'retention_days'
+    help_text = 'The age, in days, after which commands and their responses are archived, 0 to keep all commands'
+    default = 0
+
+    def validate(self, value):
+        """
+        Validate the retention when updated
+        :param value: new value to validate
+        :return: None/exception
+        """
+        if value < 0:
+            raise ValidationError('Retention cannot be less than 0 days')
+
+
+@global_registry.register
+class RetentionRows(IntegerPreference):
+    """
+    Dynamic Preference for the command history row cap
+    The oldest commands over the cap are moved to the history archive
+    """
+    section = command
+    name = 'retention_rows'
+    help_text = 'The max number of commands kept in the history, older commands and their responses are archived, 0 for no limit'
+    default = 0
+
+    def validate(self, value):
+        """
+        Validate the row cap when updated
+        :param value: new value to validate
+        :return: None/exception
+        """
+        if value < 0:
+            raise ValidationError('Row cap cannot be less than 0')
+
+
+@global_registry.register
+class CommandTTL(IntegerPreference):
+    """
+    Dynamic Preference for the default command time to live
+    Time after which a command not yet sent is dropped, for commands without a start/stop time or duration
+    """
+    section = command
+    name = 'ttl'
+    help_text = 'The time, in seconds, a command without its own deadline can wait to be sent before it expires, 0 to never expire (0-86400 seconds)'
+    default = 0
+
+    def validate(self, value):
+        """
+        Validate the time to live when updated
+        :param value: new value to validate
+        :return: None/exception
+        """
+        if value < 0:
+            raise ValidationError('Time to live cannot be less than 0 seconds')
+
+        if value > 86400:
+            raise ValidationError('Time to live cannot be greater than 86400 seconds')
+
+
+@global_registry.register
+class DeviceRate(FloatPreference):
+    """
+    Dynamic Preference for the default device rate limit
+    Max commands per second sent to a device without its own limit
+    """
+    section = command
+    name = 'device_rate'
+    help_text = 'The max commands per second sent to a device without its own rate limit, 0 for unlimited'
+    default = 0.0
+
+    def validate(self, value):
+        """
+        Validate the rate when updated
+        :param value: new value to validate
+        :return: None/exception
+        """
+        if value < 0:
+            raise ValidationError('Rate cannot be less than 0')
+
+
+@global_registry.register
+class DeviceBurst(IntegerPreference):
+    """
+    Dynamic Preference for the default device rate burst
+    Max commands sent to a device at once within its rate limit
+    """
+    section = command
+    name = 'device_burst'
+    help_text = 'The max commands sent to a device at once within its rate limit (1-1000)'
+    default = 10
+
+    def validate(self, value):
+        """
+        Validate the burst when updated
+        :param value: new value to validate
+        :return: None/exception
+        """
+        if value < 1:
+            raise ValidationError('Burst cannot be less than 1')
+
+        if value > 1000:
+            raise ValidationError('Burst cannot be greater than 1000')
+
+
+@global_registry.register
+class DeviceInFlight(IntegerPreference):
+    """
+    Dynamic Preference for the default device in-flight window
+    Max commands awaiting a response from a device without its own limit
+    """
+    section = command
+    name = 'device_in_flight'
+    help_text = 'The max commands awaiting a response from a device without its own limit, 0 for unlimited'
+    default = 0
+
+    def validate(self, value):
+        """
+        Validate the window when updated
+        :param value: new value to validate
+        :return: None/exception
+        """
+        if value < 0:
+            raise ValidationError('In-flight window cannot be less than 0')
+
+
+@global_registry.register
+class InFlightTimeout(IntegerPreference):
+    """
+    Dynamic Preference for the in-flight timeout
+    Time after which a command without a response no longer counts against the in-flight window of its device
+    """
+    section = command
+    name = 'in_flight_timeout'
+    help_text = 'The time, in seconds, a command without a response counts against the in-flight window of its device (1-3600 seconds)'
+    default = 30
+
+    def validate(self, value):
+        """
+        Validate the timeout when updated
+        :param value: new value to validate
+        :return: None/exception
+        """
+        if value < 1:
+            raise ValidationError('Timeout cannot be less than 1 second')
+
+        if value > 3600:
+            raise ValidationError('Timeout cannot be greater than 3600 seconds')
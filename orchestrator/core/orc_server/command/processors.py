@@ -1,12 +1,61 @@
 import random
+import time
 
 # Local imports
 from actuator.models import Actuator
 from orchestrator.models import Protocol
 from tracking import log
-from utils import decode_msg, get_or_none, isHex, safe_cast
+from utils import decode_msg, get_or_none, isHex, mark_trace, safe_cast, EXPIRED_KEY
+from utils.metrics import REGISTRY
+from .counters import STATS
+from .expiry import expire_command
+from .limiter import release_devices, release_in_flight
 from .models import SentHistory, ResponseHistory
 
+RESPONSES = REGISTRY.counter('orc_responses_total', 'Responses received from actuators', ('transport', 'outcome'))
+RESPONSE_LATENCY = REGISTRY.histogram('orc_response_latency_seconds', 'Time from receiving a command to receiving a response', ('transport', ))
+CONSUMER_LAG = REGISTRY.histogram('orc_response_consumer_lag_seconds', 'Time from the transport receiving a response to the core consuming it', ('transport', ))
+
+
+def command_message(body, message):
+    """
+    Process a message from the transports, a response or a command dropped as expired
+    :param body: message body
+    :param message: complete message (headers, meta, ...)
+    :return: None
+    """
+    if getattr(message, 'delivery_info', {}).get('routing_key') == EXPIRED_KEY:
+        command_expired(body, message)
+    else:
+        command_response(body, message)
+
+
+def command_expired(body, message):
+    """
+    Process a command dropped as expired, by the broker once its TTL passed or by a transport before sending it
+    :param body: command body
+    :param message: complete message (headers, meta, ...)
+    :return: None
+    """
+    headers = getattr(message, 'headers', {}) or {}
+    correlation_ID = headers.get('source', {}).get('correlationID', '')
+    opts = {
+        '_coap_id' if isHex(correlation_ID) else 'command_id': correlation_ID
+    }
+
+    command = get_or_none(SentHistory, **opts)
+    if command is None:
+        log.error(msg=f'Expired message for an unknown command: {correlation_ID}')
+        return
+
+    # Dead-lettered by the broker messages carry the reason they were dropped
+    stage = 'broker' if 'x-death' in headers else 'transport'
+    try:
+        expire_command(str(command.command_id), [dest.get('deviceID') for dest in headers.get('destination', [])], stage)
+    # TODO: change to more specific exceptions
+    except Exception as e:  # pylint: disable=broad-except
+        log.error(msg=f'Expired command failed to save: {e}')
+
 
 def command_response(body, message):
     """
@@ -15,9 +64,13 @@ def command_response(body, message):
     :param message: complete message (headers, meta, ...)
     :return: None
     """
+    received = time.time()
     log.info(msg=f'Message response received: {body}')
     headers = getattr(message, "headers", {})
     actuator = None
+    # Untraced commands have no trace, or a null trace from older transports
+    trace = headers.get('trace')
+    trace = trace if isinstance(trace, dict) and isinstance(trace.get('hops'), dict) else None
 
     if headers.get('error', False):
         correlation_ID = headers['source'].get('correlationID', '')
@@ -57,9 +110,23 @@ def command_response(body, message):
             log.warn(msg=f'Multiple actuators match for command response - {command.command_id}')
             actuator = random.choice(actuator)
 
+    transport = headers.get('transport', '') or headers.get('source', {}).get('transport', {}).get('type', '')
+    RESPONSES.inc(transport=transport, outcome='error' if headers.get('error', False) else 'response')
+    if command is not None:
+        RESPONSE_LATENCY.observe(received - command.received_on.timestamp(), transport=transport)
+    if trace and 'transport_responded' in trace['hops']:
+        CONSUMER_LAG.observe(received - trace['hops']['transport_responded'], transport=transport)
+
     try:
-        cmd_rsp = ResponseHistory(command=command, actuator=actuator, response=response)
+        cmd_rsp = ResponseHistory(command=command, actuator=actuator, response=response, trace=mark_trace(trace, 'core_response_received', received))
         cmd_rsp.save()
+        STATS.add('response', cmd_rsp.received_on, protocol=transport, profile=getattr(actuator, 'profile', ''), status=cmd_rsp.status)
+
+        # Free the in-flight slot of the device once the response is saved, error responses are for the destinations in their headers
+        if command is not None and actuator is not None:
+            release_in_flight(str(command.command_id), actuator.device_id)
+        elif command is not None and headers.get('error', False):
+            release_devices(str(command.command_id), [dest.get('deviceID') for dest in headers.get('destination', [])])
     # TODO: change to more specific exceptions
     except Exception as e:  # pylint: disable=broad-except
         log.error(msg=f'Message response failed to save: {e}')
@@ -0,0 +1,53 @@
+import uuid
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+# Local imports
+from actuator.models import Actuator
+from device.models import Device
+from .models import ResponseHistory, SentHistory
+
+PAGE_SIZE = 100
+
+
+class HistoryQueryCountTests(TestCase):
+    """
+    A page of the command history is serialized in a constant number of queries, however many actuators and responses its commands have
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('history_admin', password='history_admin', is_staff=True)
+        device = Device.objects.create(device_id=uuid.uuid4(), name='history-device')
+        actuators = [
+            Actuator.objects.create(actuator_id=uuid.uuid4(), name=f'history-act{idx}', device=device, schema={'meta': {'title': 'history test'}})
+            for idx in range(3)
+        ]
+
+        for idx in range(PAGE_SIZE):
+            command = SentHistory.objects.create(user=cls.user, command={'action': 'query', 'target': {'features': []}, 'args': {'idx': idx}})
+            command.actuators.set(actuators)
+            ResponseHistory.objects.bulk_create([
+                ResponseHistory(command=command, actuator=act, status=200, response={'status': 200}) for act in actuators
+            ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertPageQueries(self, url: str, queries: int):
+        # Count, page, actuators and responses
+        with self.assertNumQueries(queries):
+            rsp = self.client.get(url, {'length': PAGE_SIZE})
+        self.assertEqual(rsp.status_code, 200)
+        results = rsp.data['results']
+        self.assertEqual(len(results), PAGE_SIZE)
+        self.assertTrue(all(len(cmd['actuators']) == 3 and len(cmd['responses']) == 3 for cmd in results))
+
+    def test_history_list(self):
+        self.assertPageQueries('/api/command/', 4)
+
+    def test_user_history_list(self):
+        # The user of the history is looked up before the page
+        self.assertPageQueries(f'/api/account/{self.user.username}/history/', 5)
@@ -1,21 +1,29 @@
 import bleach
 import json
 import time
-import uuid
+
+from typing import Dict, List, Tuple
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
-from dynamic_preferences.registries import global_preferences_registry
+from django.db import transaction
+from django.utils import timezone
 
 # Local imports
 from actuator.models import Actuator, ActuatorProfile
 from device.models import Device
 from orchestrator.models import Protocol, Serialization
+from orchestrator.reference import REFERENCE
 from tracking import log
-from utils import get_or_none, safe_cast
-from ..models import SentHistory, ResponseHistory
+from utils import fork_trace, get_or_none, new_trace, safe_cast, shard_routing_key, uuid7
+from utils.metrics import REGISTRY
+from ..admission import check_quotas, check_transports
+from ..counters import STATS
+from ..expiry import command_deadline
+from ..models import CommandOutbox, SentHistory, ResponseHistory
+from ..outbox import notify_relay
 
-global_preferences = global_preferences_registry.manager()
+COMMANDS_SENT = REGISTRY.counter('orc_commands_sent_total', 'Commands sent to actuators', ('protocol', 'profile'))
 
 
 class Validator:
@@ -139,15 +147,50 @@ class Validator:
 
                 serial = self._channel.get("serialization", None)
                 if serial:
-                    serial = get_or_none(Serialization, name=bleach.clean(str(serial)))
+                    serial = REFERENCE.serialization(bleach.clean(str(serial)))
 
                 return proto, serial
         return None, None
 
 
+def routing_key(proto: Protocol) -> str:
+    """
+    Routing key of the transport of a protocol
+    :param proto: protocol
+    :return: routing key
+    """
+    return proto.name.lower().replace(" ", "_")
+
+
+def shard_key(proto: Protocol, device_id) -> str:
+    """
+    Routing key of the transport shard of a device, the transport routing key if the transport is not sharded
+    :param proto: protocol
+    :param device_id: ID of the device
+    :return: routing key
+    """
+    key = routing_key(proto)
+    return shard_routing_key(key, str(device_id), settings.TRANSPORT_SHARDS.get(key, settings.TRANSPORT_SHARDS["default"]))
+
+
+def shard_messages(proto: Protocol, headers: dict) -> List[Tuple[str, dict]]:
+    """
+    Split the headers of a command by the transport shard of each destination device
+    :param proto: protocol
+    :param headers: command headers
+    :return: routing key, headers pairs
+    """
+    shards: Dict[str, list] = {}
+    for dest in headers["destination"]:
+        shards.setdefault(shard_key(proto, dest["deviceID"]), []).append(dest)
+    if len(shards) == 1:
+        return [(key, headers) for key in shards]
+    return [(key, dict(headers, destination=dests)) for key, dests in shards.items()]
+
+
 def get_headers(proto: Protocol, com: SentHistory, proto_acts, serial: Serialization):
-    orc_ip = global_preferences.get("orchestrator__host", "127.0.0.1")
-    orc_id = global_preferences.get("orchestrator__id", "")
+    orc_ip = REFERENCE.preference("orchestrator__host", "127.0.0.1")
+    orc_id = REFERENCE.preference("orchestrator__id", "")
     corr_id = com.coap_id or str(com.command_id)
 
     headers = dict(
@@ -162,6 +205,8 @@ def get_headers(proto: Protocol, com: SentHistory, proto_acts, serial: Serializa
         ),
         destination=[]
     )
+    if com.expires_on:
+        headers["source"]["expires"] = com.expires_on.timestamp()
 
     for act in proto_acts:
         com.actuators.add(act)
@@ -187,6 +232,10 @@ def get_headers(proto: Protocol, com: SentHistory, proto_acts, serial: Serializa
                     topic=trans.topic,
                     channel=trans.channel
                 )
+            if trans.group:
+                dest.update(
+                    group=trans.group
+                )
 
             headers["destination"].append(dest)
     return headers
@@ -200,12 +249,14 @@ def action_send(usr, cmd: dict, actuator: str, channel: dict):
     :param actuator: actuator/profile receiving command
     :param channel: serialization & protocol to send the command
     :return: response Tuple(dict, int)
+    :raise Throttled: a quota is exceeded or a transport queue is full
+    :raise TransportUnavailable: a transport is not running or is lagging
     """
     val = Validator(usr, cmd, actuator, channel)
     actuators, protocol, serialization = val.validate()
 
     # Store command in db
-    cmd_id = cmd.get("id", uuid.uuid4())
+    cmd_id = cmd.get("id", uuid7())
     if get_or_none(SentHistory, command_id=cmd_id):
         return dict(
             command_id=[
@@ -214,37 +265,65 @@ def action_send(usr, cmd: dict, actuator: str, channel: dict):
         ), 400
 
     com = SentHistory(command_id=cmd_id, user=usr, command=cmd)
-    try:
-        com.save()
-    except ValueError as e:
+    # Trace the command through the transports, the hops are persisted with the command and its responses
+    com.trace = new_trace(str(com.command_id), core_received=com.received_on.timestamp())
+    com.expires_on = command_deadline(cmd, com.received_on)
+    if com.expires_on and com.expires_on <= timezone.now():
         return dict(
-            detail="command error",
-            response=str(e)
+            detail="command expired",
+            response="Command Expired: the stop time of the command has passed"
         ), 400
 
     # Process Actuators that should receive command
     processed_acts = set()
-
-    # Process Protocols
-    for proto in [protocol] if protocol else Protocol.objects.all():
+    proto_groups = []
+    for proto in [protocol] if protocol else REFERENCE.protocols:
         proto_acts = [a for a in actuators if a.device.transport.filter(protocol__name=proto.name).exists()]
         proto_acts = list(filter(lambda a: a.id not in processed_acts, proto_acts))
         processed_acts.update({act.id for act in proto_acts})
-
         if len(proto_acts) >= 1:
-            if proto.name.lower() == "coap" and com.coap_id == b"":
-                com.gen_coap_id()
-                com.save()
-
-            # Send command to transport
-            log.info(usr=usr, msg=f"Send command {com.command_id}/{com.coap_id.hex()} to buffer")
-            settings.MESSAGE_QUEUE.send(
-                msg=json.dumps(cmd),
-                headers=get_headers(proto, com, proto_acts, serialization),
-                routing_key=proto.name.lower().replace(" ", "_")
-            )
+            proto_groups.append((proto, proto_acts))
+
+    # Reject the command before it is persisted if a quota is exceeded or a transport is falling behind
+    check_quotas(usr, [act.profile for _, proto_acts in proto_groups for act in proto_acts])
+    check_transports([shard_key(proto, act.device.device_id) for proto, proto_acts in proto_groups for act in proto_acts])
+
+    if any(proto.name.lower() == "coap" for proto, _ in proto_groups):
+        com.gen_coap_id()
+
+    # The command and its messages are committed together, the outbox relay publishes the messages to the transports
+    try:
+        with transaction.atomic():
+            com.save()
+            # Serialize once, the same message is sent to each protocol
+            msg = json.dumps(cmd)
+            outbox = []
+            for proto, proto_acts in proto_groups:
+                log.info(usr=usr, msg=f"Send command {com.command_id}/{com.coap_id.hex()} to buffer")
+                headers = get_headers(proto, com, proto_acts, serialization)
+                for key, shard_headers in shard_messages(proto, headers):
+                    shard_headers["source"] = dict(shard_headers["source"], trace=fork_trace(com.trace))
+                    outbox.append(CommandOutbox(
+                        command=com,
+                        routing_key=key,
+                        message=msg,
+                        headers=shard_headers
+                    ))
+            CommandOutbox.objects.bulk_create(outbox)
+            transaction.on_commit(notify_relay)
+    except ValueError as e:
+        return dict(
+            detail="command error",
+            response=str(e)
+        ), 400
+
+    STATS.add('command', com.received_on, action=com.action, target_type=com.target_type)
+    for proto, proto_acts in proto_groups:
+        for act in proto_acts:
+            COMMANDS_SENT.inc(protocol=proto.name, profile=act.profile)
+            STATS.add('dispatch', com.received_on, protocol=proto.name, profile=act.profile)
 
-    wait = safe_cast(global_preferences.get("command__wait", 1), int, 1)
+    wait = safe_cast(REFERENCE.preference("command__wait", 1), int, 1)
     rsp = None
     for _ in range(wait):
         rsp = get_or_none(ResponseHistory, command=com)
@@ -1,8 +1,26 @@
-from ..models import SentHistory, ResponseHistory
+from django.db.models import Count
 
+from ..counters import command_stats
+from ..models import ResponseHistory
+
+
+def app_stats(queryset=None):
+    """
+    Command and response counts, in total and by action, target type and response status.
+    All commands are counted from the cached stats counters, filtered commands are grouped on the indexed columns
+    :param queryset: commands to count, default all commands
+    :return: command stats
+    """
+    if queryset is None or not queryset.query.where:
+        return command_stats()
+
+    commands = queryset.order_by()
+    responses = ResponseHistory.objects.filter(command__in=commands.values('pk'))
 
-def app_stats():
     return dict(
-        sent=SentHistory.objects.count(),
-        responses=ResponseHistory.objects.count()
+        sent=commands.count(),
+        responses=responses.count(),
+        actions={row['action']: row['count'] for row in commands.values('action').annotate(count=Count('pk')).order_by()},
+        targets={row['target_type']: row['count'] for row in commands.values('target_type').annotate(count=Count('pk')).order_by()},
+        statuses={row['status']: row['count'] for row in responses.values('status').annotate(count=Count('pk')).order_by()}
     )
@@ -0,0 +1,74 @@
+"""
+Command latency breakdown from the hop timestamps traced through the core, queue, transport and actuator
+"""
+from ..models import SentHistory, ResponseHistory
+
+# Segment name -> start hop, end hop
+SEGMENTS = {
+    "core": ("core_received", "core_published"),
+    "queue_wait": ("core_published", "transport_received"),
+    "encode": ("transport_received", "transport_encoded"),
+    "dispatch": ("transport_encoded", "transport_sent"),
+    "device": ("transport_sent", "transport_responded"),
+    "response_queue_wait": ("transport_responded", "core_response_received"),
+    "total": ("core_received", "core_response_received"),
+}
+
+
+def duration(hops: dict, start: str, end: str):
+    """
+    Milliseconds between two hops
+    :param hops: hop name -> epoch timestamp
+    :param start: start hop
+    :param end: end hop
+    :return: duration in milliseconds, None if either hop was not traced
+    """
+    if start in hops and end in hops:
+        return round((hops[end] - hops[start]) * 1000, 3)
+    return None
+
+
+def response_trace(command_trace: dict, response: ResponseHistory) -> dict:
+    """
+    Latency breakdown of a single response, the hops of the command are joined with those of the response
+    :param command_trace: trace of the command
+    :param response: command response
+    :return: response trace
+    """
+    trace = response.trace or {}
+    hops = dict(command_trace.get("hops", {}), **trace.get("hops", {}))
+    hops.setdefault("core_response_received", response.received_on.timestamp())
+
+    segments = {name: duration(hops, *span) for name, span in SEGMENTS.items()}
+    actuator_ms = trace.get("actuator_ms")
+    segments.update(
+        actuator=actuator_ms,
+        # The network time includes the actuator time if the device did not report it
+        network=None if segments["device"] is None else round(segments["device"] - (actuator_ms or 0), 3)
+    )
+
+    return dict(
+        actuator=str(response.actuator.actuator_id) if response.actuator else None,
+        received_on=response.received_on,
+        error=isinstance(response.response, dict) and "error" in response.response,
+        hops={hop: ts for hop, ts in sorted(hops.items(), key=lambda h: h[1])},
+        segments_ms=segments
+    )
+
+
+def command_trace(command: SentHistory) -> dict:
+    """
+    Latency breakdown of a command and each of its responses
+    :param command: sent command
+    :return: command trace
+    """
+    trace = command.trace or {}
+    trace.setdefault("hops", {}).setdefault("core_received", command.received_on.timestamp())
+
+    return dict(
+        command_id=command.command_id,
+        trace_id=trace.get("traceID", str(command.command_id)),
+        received_on=command.received_on,
+        hops=trace["hops"],
+        responses=[response_trace(trace, rsp) for rsp in ResponseHistory.objects.filter(command=command).select_related("actuator").order_by("received_on")]
+    )
@@ -1,6 +1,7 @@
 import coreapi
 import coreschema
 
+from django.http import Http404
 from rest_framework import viewsets, filters
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.decorators import action
@@ -10,6 +11,10 @@ from rest_framework.response import Response
 # Local imports
 import utils
 from .actions import action_send
+from .stats import app_stats
+from .trace import command_trace
+from ..archive import archived_command
+from ..filters import HistoryFilter
 from ..models import SentHistory, HistorySerializer
 
 
@@ -29,11 +34,15 @@ class HistoryViewSet(viewsets.ModelViewSet):
         'update': (IsAdminUser,),
         # Custom Views
         'send': (IsAuthenticated,),
+        'stats': (IsAuthenticated,),
+        'trace': (IsAuthenticated,),
     }
 
-    queryset = SentHistory.objects.order_by('-received_on')
-    filter_backends = (filters.OrderingFilter,)
+    queryset = HistorySerializer.setup_eager_loading(SentHistory.objects.order_by('-received_on'))
+    filter_backends = (filters.OrderingFilter, HistoryFilter)
     ordering_fields = ('command_id', 'user', 'received_on', 'actuators', 'status', 'details')
+    # Keyset pagination with `?cursor=`, newest first
+    cursor_ordering = ('-received_on', '-pk')
 
     schema = utils.OrcSchema(
         send_fields=[
@@ -83,9 +92,18 @@ class HistoryViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         """
-        Return a specific command that the user has executed, command if admin
+        Return a specific command that the user has executed, command if admin, from the archive if no longer in the history
         """
-        command = self.get_object()
+        try:
+            command = self.get_object()
+        except Http404:
+            archived = archived_command(kwargs.get(self.lookup_field))
+            if archived is None:
+                raise
+            entry, record = archived
+            if not request.user.is_staff and entry.user_id != request.user.pk:
+                raise PermissionDenied(detail='User not authorised to access command', code=401)
+            return Response(record)
 
         if not request.user.is_staff:  # Standard User
             if command.user is not request.user:
@@ -107,3 +125,28 @@ class HistoryViewSet(viewsets.ModelViewSet):
         )
 
         return Response(*rslt)
+
+    @action(methods=['GET'], detail=False)
+    def stats(self, request, *args, **kwargs):
+        """
+        Return the counts of the commands that the user has executed, all commands if admin, by action, target type and response status
+        """
+        queryset = HistoryFilter().filter_queryset(request, SentHistory.objects.all(), self)
+
+        if not request.user.is_staff:  # Standard User
+            queryset = queryset.filter(user=request.user)
+
+        return Response(app_stats(queryset))
+
+    @action(methods=['GET'], detail=True)
+    def trace(self, request, *args, **kwargs):
+        """
+        Return the latency breakdown of a command and its responses
+        """
+        command = self.get_object()
+
+        if not request.user.is_staff:  # Standard User
+            if command.user != request.user:
+                raise PermissionDenied(detail='User not authorised to access command', code=401)
+
+        return Response(command_trace(command))
@@ -16,7 +16,7 @@ class DeviceAdmin(admin.ModelAdmin):
     Device model admin
     """
     readonly_fields = ('device_id', )
-    list_display = ('device_id', 'name', )
+    list_display = ('device_id', 'name', 'rate_limit', 'max_in_flight', )
     filter_horizontal = ('transport',)
 
 
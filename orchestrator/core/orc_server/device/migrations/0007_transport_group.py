@@ -0,0 +1,18 @@
+# Generated by Django 2.2.10 on 2026-10-19 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0006_auto_20200219_1634'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transport',
+            name='group',
+            field=models.CharField(blank=True, default='', help_text='Multicast group (IP:Port) the device is a member of, only used for CoAP group communication', max_length=60),
+        ),
+    ]
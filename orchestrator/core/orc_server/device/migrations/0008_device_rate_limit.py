@@ -0,0 +1,29 @@
+# Generated by Django 2.2.10 on 2026-10-19 17:30
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('device', '0007_transport_group'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='max_in_flight',
+            field=models.PositiveIntegerField(blank=True, help_text='Max commands awaiting a response from the device, 0 for unlimited, empty for the orchestrator default', null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='rate_burst',
+            field=models.PositiveIntegerField(blank=True, help_text='Max commands sent to the device at once within the rate limit, empty for the orchestrator default', null=True),
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='rate_limit',
+            field=models.FloatField(blank=True, help_text='Max commands per second sent to the device, 0 for unlimited, empty for the orchestrator default', null=True, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+    ]
@@ -4,7 +4,7 @@ from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models.signals import m2m_changed, post_delete
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.db.models.query import QuerySet
 from django.db.utils import IntegrityError
 from django.dispatch import receiver
@@ -14,7 +14,7 @@ from rest_framework import serializers
 
 # Local imports
 from orchestrator.models import Protocol, Serialization
-from utils import get_or_none, prefixUUID
+from utils import get_or_none, invalidate_responses, prefixUUID
 
 
 def defaultName():
@@ -76,6 +76,12 @@ class Transport(models.Model):
         help_text="Channel for the specific device, only necessary for Pub/Sub protocols",
         max_length=30
     )
+    group = models.CharField(
+        blank=True,
+        default="",
+        help_text="Multicast group (IP:Port) the device is a member of, only used for CoAP group communication",
+        max_length=60
+    )
 
     def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
         """
@@ -120,6 +126,22 @@ class Device(models.Model):
         help_text="Extra information about the device",
         null=True
     )
+    rate_limit = models.FloatField(
+        blank=True,
+        help_text="Max commands per second sent to the device, 0 for unlimited, empty for the orchestrator default",
+        null=True,
+        validators=[MinValueValidator(0)]
+    )
+    rate_burst = models.PositiveIntegerField(
+        blank=True,
+        help_text="Max commands sent to the device at once within the rate limit, empty for the orchestrator default",
+        null=True
+    )
+    max_in_flight = models.PositiveIntegerField(
+        blank=True,
+        help_text="Max commands awaiting a response from the device, 0 for unlimited, empty for the orchestrator default",
+        null=True
+    )
 
     @property
     def url_name(self):
@@ -204,6 +226,23 @@ def verify_unique(sender, instance=None, **kwargs):
             trans.delete()
 
 
+@receiver([post_save, post_delete], sender=Device)
+@receiver([post_save, post_delete], sender=Transport)
+@receiver([post_save, post_delete], sender=Protocol)
+@receiver([post_save, post_delete], sender=Serialization)
+@receiver(m2m_changed, sender=Device.transport.through)
+@receiver(m2m_changed, sender=Transport.serialization.through)
+def device_changed(sender, **kwargs):
+    """
+    Invalidate the cached device responses, and the actuator responses that nest them
+    :param sender: model "sending" the action - Device, Transport, Protocol, Serialization or their relations
+    :param kwargs: key/value args
+    :return: None
+    """
+    if kwargs.get("action", "post_").startswith("post_"):
+        invalidate_responses("device")
+
+
 class TransportSerializer(serializers.ModelSerializer):
     """
     Transport API Serializer
@@ -217,6 +256,7 @@ class TransportSerializer(serializers.ModelSerializer):
     )
     topic = serializers.CharField(max_length=30, default="topic")
     channel = serializers.CharField(max_length=30, default="channel")
+    group = serializers.CharField(allow_blank=True, max_length=60, default="")
     pub_sub = serializers.SerializerMethodField()
     serialization = serializers.SlugRelatedField(
         queryset=Serialization.objects.all(),
@@ -226,7 +266,7 @@ class TransportSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Transport
-        fields = ("transport_id", "host", "port", "protocol", "topic", "channel", "pub_sub", "serialization")
+        fields = ("transport_id", "host", "port", "protocol", "topic", "channel", "group", "pub_sub", "serialization")
 
     def get_pub_sub(self, obj):
         ps = obj.protocol.pub_sub
@@ -241,7 +281,10 @@ class DeviceSerializer(QueryFieldsMixin, WritableNestedModelSerializer):
     transport = TransportSerializer(many=True)
     # schema = serializers.JSONField(required=False)
     note = serializers.CharField(allow_blank=True)
+    rate_limit = serializers.FloatField(allow_null=True, default=None, min_value=0)
+    rate_burst = serializers.IntegerField(allow_null=True, default=None, min_value=0)
+    max_in_flight = serializers.IntegerField(allow_null=True, default=None, min_value=0)
 
     class Meta:
         model = Device
-        fields = ("device_id", "name", "transport", "note")
+        fields = ("device_id", "name", "transport", "note", "rate_limit", "rate_burst", "max_in_flight")
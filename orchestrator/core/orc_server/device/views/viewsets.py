@@ -7,6 +7,8 @@ from rest_framework.exceptions import PermissionDenied
 from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 
+# Local imports
+from utils import cached_response
 from ..models import Device, DeviceSerializer
 
 
@@ -21,6 +23,8 @@ class DeviceViewSet(viewsets.ModelViewSet):
     queryset = Device.objects.order_by('name')
     filter_backends = (filters.OrderingFilter,)
     ordering_fields = ('name', 'host', 'port', 'protocol', 'serialization', 'type')
+    # Keyset pagination with `?cursor=`
+    cursor_ordering = ('name', 'pk')
 
     permissions = {
         'create':  (IsAdminUser,),
@@ -35,6 +39,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
         """
         return [permission() for permission in self.permissions.get(self.action, self.permission_classes)]
 
+    @cached_response('device')
     def list(self, request, *args, **kwargs):
         """
         Return a list of all actuators that the user has permissions for
@@ -59,6 +64,7 @@ class DeviceViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
 
+    @cached_response('device')
     def retrieve(self, request, *args, **kwargs):
         """
         Return a specific actuators that the user has permissions for
@@ -3,14 +3,22 @@ import string
 from django.db.models import signals, Model
 from django.db.models.fields.related import ForeignKey, ManyToManyField
 from elasticsearch.exceptions import NotFoundError
+from elasticsearch.helpers import bulk
 from elasticsearch_dsl import connections, Document, Field, Nested, Object
 from typing import (
     Dict,
+    Iterable,
     List,
     Tuple,
     Union
 )
 
+from utils.metrics import REGISTRY
+
+# Mirroring is synchronous with the model signals, pending counts the saves/deletes in flight
+MIRROR_PENDING = REGISTRY.gauge('orc_es_mirror_pending', 'Elasticsearch mirror operations in flight', ('operation', ))
+MIRROR_SECONDS = REGISTRY.histogram('orc_es_mirror_seconds', 'Time to mirror a model operation to Elasticsearch', ('operation', ))
+
 
 FIELDS = Union[str, Union[None, 'FIELDS']]
 _ignore_keys = [
@@ -96,19 +104,44 @@ class ElasticHooks:
     def handle_save(self, sender, instance=None, **kwargs):
         # print(f"{sender.__name__} save")
         if self._mirror:
-            doc = self._check_mirror(sender)
-            d = doc.model_init(instance)
-            d.save(index=self._prefix_index(doc.Index.name))
+            MIRROR_PENDING.inc(operation='save')
+            try:
+                with MIRROR_SECONDS.time(operation='save'):
+                    doc = self._check_mirror(sender)
+                    d = doc.model_init(instance)
+                    d.save(index=self._prefix_index(doc.Index.name))
+            finally:
+                MIRROR_PENDING.dec(operation='save')
 
     def handle_delete(self, sender, instance=None, **kwargs):
         # print(f"{sender.__name__} delete")
         if self._mirror:
-            doc = self._check_mirror(sender)
-            d = doc.model_init(instance)
+            MIRROR_PENDING.inc(operation='delete')
             try:
-                d.delete(index=self._prefix_index(doc.Index.name))
+                with MIRROR_SECONDS.time(operation='delete'):
+                    doc = self._check_mirror(sender)
+                    d = doc.model_init(instance)
+                    d.delete(index=self._prefix_index(doc.Index.name))
             except (NotFoundError, TypeError):
                 pass
+            finally:
+                MIRROR_PENDING.dec(operation='delete')
+
+    def bulk_save(self, model, instances: Iterable[Model]) -> None:
+        """
+        Mirror instances saved without their model signals, such as by a bulk create, in one request
+        :param model: model of the instances
+        :param instances: saved instances, not evaluated if the model is not mirrored
+        """
+        if self._mirror and model in self._models:
+            MIRROR_PENDING.inc(operation='bulk')
+            try:
+                with MIRROR_SECONDS.time(operation='bulk'):
+                    doc = self._check_mirror(model)
+                    index = self._prefix_index(doc.Index.name)
+                    bulk(connections.get_connection(), (dict(doc.model_init(i).to_dict(include_meta=True), _index=index) for i in instances))
+            finally:
+                MIRROR_PENDING.dec(operation='bulk')
 
     def handle_m2m_changed(self, sender, instance, action, **kwargs):
         if action.startswith('post_') and self._mirror:
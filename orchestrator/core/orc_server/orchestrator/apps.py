@@ -5,6 +5,7 @@ from django.apps import AppConfig
 from django.conf import settings
 
 from utils import MessageQueue
+from utils.metrics import REGISTRY
 
 
 class OrchestratorConfig(AppConfig):
@@ -20,11 +21,20 @@ class OrchestratorConfig(AppConfig):
         App ready, init runtime objects
         :return: None
         """
+        # Connect the reference data signals in every process, so changes made by any command invalidate the server snapshots
+        from . import reference  # noqa: F401 pylint: disable=import-outside-toplevel,unused-import
         if all(state not in sys.argv for state in self._FALSE_READY):
             return
 
-        from command.processors import command_response  # pylint: disable=import-outside-toplevel
-        settings.MESSAGE_QUEUE = MessageQueue(**settings.QUEUE, callbacks=[command_response])
+        # Started before the queue so the forked consumer writes its own snapshots
+        REGISTRY.start()
+        from command.processors import command_message  # pylint: disable=import-outside-toplevel
+        from command.outbox import OutboxRelay  # pylint: disable=import-outside-toplevel
+        from command.archive import HistoryArchiver  # pylint: disable=import-outside-toplevel
+        settings.MESSAGE_QUEUE = MessageQueue(**settings.QUEUE, callbacks=[command_message])
+        settings.OUTBOX_RELAY = OutboxRelay(settings.MESSAGE_QUEUE, **settings.OUTBOX)
+        if settings.ARCHIVE['archiver']:
+            settings.HISTORY_ARCHIVER = HistoryArchiver(**settings.ARCHIVE)
 
 
 @atexit.register
@@ -34,6 +44,12 @@ def shutdown(*args, **kwargs):
     :return: None
     """
 
+    if settings.OUTBOX_RELAY is not None:
+        settings.OUTBOX_RELAY.shutdown()
+
+    if settings.HISTORY_ARCHIVER is not None:
+        settings.HISTORY_ARCHIVER.shutdown()
+
     if isinstance(settings.MESSAGE_QUEUE, MessageQueue):
         settings.MESSAGE_QUEUE.shutdown()
 
@@ -1,9 +1,18 @@
 import json
+import time
 
+from django.db import connection
 from django.http import QueryDict
 from django.http.multipartparser import MultiValueDict
 from django.utils.deprecation import MiddlewareMixin
 
+# Local imports
+from utils.metrics import REGISTRY
+
+REQUEST_SECONDS = REGISTRY.histogram('orc_request_seconds', 'Time to handle API/GUI requests', ('view', 'method', 'status'))
+DB_QUERY_SECONDS = REGISTRY.histogram('orc_db_query_seconds', 'Time spent in database queries per request', ('view', ))
+DB_QUERIES = REGISTRY.counter('orc_db_queries_total', 'Database queries executed', ('view', ))
+
 
 class RESTMiddleware(MiddlewareMixin):
     """
@@ -87,3 +96,45 @@ class RESTMiddleware(MiddlewareMixin):
         :return: processed data
         """
         return request.parse_file_upload(request.META, request)
+
+
+class QueryTimer:
+    """
+    Database execute wrapper totaling the time and number of queries
+    """
+    __slots__ = ('count', 'seconds')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - start
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """
+    Record the request and database time of each view
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match.url_name or 'unnamed') if match else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        DB_QUERY_SECONDS.observe(queries.seconds, view=view)
+        if queries.count:
+            DB_QUERIES.inc(queries.count, view=view)
+        return response
@@ -0,0 +1,118 @@
+"""
+Reference data snapshot, the global preferences, protocols and serializations are held by each process and reloaded when they change.
+Changes touch a version file shared by the processes of the server, so checking for a change is a file stat rather than a query
+"""
+import threading
+import time
+
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from dynamic_preferences.models import GlobalPreferenceModel
+from dynamic_preferences.registries import global_preferences_registry
+
+# Local imports
+from utils.cache import VersionFile
+from .models import Protocol, Serialization
+
+global_preferences = global_preferences_registry.manager()
+
+
+class Snapshot(NamedTuple):
+    version: int                                # version of the reference data loaded
+    loaded: float                               # monotonic time the snapshot was loaded
+    preferences: Dict[str, Any]                 # global preferences, `section__name` -> value
+    protocols: List[Protocol]
+    serializations: Dict[str, Serialization]   # name -> serialization
+
+
+class ReferenceData:
+    """
+    Process local, versioned snapshot of the reference data
+    """
+    def __init__(self, version_file: str, max_age: float = 60):
+        """
+        :param version_file: file touched when the reference data changes, shared by the processes of the server
+        :param max_age: max time, in seconds, a snapshot is used, for processes that do not share the version file
+        """
+        self._version = VersionFile(version_file)
+        self._max_age = max_age
+        self._lock = threading.Lock()
+        self._snapshot: Optional[Snapshot] = None
+
+    @property
+    def snapshot(self) -> Snapshot:
+        """
+        Current snapshot, reloaded if the reference data changed or the snapshot is too old
+        """
+        version = self._version.get()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version or time.monotonic() - snapshot.loaded >= self._max_age:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version or time.monotonic() - snapshot.loaded >= self._max_age:
+                    snapshot = self._snapshot = self._load(version)
+        return snapshot
+
+    @property
+    def protocols(self) -> List[Protocol]:
+        return self.snapshot.protocols
+
+    @property
+    def serializations(self) -> List[Serialization]:
+        return list(self.snapshot.serializations.values())
+
+    def preference(self, key: str, default: Any = None) -> Any:
+        """
+        Get a global preference
+        :param key: preference, `section__name`
+        :param default: value if the preference is not set
+        :return: preference value
+        """
+        value = self.snapshot.preferences.get(key)
+        return default if value is None else value
+
+    def serialization(self, name: str) -> Optional[Serialization]:
+        """
+        Get a serialization by name
+        :param name: name of the serialization
+        :return: serialization, None if it does not exist
+        """
+        return self.snapshot.serializations.get(name)
+
+    def invalidate(self) -> None:
+        """
+        Mark the reference data as changed for all processes
+        """
+        self._snapshot = None
+        self._version.bump()
+
+    @staticmethod
+    def _load(version: int) -> Snapshot:
+        # From the database, the preference cache of each process is only updated by the process changing it
+        return Snapshot(
+            version=version,
+            loaded=time.monotonic(),
+            preferences=global_preferences.load_from_db(),
+            protocols=list(Protocol.objects.all()),
+            serializations={s.name: s for s in Serialization.objects.all()}
+        )
+
+
+REFERENCE = ReferenceData(**settings.REFERENCE)
+
+
+@receiver([post_save, post_delete], sender=GlobalPreferenceModel)
+@receiver([post_save, post_delete], sender=Protocol)
+@receiver([post_save, post_delete], sender=Serialization)
+def reference_changed(sender, **kwargs):
+    """
+    Invalidate the reference data snapshots once a change is committed
+    :param sender: model 'sending' the action - GlobalPreferenceModel, Protocol or Serialization
+    :param kwargs: key/value args
+    :return: None
+    """
+    transaction.on_commit(REFERENCE.invalidate)
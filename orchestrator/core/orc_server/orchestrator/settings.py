@@ -69,6 +69,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'orchestrator.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -123,6 +124,16 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+# Local memory by default, a shared cache (Ex: CACHE_BACKEND=django_redis.cache.RedisCache, CACHE_LOCATION=redis://redis:6379/0) is shared by all server processes
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', '')
+    }
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 AUTH_PASSWORD_VALIDATORS = [
@@ -227,7 +238,7 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'rest_framework_datatables.filters.DatatablesFilterBackend',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework_datatables.pagination.DatatablesPageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination.OrcPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_SCHEMA_CLASS': 'rest_framework.schemas.coreapi.AutoSchema',
     'DATETIME_FORMAT': "%Y-%m-%dT%H:%M:%S.%fZ"
@@ -313,6 +324,8 @@ ES_MIRROR = {
 QUEUE = {
     'hostname': os.environ.get('QUEUE_HOST', 'localhost'),
     'port': os.environ.get('QUEUE_PORT', 5672),
+    # Broker URL, overrides the host/port/auth - Ex) redis://redis:6379/0, memory://, local://
+    'url': os.environ.get('QUEUE_URL', None),
     'auth': {
         'username': os.environ.get('QUEUE_USER', 'guest'),
         'password': os.environ.get('QUEUE_PASSWORD', 'guest')
@@ -324,6 +337,55 @@ QUEUE = {
 
 MESSAGE_QUEUE = None
 
+# Transport Sharding, commands of a transport with more than one shard are published to <transport>.<shard> by device
+# TRANSPORT_SHARDS sets the shards of all transports, TRANSPORT_SHARDS_<TRANSPORT> of a single transport - Ex) TRANSPORT_SHARDS_HTTPS=8
+TRANSPORT_SHARDS = {
+    'default': int(os.environ.get('TRANSPORT_SHARDS', 1)),
+    **{k[17:].lower(): int(v) for k, v in os.environ.items() if k.startswith('TRANSPORT_SHARDS_')}
+}
+
+# Command Outbox, commands are published to the transports by a relay in each server process
+OUTBOX = {
+    'batch_size': int(os.environ.get('OUTBOX_BATCH_SIZE', 200)),
+    'interval': float(os.environ.get('OUTBOX_INTERVAL', 1)),
+    # Time, in seconds, published messages are kept
+    'retention': float(os.environ.get('OUTBOX_RETENTION', 86400)),
+    # Failed publishes are retried after an exponential backoff, up to the max attempts before the message is set aside
+    'max_attempts': int(os.environ.get('OUTBOX_MAX_ATTEMPTS', 10)),
+    'max_backoff': float(os.environ.get('OUTBOX_MAX_BACKOFF', 300))
+}
+
+OUTBOX_RELAY = None
+
+# History Archive, commands past the `command__retention_*` preferences are moved to gzip segments by an archiver in each server process
+ARCHIVE = {
+    'directory': os.environ.get('ARCHIVE_DIR', os.path.join(DATA_DIR, 'archive')),
+    'batch_size': int(os.environ.get('ARCHIVE_BATCH_SIZE', 500)),
+    'interval': float(os.environ.get('ARCHIVE_INTERVAL', 3600)),
+    # Size, in bytes, of a segment before a new one is started
+    'max_bytes': int(os.environ.get('ARCHIVE_MAX_BYTES', 64 * 1024 ** 2)),
+    # Run the archiver in this process, the directory must be shared by the servers reading the archive
+    'archiver': os.environ.get('ARCHIVE_ARCHIVER', 'true').lower() in ('1', 'true', 'yes')
+}
+
+HISTORY_ARCHIVER = None
+
+# Admission Control, thresholds and quotas of 0 are disabled
+ADMISSION = {
+    # Time, in seconds, transport queue depths are cached
+    'ttl': float(os.environ.get('ADMISSION_TTL', 2)),
+    # Max commands queued for a transport (broker queue and outbox) before commands are rejected with a 429
+    'max_depth': int(os.environ.get('ADMISSION_MAX_DEPTH', 10000)),
+    # Max age, in seconds, of an unpublished command before commands are rejected with a 503
+    'max_lag': float(os.environ.get('ADMISSION_MAX_LAG', 30)),
+    # Retry-After, in seconds, of commands rejected by the transport thresholds
+    'retry_after': int(os.environ.get('ADMISSION_RETRY_AFTER', 5)),
+    # Max commands of a user/profile within the quota window
+    'user_quota': int(os.environ.get('ADMISSION_USER_QUOTA', 0)),
+    'profile_quota': int(os.environ.get('ADMISSION_PROFILE_QUOTA', 0)),
+    'quota_window': float(os.environ.get('ADMISSION_QUOTA_WINDOW', 60))
+}
+
 # Valid Schema Formats
 SCHEMA_FORMATS = (
     'jadn',
@@ -333,5 +395,41 @@ SCHEMA_FORMATS = (
 # App stats function
 STATS_FUN = 'app_stats'
 
+# Reference Data, the preferences, protocols and serializations are held by each process until the version file changes
+REFERENCE = {
+    'version_file': os.environ.get('REFERENCE_VERSION_FILE', os.path.join(DATA_DIR, 'reference.version')),
+    # Max time, in seconds, the reference data is held, for server processes that do not share the version file
+    'max_age': float(os.environ.get('REFERENCE_MAX_AGE', 60))
+}
+
+# Response Cache, actuator and device responses are cached until a model they depend on changes
+RESPONSE_CACHE = {
+    'alias': os.environ.get('RESPONSE_CACHE_ALIAS', 'default'),
+    # Time, in seconds, responses are cached, 0 to disable
+    'timeout': int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300)),
+    # Min size, in bytes, of the responses that are gzipped
+    'gzip_min': int(os.environ.get('RESPONSE_CACHE_GZIP_MIN', 1024)),
+    # Directory of the model version files, shared by the server processes
+    'versions': os.environ.get('RESPONSE_CACHE_VERSIONS', os.path.join(DATA_DIR, 'versions'))
+}
+
+# Command Stats, hourly counters of the commands and responses, buffered by each process and served from the cache
+STATS = {
+    # Time, in seconds, between writes of the buffered counts
+    'interval': float(os.environ.get('STATS_INTERVAL', 5)),
+    # Time, in seconds, the stats are cached
+    'ttl': float(os.environ.get('STATS_TTL', 30)),
+    # Number of hours in the per hour breakdown
+    'buckets': int(os.environ.get('STATS_BUCKETS', 24))
+}
+
+# Streamed Exports, backup downloads in the NDJSON, CSV and MessagePack stream formats
+EXPORT = {
+    # Number of rows read and serialized at a time
+    'chunk_size': int(os.environ.get('EXPORT_CHUNK_SIZE', 2000)),
+    # Min size, in bytes, of the chunks sent
+    'buffer_size': int(os.environ.get('EXPORT_BUFFER_SIZE', 64 * 1024))
+}
+
 # GUI Configuration
 ADMIN_GUI = True
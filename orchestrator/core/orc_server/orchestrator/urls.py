@@ -53,6 +53,9 @@ api_patterns = [
     # Groups Routers
     path('log/', include('tracking.urls.api')),
 
+    # Metrics
+    path('metrics/', views.api_metrics, name='api.metrics'),
+
     # Schema
     path('schema/', include([
         path('', get_schema_view(title='OpenC2 Orchestrator API'), name='api.schema'),
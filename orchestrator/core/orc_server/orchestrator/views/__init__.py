@@ -1,10 +1,11 @@
-from .api import api_favicon, api_root
+from .api import api_favicon, api_metrics, api_root
 from .gui import gui_redirect
 from .handlers import bad_request, page_not_found, permission_denied, server_error
 
 __all__ = [
     # API
     'api_favicon',
+    'api_metrics',
     'api_root',
     # GUI
     'gui_redirect',
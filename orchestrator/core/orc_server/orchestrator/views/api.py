@@ -2,18 +2,16 @@ import importlib
 import os
 
 from django.conf import settings
-from django.http import FileResponse
-from dynamic_preferences.registries import global_preferences_registry
+from django.http import FileResponse, HttpResponse
 from inspect import isfunction
 from rest_framework import permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 
 # Local imports
-from orchestrator.models import Serialization, Protocol
-from command.models import SentHistory, ResponseHistory
-
-global_preferences = global_preferences_registry.manager()
+from orchestrator.reference import REFERENCE
+from command.counters import command_stats
+from utils.metrics import REGISTRY
 
 
 def get_stats():
@@ -42,17 +40,27 @@ def api_root(request):
     """
     Orchestrator basic information
     """
+    stats = command_stats()
     rtn = dict(
         message="Hello, {}. You're at the orchestrator api index.".format(request.user.username or 'guest'),
         commands=dict(
-            sent=SentHistory.objects.count(),
-            responses=ResponseHistory.objects.count()
+            sent=stats['sent'],
+            responses=stats['responses']
         ),
-        name=global_preferences.get('orchestrator__name', 'N/A'),
-        id=global_preferences.get('orchestrator__id', 'N/A'),
-        protocols={k: bool(v) for k, v in Protocol.objects.values_list('name', 'pub_sub', named=True)},
-        serializations=Serialization.objects.values_list('name', flat=True),
+        name=REFERENCE.preference('orchestrator__name', 'N/A'),
+        id=REFERENCE.preference('orchestrator__id', 'N/A'),
+        protocols={p.name: bool(p.pub_sub) for p in REFERENCE.protocols},
+        serializations=[s.name for s in REFERENCE.serializations],
         # app_stats=get_stats()
     )
 
     return Response(rtn)
+
+
+@api_view(['GET'])
+@permission_classes((permissions.IsAdminUser,))
+def api_metrics(request):
+    """
+    Latency and throughput metrics of all orchestrator processes, in the Prometheus text format
+    """
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -52,7 +52,8 @@ class LoggingMiddleware(MiddlewareMixin):
                 query_params=self._clean_data(getattr(request, "query_params", {})),
                 user=self._get_user(request),
                 response_ms=self._get_response_ms(),
-                response=response.rendered_content if hasattr(response, "rendered_content") else response.getvalue(),
+                # Streamed responses are sent as they are read, reading them here would hold them in memory
+                response="" if response.streaming else (response.rendered_content if hasattr(response, "rendered_content") else response.getvalue()),
                 status_code=response.status_code
             ))
 
@@ -83,6 +84,9 @@ class LoggingMiddleware(MiddlewareMixin):
             any(re.compile(prefix).match(request.path) for prefix in log_prefixes)
             and
             any(response.status_code in levels for levels in log_levels)
+            # Not Modified responses revalidate a cached response, they are not redirects
+            and
+            response.status_code != 304
         )
 
     def _get_user(self, request):
@@ -0,0 +1,19 @@
+# Generated by Django 2.2.10 on 2026-10-19 18:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracking', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventlog',
+            name='occurred_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, help_text='Time the event occurred'),
+        ),
+    ]
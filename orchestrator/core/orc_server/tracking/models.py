@@ -105,6 +105,7 @@ class EventLog(models.Model):
         on_delete=models.SET_NULL
     )
     occurred_at = models.DateTimeField(
+        db_index=True,
         default=timezone.now,
         help_text="Time the event occurred"
     )
@@ -11,6 +11,8 @@ class RequestLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = RequestLogSerializer
 
     queryset = RequestLog.objects.order_by('-requested_at')
+    # Keyset pagination with `?cursor=`, newest first
+    cursor_ordering = ('-requested_at', '-id')
 
 
 class EventLogViewSet(viewsets.ReadOnlyModelViewSet):
@@ -21,3 +23,5 @@ class EventLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = EventLogSerializer
 
     queryset = EventLog.objects.order_by('-occurred_at')
+    # Keyset pagination with `?cursor=`, newest first
+    cursor_ordering = ('-occurred_at', '-id')
@@ -1,21 +1,31 @@
-from sb_utils import decode_msg, encode_msg, FrozenDict, safe_cast
+from sb_utils import decode_msg, encode_msg, fork_trace, get_expires, mark_trace, new_trace, shard_routing_key, EXPIRED_KEY, FrozenDict, safe_cast
 
 # Local imports
-from .general import isHex, prefixUUID, randBytes, to_str
+from .cache import cached_response, invalidate_responses
+from .general import isHex, prefixUUID, randBytes, to_str, uuid7
 from .messageQueue import MessageQueue
 from .model import get_or_none, ReadOnlyModelAdmin
 from .permissions import IsAdminOrIsSelf
 from .schema import OrcSchema
 
 __all__ = [
+    "cached_response",
     "decode_msg",
     "encode_msg",
+    "fork_trace",
+    "get_expires",
     "get_or_none",
+    "invalidate_responses",
     "isHex",
+    "mark_trace",
+    "new_trace",
     "randBytes",
     "prefixUUID",
     "safe_cast",
+    "shard_routing_key",
     "to_str",
+    "uuid7",
+    "EXPIRED_KEY",
     "FrozenDict",
     "IsAdminOrIsSelf",
     "OrcSchema",
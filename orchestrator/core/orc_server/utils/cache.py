@@ -0,0 +1,119 @@
+"""
+Django API Response Cache Utilities
+"""
+import functools
+import gzip
+import hashlib
+import os
+import time
+
+from typing import Callable
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+
+class VersionFile:
+    """
+    Version shared by the processes of the server, the modification time of a file, so checking it is a file stat rather than a query
+    """
+    def __init__(self, path: str):
+        """
+        :param path: version file, created when first changed
+        """
+        self.path = path
+
+    def get(self) -> int:
+        """
+        Current version
+        :return: version, 0 if never changed
+        """
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def bump(self) -> None:
+        """
+        Change the version for all processes
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'a'):
+            pass
+        # Always advance, so changes within the timestamp resolution are not missed
+        version = max(time.time_ns(), self.get() + 1)
+        os.utime(self.path, ns=(version, version))
+
+
+def model_version(name: str) -> VersionFile:
+    """
+    Version of the cached responses of a model
+    :param name: name of the model version
+    :return: version file
+    """
+    return VersionFile(os.path.join(settings.RESPONSE_CACHE['versions'], name))
+
+
+def invalidate_responses(*names: str) -> None:
+    """
+    Invalidate the cached responses of models once the current transaction commits
+    :param names: names of the model versions
+    """
+    transaction.on_commit(lambda: [model_version(name).bump() for name in names])
+
+
+def cached_response(*versions: str) -> Callable:
+    """
+    Cache the JSON responses of a viewset action, by path, query and user visibility, until a model version they depend on changes.
+    Responses are served with an `ETag`, matching `If-None-Match` requests get a 304, and large responses are gzipped for clients that accept it
+    :param versions: names of the model versions the responses depend on
+    :return: decorated action
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, request, *args, **kwargs):
+            opts = settings.RESPONSE_CACHE
+            if not opts['timeout'] or getattr(request.accepted_renderer, 'format', None) != 'json':
+                return func(self, request, *args, **kwargs)
+
+            cache = caches[opts['alias']]
+            # Staff share responses, other users see only their own until per user permissions are set on the models
+            visibility = 'staff' if request.user.is_staff else f'user:{request.user.pk}'
+            version = '.'.join(str(model_version(name).get()) for name in versions)
+            key = 'response:' + hashlib.md5(f'{request.get_full_path()}|{visibility}|{version}'.encode('utf-8')).hexdigest()
+
+            cached = cache.get(key)
+            if cached is None:
+                response = func(self, request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+
+                renderer = request.accepted_renderer
+                body = renderer.render(response.data, request.accepted_media_type, self.get_renderer_context())
+                etag = f'"{hashlib.md5(body).hexdigest()}"'
+                compressed = gzip.compress(body) if len(body) >= opts['gzip_min'] else None
+                # Same content type as the uncached response
+                content_type = f'{request.accepted_media_type}; charset={renderer.charset}' if renderer.charset else request.accepted_media_type
+                cached = (etag, body, compressed, content_type)
+                cache.set(key, cached, opts['timeout'])
+
+            etag, body, compressed, content_type = cached
+            if compressed is not None and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', ''):
+                etag, body = f'{etag[:-1]}-gzip"', compressed
+
+            if etag in [tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+                rtn = HttpResponseNotModified()
+            else:
+                rtn = HttpResponse(body, content_type=content_type)
+                if body is compressed:
+                    rtn['Content-Encoding'] = 'gzip'
+            rtn['ETag'] = etag
+            # Clients revalidate with the ETag rather than reuse responses that may be stale
+            rtn['Cache-Control'] = 'private, no-cache'
+            patch_vary_headers(rtn, ('Accept', 'Accept-Encoding', 'Authorization', 'Cookie'))
+            return rtn
+        return wrapper
+    return decorator
@@ -1,9 +1,12 @@
 """
 General Utilities
 """
+import os
 import random
 import string
 import sys
+import threading
+import time
 import uuid
 
 from typing import Any
@@ -11,6 +14,9 @@ from typing import Any
 valid_hex = set(string.hexdigits)
 valid_hex.add(" ")
 
+_uuid7_lock = threading.Lock()
+_uuid7_last = 0
+
 
 def prefixUUID(pre: str = "PREFIX", max_length: int = 30) -> str:
     """
@@ -29,6 +35,22 @@ def prefixUUID(pre: str = "PREFIX", max_length: int = 30) -> str:
     return f"{pre}-{uid}"[:max_length]
 
 
+def uuid7() -> uuid.UUID:
+    """
+    Create a time ordered UUID (version 7), a unix timestamp in milliseconds and a 12 bit sub-millisecond fraction followed by random bits.
+    IDs created by a process are strictly increasing, so rows keyed by them are appended to the end of the index
+    :return: time ordered UUID
+    """
+    global _uuid7_last  # pylint: disable=global-statement
+    now = time.time_ns()
+    with _uuid7_lock:
+        stamp = max(now // 1000000 << 12 | (now % 1000000) * 4096 // 1000000, _uuid7_last + 1)
+        _uuid7_last = stamp
+
+    rand = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return uuid.UUID(int=(stamp >> 12) << 80 | 0x7 << 76 | (stamp & 0xFFF) << 64 | 0b10 << 62 | rand)
+
+
 def to_str(s: Any) -> str:
     """
     Convert a given type to a default string
@@ -1,7 +1,7 @@
 """
 Combination of AMQP Consumer/Producer as class for easier access within the Orchestrator code
 """
-from sb_utils import safe_cast, Consumer, FrozenDict, Producer
+from sb_utils import safe_cast, broker_url, make_consumer, make_producer, EXPIRED_KEY, FrozenDict
 
 
 class MessageQueue:
@@ -11,38 +11,46 @@ class MessageQueue:
     })
     _exchange = 'orchestrator'
     _consumerKey = 'response'
+    _expiredKey = EXPIRED_KEY
     _producerExchange = 'transport'
 
     def __init__(self, hostname='127.0.0.1', port=5672, auth=_auth, exchange=_exchange,
-                 consumer_key=_consumerKey, producer_exchange=_producerExchange, callbacks=None):
+                 consumer_key=_consumerKey, producer_exchange=_producerExchange, callbacks=None, url=None, confirm=True, expired_key=_expiredKey):
         """
         Message Queue - holds a consumer class and producer class for ease of use
         :param hostname: server ip/hostname to connect
         :param port: port the AMQP Queue is listening
+        :param auth: username/password of the AMQP Queue
         :param exchange: name of the default exchange
         :param consumer_key: key to consumer
         :param producer_exchange: ...
         :param callbacks: list of functions to call on message receive
+        :param url: broker URL, overrides the hostname/port/auth - Ex) redis://localhost:6379/0, memory://, local://
+        :param confirm: wait for the broker to confirm published messages
+        :param expired_key: key to consume the commands dropped as expired from, None to not consume them
         """
         self._exchange = exchange if isinstance(exchange, str) else self._exchange
         self._consumerKey = consumer_key if isinstance(consumer_key, str) else self._consumerKey
         self._producerExchange = producer_exchange if isinstance(producer_exchange, str) else self._producerExchange
+        self._expiredKey = expired_key if isinstance(expired_key, str) else None
+
+        auth = auth or self._auth
+        self._url = broker_url(hostname, safe_cast(port, int), url, auth.get('username', 'guest'), auth.get('password', 'guest'))
 
         self._publish_opts = dict(
-            host=hostname,
-            port=safe_cast(port, int)
+            url=self._url,
+            confirm=confirm
         )
 
         self._consume_opts = dict(
-            host=hostname,
-            port=safe_cast(port, int),
+            url=self._url,
             exchange=self._exchange,
-            routing_key=self._consumerKey,
+            routing_key=[self._consumerKey, self._expiredKey] if self._expiredKey else self._consumerKey,
             callbacks=callbacks
         )
 
-        self.producer = Producer(**self._publish_opts)
-        self.consumer = Consumer(**self._consume_opts)
+        self.producer = make_producer(**self._publish_opts)
+        self.consumer = make_consumer(**self._consume_opts)
 
     def send(self, msg, headers, exchange=_producerExchange, routing_key=None):
         """
@@ -64,6 +72,31 @@ class MessageQueue:
             routing_key=routing_key
         )
 
+    def send_batch(self, messages, exchange=_producerExchange, routing_key=None):
+        """
+        Publish multiple messages to the specified que and transport over a pooled connection
+        :param messages: list of message, headers pairs to be published
+        :param exchange: exchange name
+        :param routing_key: routing key name
+        :return: None
+        """
+        exchange = exchange if exchange == self._producerExchange else self._producerExchange
+        if routing_key is None:
+            raise ValueError('Routing Key cannot be None')
+        self.producer.publish_batch(
+            messages=[(msg, headers or {}) for msg, headers in messages],
+            exchange=exchange,
+            routing_key=routing_key
+        )
+
+    def queue_depth(self, routing_key):
+        """
+        Get the number of messages waiting for a transport and the number of its consumers
+        :param routing_key: routing key name of the transport
+        :return: number of messages, number of consumers - None if the broker does not count consumers
+        """
+        return self.producer.queue_depth(routing_key, self._producerExchange)
+
     def register_callback(self, fun):
         """
         Register a function for when a message is received from the message queue
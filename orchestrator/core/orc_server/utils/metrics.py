@@ -0,0 +1,296 @@
+"""
+In-process metrics registry exposed in the Prometheus text format
+Updates only touch process memory, each process (uWSGI workers and the response consumer) periodically writes a snapshot
+to a shared directory and the metrics view merges the snapshots of all live processes
+"""
+import bisect
+import json
+import os
+import tempfile
+import threading
+import time
+
+from typing import Dict, Iterable, List, Tuple
+
+LabelValues = Tuple[str, ...]
+
+# Default histogram buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Metric:
+    """
+    Base metric, values are held per label values
+    """
+    type = ''
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        """
+        :param name: metric name
+        :param documentation: help text of the metric
+        :param labels: label names, values are given as keyword arguments on update
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelValues, object] = {}
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels.get(label, '')) for label in self.labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            values = [[list(k), v if isinstance(v, (int, float)) else list(v)] for k, v in self._values.items()]
+        return dict(type=self.type, help=self.documentation, labels=list(self.labels), values=values)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values = {}
+
+
+class Counter(Metric):
+    """
+    Monotonically increasing value
+    """
+    type = 'counter'
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    Value that can go up and down
+    """
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, stored as per bucket counts, sum and count
+    """
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS):
+        """
+        :param name: metric name
+        :param documentation: help text of the metric
+        :param labels: label names, values are given as keyword arguments on update
+        :param buckets: upper bounds of the buckets, an infinite bucket is added
+        """
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            vals = self._values.get(key)
+            if vals is None:
+                vals = self._values[key] = [0] * (len(self.buckets) + 3)  # buckets, +Inf, sum, count
+            vals[idx] += 1
+            vals[-2] += value
+            vals[-1] += 1
+
+    def time(self, **labels) -> "_Timer":
+        """
+        Observe the duration of the wrapped block
+        :param labels: label values
+        :return: timer context manager
+        """
+        return _Timer(self, labels)
+
+    def snapshot(self) -> dict:
+        snap = super().snapshot()
+        snap['buckets'] = list(self.buckets)
+        return snap
+
+
+class _Timer:
+    __slots__ = ('_histogram', '_labels', '_start')
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self._histogram = histogram
+        self._labels = labels
+        self._start = 0.0
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(time.perf_counter() - self._start, **self._labels)
+
+
+class Registry:
+    """
+    Metrics of the process, shared with the other processes through snapshot files
+    """
+    def __init__(self, directory: str = None, interval: float = 5, stale: float = 60):
+        """
+        :param directory: directory of the process snapshots
+        :param interval: time, in seconds, between snapshots
+        :param stale: time, in seconds, after which the snapshot of a process that stopped writing is ignored
+        """
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'orc_metrics')
+        self.interval = interval
+        self.stale = stale
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _register(self, cls, name: str, *args, **kwargs) -> Metric:
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labels)
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labels)
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labels, buckets)
+
+    # Process snapshots
+    def start(self) -> None:
+        """
+        Start writing snapshots of the process metrics, restarted in forked processes
+        """
+        if self._writer_pid == os.getpid():
+            return
+        self._writer_pid = os.getpid()
+        self._writer = threading.Thread(target=self._write_loop, name='MetricsWriter', daemon=True)
+        self._writer.start()
+
+    def _forked(self) -> None:
+        # The child inherits the parent's values, which the parent keeps reporting
+        for metric in self._metrics.values():
+            metric.reset()
+        if self._writer_pid is not None:
+            self._writer_pid = None
+            self.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.write()
+
+    def snapshot(self) -> Dict[str, dict]:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+    def write(self) -> None:
+        """
+        Write the snapshot of the process metrics
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f'{os.getpid()}.json')
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            print(f'Cannot write metrics snapshot: {e}')
+
+    def collect(self) -> Dict[str, dict]:
+        """
+        Merge the snapshots of all live processes, the current process is always included
+        :return: metric name -> merged snapshot
+        """
+        self.write()
+        merged: Dict[str, dict] = {}
+        now = time.time()
+        try:
+            files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith('.json')]
+        except OSError:
+            files = []
+
+        snapshots = []
+        for path in files:
+            try:
+                if now - os.path.getmtime(path) > self.stale:
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        if not files:
+            snapshots.append(self.snapshot())
+
+        for snapshot in snapshots:
+            for name, metric in snapshot.items():
+                target = merged.setdefault(name, dict(metric, values={}))
+                for labels, value in metric['values']:
+                    key = tuple(labels)
+                    if key not in target['values']:
+                        target['values'][key] = value
+                    elif isinstance(value, list):
+                        target['values'][key] = [a + b for a, b in zip(target['values'][key], value)]
+                    else:
+                        target['values'][key] += value
+        return merged
+
+    def render(self) -> str:
+        """
+        Render the metrics of all processes in the Prometheus text format
+        :return: exposition text
+        """
+        lines: List[str] = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append(f'# HELP {name} {metric["help"]}')
+            lines.append(f'# TYPE {name} {metric["type"]}')
+            for key, value in sorted(metric['values'].items()):
+                labels = list(zip(metric['labels'], key))
+                if metric['type'] == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip([*metric['buckets'], '+Inf'], value[:-2]):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels + [("le", _number(bound))])} {cumulative}')
+                    lines.append(f'{name}_sum{_labels(labels)} {_number(value[-2])}')
+                    lines.append(f'{name}_count{_labels(labels)} {value[-1]}')
+                else:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _number(val) -> str:
+    if isinstance(val, str):
+        return val
+    return repr(float(val)) if isinstance(val, float) else str(val)
+
+
+def _labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+REGISTRY = Registry(
+    directory=os.environ.get('METRICS_DIR'),
+    interval=float(os.environ.get('METRICS_INTERVAL', 5))
+)
@@ -13,7 +13,7 @@ def get_or_none(model, **kwargs):
     """
     base_model = getattr(model, 'objects', model)
     qry = base_model.filter(**kwargs)
-    return None if len(qry) == 0 else (qry.first() if len(qry) == 1 else qry)
+    return None if len(qry) == 0 else (qry[0] if len(qry) == 1 else qry)
 
 
 class ReadOnlyModelAdmin(admin.ModelAdmin):
@@ -0,0 +1,193 @@
+"""
+Django API Pagination Utilities
+"""
+import base64
+import binascii
+import datetime
+import json
+import uuid
+
+from collections import OrderedDict
+from functools import reduce
+from typing import List, Optional, Tuple
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework_datatables.pagination import DatatablesPageNumberPagination
+
+
+def approximate_count(queryset) -> int:
+    """
+    Count the rows of a queryset, unfiltered querysets use the row estimate of the database instead of a full count
+    :param queryset: queryset to count
+    :return: number of rows, estimated for whole tables on MySQL and PostgreSQL
+    """
+    if not queryset.query.where:
+        conn = connections[queryset.db]
+        table = queryset.model._meta.db_table
+        sql = {
+            'mysql': 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+            'postgresql': 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+        }.get(conn.vendor)
+        if sql:
+            with conn.cursor() as cursor:
+                cursor.execute(sql, [table])
+                row = cursor.fetchone()
+            if row and row[0] is not None and row[0] >= 0:
+                return int(row[0])
+    return queryset.count()
+
+
+def keyset_after(fields: List[str], position: list) -> Q:
+    """
+    Filter the rows after a key in an ordering - (a, b) after (x, y) is a > x or (a = x and b > y), per field direction
+    :param fields: ordering fields, `-` prefixed if descending
+    :param position: key of the row
+    :return: filter
+    """
+    clauses = []
+    for idx, field in enumerate(fields):
+        name = field.lstrip('-')
+        equal = {f.lstrip('-'): val for f, val in zip(fields[:idx], position[:idx])}
+        clauses.append(Q(**equal, **{f"{name}__{'lt' if field.startswith('-') else 'gt'}": position[idx]}))
+    return reduce(lambda a, b: a | b, clauses)
+
+
+class OrcPagination(DatatablesPageNumberPagination):
+    """
+    Page number pagination, or keyset (cursor) pagination when the request has a `cursor` param and the view sets `cursor_ordering`.
+    Keyset pages filter on the ordering of the view rather than counting and offsetting, so deep pages are as fast as the first,
+    `cursor=` requests the first page and the `next`/`previous` links continue from the first/last row of the page.
+    Keyset pages are counted only when unfiltered, from the table estimate, and `?ordering=` can only reverse the ordering of the view
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        ordering = getattr(view, 'cursor_ordering', None)
+        self.cursor_ordering = ordering
+        if not ordering or self.cursor_query_param not in request.query_params:
+            self.cursor_ordering = None
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.is_datatable_request = False
+        ordering = self.cursor_ordering = self._ordering(request, ordering)
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        # Reverse pages walk back from the first row of the current page, then restore the order
+        fields = [self._flip(f) for f in ordering] if reverse else list(ordering)
+        page = queryset.order_by(*fields)
+        if position is not None:
+            page = page.filter(keyset_after(fields, position))
+        rows = list(page[:page_size + 1])
+        more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+
+        # Counting a filtered queryset reads all of its rows, only whole tables are counted from their estimate
+        self.count = None if queryset.query.where else max(approximate_count(queryset), len(rows))
+        self.has_next = more if not reverse else position is not None
+        self.has_previous = position is not None if not reverse else more
+        self.first_key = self._key(rows[0]) if rows else None
+        self.last_key = self._key(rows[-1]) if rows else None
+        return rows
+
+    def get_paginated_response(self, data):
+        if self.cursor_ordering is None:
+            return super().get_paginated_response(data)
+
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if self.cursor_ordering is None:
+            return super().get_next_link()
+        if not self.has_next or self.last_key is None:
+            return None
+        return self._link(self.last_key, False)
+
+    def get_previous_link(self):
+        if self.cursor_ordering is None:
+            return super().get_previous_link()
+        if not self.has_previous or self.first_key is None:
+            return None
+        return self._link(self.first_key, True)
+
+    def decode_cursor(self, request) -> Tuple[Optional[list], bool]:
+        """
+        Decode the cursor of a request
+        :param request: API request
+        :return: key of the row the page continues from - None for the first page, page before the row
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position, reverse = cursor['k'], bool(cursor.get('r'))
+        except (binascii.Error, KeyError, TypeError, UnicodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.cursor_ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def encode_cursor(self, position: list, reverse: bool) -> str:
+        """
+        Encode a cursor as an opaque URL param
+        :param position: key of the row the page continues from
+        :param reverse: page before the row
+        :return: encoded cursor
+        """
+        cursor = dict(k=position, r=1) if reverse else dict(k=position)
+        return base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+    def _ordering(self, request, ordering: Tuple[str, ...]) -> Tuple[str, ...]:
+        """
+        Keyset ordering of a request, the ordering of the view or its reverse with `?ordering=`, other orderings cannot be paged by key
+        :param request: API request
+        :param ordering: keyset ordering of the view
+        :return: keyset ordering
+        """
+        param = request.query_params.get(api_settings.ORDERING_PARAM)
+        if not param:
+            return tuple(ordering)
+
+        requested = [field.strip() for field in param.split(',') if field.strip()]
+        for candidate in (tuple(ordering), tuple(self._flip(f) for f in ordering)):
+            if requested == list(candidate[:len(requested)]):
+                return candidate
+        raise ValidationError({
+            api_settings.ORDERING_PARAM: [f"Keyset pages are ordered by {','.join(ordering)} or its reverse, use page numbers for other orderings"]
+        })
+
+    def _link(self, position: list, reverse: bool) -> str:
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def _key(self, row) -> list:
+        key = []
+        for field in self.cursor_ordering:
+            value = getattr(row, field.lstrip('-'))
+            # Full precision, the key must match the stored value exactly
+            if isinstance(value, (datetime.date, datetime.time)):
+                value = value.isoformat()
+            elif isinstance(value, uuid.UUID):
+                value = str(value)
+            key.append(value)
+        return key
+
+    @staticmethod
+    def _flip(field: str) -> str:
+        return field[1:] if field.startswith('-') else f'-{field}'
@@ -112,6 +112,13 @@ class Transport extends Component {
           <input type="text" className="form-control" name='channel' value={ this.state.channel } onChange={ this.transportChange } />
         </div>
       )]
+    } else if (this.state.protocol === 'CoAP') {
+      chan_top = (
+        <div className={ "form-group " + columns }>
+          <label htmlFor="group">Multicast Group</label>
+          <input type="text" className="form-control" name='group' placeholder='IP:Port' value={ this.state.group || '' } onChange={ this.transportChange } />
+        </div>
+      )
     }
 
     return (
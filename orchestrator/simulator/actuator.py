@@ -0,0 +1,148 @@
+"""
+actuator.py
+Simulated OpenC2 actuator, generates responses to commands with a configurable latency and error rate.
+"""
+import asyncio
+import random
+import re
+
+from datetime import datetime
+from typing import Callable, Dict, List
+
+# Minimal JADN schemas of the simulated profiles, the orchestrator sets the actuator profile from the title
+PROFILES = {
+    "slpf": {
+        "meta": {
+            "module": "http://oasis-open.org/openc2/oc2slpf/v1.0",
+            "title": "slpf",
+            "version": "1.0",
+            "description": "Simulated Stateless Packet Filtering actuator",
+            "exports": ["OpenC2-Command", "OpenC2-Response"]
+        },
+        "types": []
+    },
+    "sbom": {
+        "meta": {
+            "module": "http://oasis-open.org/openc2/oc2sbom/v1.0",
+            "title": "sbom",
+            "version": "1.0",
+            "description": "Simulated Software Bill of Materials actuator",
+            "exports": ["OpenC2-Command", "OpenC2-Response"]
+        },
+        "types": []
+    }
+}
+
+# Actions supported by each profile, all profiles support `query`
+ACTIONS = {
+    "slpf": {"allow", "deny", "delete", "update", "query"},
+    "sbom": {"query"}
+}
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Parse a latency distribution, values are in seconds
+    const:V, uniform:LOW,HIGH, normal:MEAN,STD, lognormal:MU,SIGMA, exp:MEAN
+    :param spec: distribution name and parameters - Ex) normal:0.02,0.005
+    :return: function returning a latency sample
+    """
+    name, _, params = spec.partition(":")
+    vals = [float(v) for v in params.split(",") if v]
+    dists = {
+        "const": (1, lambda: vals[0]),
+        "uniform": (2, lambda: random.uniform(vals[0], vals[1])),
+        "normal": (2, lambda: max(0.0, random.gauss(vals[0], vals[1]))),
+        "lognormal": (2, lambda: random.lognormvariate(vals[0], vals[1])),
+        "exp": (1, lambda: random.expovariate(1 / vals[0]) if vals[0] else 0.0)
+    }
+    if name not in dists:
+        raise ValueError(f"Unknown latency distribution {name}, must be one of {', '.join(dists)}")
+    if len(vals) != dists[name][0]:
+        raise ValueError(f"Latency distribution {name} requires {dists[name][0]} parameter(s)")
+    return dists[name][1]
+
+
+def content_encoding(content_type: str, default: str = "json") -> str:
+    """
+    Get the encoding from an OpenC2 content type
+    :param content_type: content type - Ex) application/openc2-cmd+json;version=1.0
+    :param default: encoding if not given in the content type
+    :return: encoding
+    """
+    enc = re.search(r"(?<=\+)([^;]*)", content_type or "")
+    return enc.group(1) if enc else default
+
+
+class SimActuator:
+    """
+    Simulated actuator of a single profile
+    """
+    def __init__(self, profile: str, latency: Callable[[], float] = lambda: 0.0, error_rate: float = 0.0):
+        """
+        :param profile: actuator profile, one of PROFILES
+        :param latency: function returning the time, in seconds, to process a command
+        :param error_rate: fraction of commands that fail with an internal error
+        """
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile {profile}, must be one of {', '.join(PROFILES)}")
+        self.profile = profile
+        self._latency = latency
+        self._error_rate = error_rate
+        self._rule_number = 0
+        self.stats: Dict[str, int] = {"commands": 0, "errors": 0}
+
+    @property
+    def schema(self) -> dict:
+        return PROFILES[self.profile]
+
+    async def handle(self, cmd: dict) -> dict:
+        """
+        Process a command after the simulated latency
+        :param cmd: OpenC2 command
+        :return: OpenC2 response
+        """
+        await asyncio.sleep(self._latency())
+        return self.respond(cmd)
+
+    def respond(self, cmd: dict) -> dict:
+        """
+        Generate the response to a command
+        :param cmd: OpenC2 command
+        :return: OpenC2 response
+        """
+        self.stats["commands"] += 1
+        if random.random() < self._error_rate:
+            self.stats["errors"] += 1
+            return dict(status=500, status_text="Simulated internal error")
+
+        action = cmd.get("action", "")
+        target = cmd.get("target", {})
+        if action not in ACTIONS[self.profile]:
+            return dict(status=501, status_text=f"Action {action} not supported by {self.profile}")
+
+        if action == "query" and "features" in target:
+            return dict(status=200, results=self._features(target.get("features") or []))
+
+        if action == "query" and self.profile == "sbom":
+            return dict(status=200, results={
+                "sbom": {
+                    "type": "cyclonedx",
+                    "content": {"components": [{"name": "simulated", "version": "1.0.0"}]}
+                }
+            })
+
+        if action in ("allow", "deny"):
+            self._rule_number += 1
+            return dict(status=200, results={"slpf": {"rule_number": self._rule_number}})
+
+        return dict(status=200, status_text=f"{action} processed at {datetime.utcnow():%Y-%m-%dT%H:%M:%SZ}")
+
+    def _features(self, features: List[str]) -> dict:
+        results = {
+            "versions": ["1.0"],
+            "profiles": [self.schema["meta"]["module"]],
+            "pairs": {action: [] for action in sorted(ACTIONS[self.profile])},
+            "rate_limit": 0
+        }
+        return {k: v for k, v in results.items() if k in features}
@@ -0,0 +1,237 @@
+"""
+devices.py
+Simulated devices, each hosts one simulated actuator and speaks one of the orchestrator transport protocols.
+"""
+import asyncio
+import json
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sb_utils import decode_msg, encode_msg
+
+from actuator import SimActuator, content_encoding
+from mqtt_broker import MqttBroker
+
+# The CoAP device reuses the endpoint and block-wise handling of the orchestrator CoAP transport
+sys.path.append(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "transport", "coap", "COAP"))
+from coap_protocol import CoapError, Message, CON, POST, URI_HOST  # noqa: E402
+from coap_server import CoapServer  # noqa: E402
+
+
+def http_date() -> str:
+    return f"{datetime.utcnow():%a, %d %b %Y %H:%M:%S GMT}"  # RFC7231-7.1.1.1 -> Sun, 06 Nov 1994 08:49:37 GMT
+
+
+def ssl_context(cert: str = None, key: str = None) -> ssl.SSLContext:
+    """
+    Create the server TLS context of the HTTPS devices, a self-signed cert is generated if not given
+    :param cert: path of the certificate
+    :param key: path of the private key
+    :return: TLS context
+    """
+    if not (cert and key):
+        tmp = tempfile.mkdtemp(prefix="oif-sim-")
+        cert, key = os.path.join(tmp, "server.crt"), os.path.join(tmp, "server.key")
+        subprocess.run([
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/O=OpenC2 Simulator", "-keyout", key, "-out", cert
+        ], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    ctx.load_cert_chain(cert, key)
+    return ctx
+
+
+class SimDevice:
+    """
+    Base simulated device
+    """
+    protocol = ""
+
+    def __init__(self, actuator: SimActuator, host: str, port: int, encoding: str = "json"):
+        """
+        :param actuator: actuator hosted on the device
+        :param host: address the device listens on
+        :param port: port the device listens on
+        :param encoding: encoding the device is registered with
+        """
+        self.actuator = actuator
+        self.host = host
+        self.port = port
+        self.encoding = encoding
+
+    @property
+    def socket(self) -> str:
+        return f"{self.host}:{self.port}"
+
+    async def start(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+
+class HttpsDevice(SimDevice):
+    """
+    Device receiving commands as HTTPS POSTs and returning the response in the HTTP response
+    """
+    protocol = "HTTPS"
+
+    def __init__(self, *args, context: ssl.SSLContext = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._context = context
+        self._server = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._connection, self.host, self.port, ssl=self._context)
+
+    def close(self) -> None:
+        if self._server:
+            self._server.close()
+
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Handle requests on a connection until it is closed, connections are kept alive
+        """
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = {k.strip().lower(): v.strip() for k, v in (line.split(":", 1) for line in lines[1:] if ":" in line)}
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, rsp_headers, rsp_body = await self._request(lines[0].split(" ", 1)[0], headers, body)
+                rsp_headers.update({
+                    "Content-Length": len(rsp_body),
+                    "Date": http_date()
+                })
+                writer.write(f"HTTP/1.1 {status}\r\n".encode() + "".join(f"{k}: {v}\r\n" for k, v in rsp_headers.items()).encode() + b"\r\n" + rsp_body)
+                await writer.drain()
+
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    async def _request(self, method: str, headers: dict, body: bytes) -> Tuple[str, dict, bytes]:
+        if method != "POST":
+            return "405 Method Not Allowed", {}, b""
+
+        encoding = content_encoding(headers.get("content-type"))
+        try:
+            cmd = decode_msg(body.decode("utf-8"), encoding)
+        except Exception as e:  # pylint: disable=broad-except
+            return "400 Bad Request", {}, f"Cannot decode {encoding} command - {e}".encode()
+
+        start = time.perf_counter()
+        rsp = await self.actuator.handle(cmd)
+        return "200 OK", {
+            "Server-Timing": f"actuator;dur={(time.perf_counter() - start) * 1000:.3f}",
+            "Content-type": f"application/openc2-rsp+{encoding};version=1.0",
+            "Status": rsp.get("status", 200),
+            "X-Request-ID": headers.get("x-request-id", ""),
+            "From": f"{self.actuator.profile}@{self.socket}"
+        }, encode_msg(rsp, encoding).encode("utf-8")
+
+
+class MqttDevice(SimDevice):
+    """
+    Device with its own broker, the actuator subscribes to its profile topic and
+    publishes responses to the response topic of the orchestrator
+    """
+    protocol = "MQTT"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.broker = MqttBroker()
+
+    async def start(self) -> None:
+        await self.broker.start(self.host, self.port)
+        self.broker.subscribe(self.actuator.profile, self._command)
+
+    def close(self) -> None:
+        self.broker.close()
+
+    def _command(self, topic: str, payload: bytes) -> None:
+        asyncio.ensure_future(self._respond(payload))
+
+    async def _respond(self, payload: bytes) -> None:
+        try:
+            msg = json.loads(payload)
+            header = msg.get("header", {})
+            encoding = content_encoding(header.get("content_type"))
+            cmd = decode_msg(msg.get("body", ""), encoding)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"MQTT device {self.socket} cannot decode command - {e}")
+            return
+
+        rsp = await self.actuator.handle(cmd)
+        orc_id = header.get("from", "").rsplit("@", 1)[0]
+        self.broker.publish(f"{orc_id}/response".lower(), json.dumps({
+            "header": {
+                "to": header.get("from", ""),
+                "from": f"{self.actuator.profile}@{self.socket}",
+                "correlationID": header.get("correlationID", ""),
+                "created": http_date(),
+                "content_type": f"application/openc2-rsp+{encoding};version=1.0"
+            },
+            "body": encode_msg(rsp, encoding)
+        }).encode("utf-8"), qos=1)
+
+
+class CoapActuatorServer(CoapServer):
+    """
+    CoAP endpoint of a simulated device, commands are acknowledged and
+    the response is sent as a separate request to the orchestrator CoAP server
+    """
+    def __init__(self, actuator: SimActuator, orc_server: Optional[Tuple[str, int]] = None, **kwargs):
+        super().__init__(publisher=None, **kwargs)
+        self.actuator = actuator
+        self._orc_server = orc_server
+
+    def received(self, message, headers, request):
+        asyncio.ensure_future(self._respond(message, headers, request))
+
+    async def _respond(self, cmd: dict, headers: dict, request: Message) -> None:
+        rsp = await self.actuator.handle(cmd)
+
+        target = self._orc_server
+        if target is None:
+            host, port = request.get_str(URI_HOST, "").rsplit(":", 1)
+            target = (host, int(port))
+
+        msg = Message(mtype=CON, code=POST, mid=int(headers["correlationID"], 16), token=self.new_token(), payload=encode_msg(rsp, headers["encoding"]))
+        msg.uri_path = "transport"
+        msg.content_format = request.content_format
+        try:
+            await self.request(msg, target, 30)
+        except (CoapError, asyncio.TimeoutError, OSError) as e:
+            print(f"CoAP device {self.sockname} cannot send response to {target} - {getattr(e, 'message', str(e)) or e.__class__.__name__}")
+
+
+class CoapDevice(SimDevice):
+    """
+    Device receiving commands as CoAP POSTs
+    """
+    protocol = "COAP"
+
+    def __init__(self, *args, orc_server: Optional[Tuple[str, int]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._orc_server = orc_server
+        self._endpoint = None
+
+    async def start(self) -> None:
+        self._endpoint = await CoapActuatorServer.create((self.host, self.port), actuator=self.actuator, orc_server=self._orc_server)
+
+    def close(self) -> None:
+        if self._endpoint:
+            self._endpoint.close()
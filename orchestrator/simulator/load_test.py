@@ -0,0 +1,124 @@
+"""
+load_test.py
+Send commands through the orchestrator API and report the command rate, API latency and device response latency.
+"""
+import argparse
+import statistics
+import threading
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import requests
+
+# Commands sent round-robin, `query features` is supported by every simulated profile
+COMMANDS = {
+    "query": {"action": "query", "target": {"features": ["versions", "profiles"]}},
+    "deny": {"action": "deny", "target": {"ipv4_net": "10.0.0.1/32"}, "args": {"response_requested": "complete"}}
+}
+
+
+def parse_time(val: str) -> datetime:
+    return datetime.strptime(val.replace("Z", "+00:00").split("+")[0], "%Y-%m-%dT%H:%M:%S.%f" if "." in val else "%Y-%m-%dT%H:%M:%S")
+
+
+def percentiles(vals: List[float]) -> str:
+    if not vals:
+        return "n/a"
+    vals = sorted(vals)
+    pct = {p: vals[min(len(vals) - 1, int(len(vals) * p / 100))] for p in (50, 95, 99)}
+    return f"mean {statistics.mean(vals) * 1000:.1f}ms, " + ", ".join(f"p{p} {v * 1000:.1f}ms" for p, v in pct.items())
+
+
+class LoadTest:
+    """
+    Sends commands from concurrent workers, each with its own HTTP session
+    """
+    def __init__(self, url: str, username: str, password: str, actuator: str, command: dict):
+        """
+        :param url: base URL of the orchestrator - Ex) http://localhost:8080
+        :param username: username to send the commands as
+        :param password: password of the user
+        :param actuator: actuator/profile receiving the commands - Ex) profile/slpf
+        :param command: command to send, a unique ID is added to each
+        """
+        self._api = f"{url.rstrip('/')}/api"
+        self._auth = (username, password)
+        self._actuator = actuator
+        self._command = command
+        self._local = threading.local()
+        self.latency: List[float] = []
+        self.sent: List[str] = []
+        self.failed: Dict[str, int] = {}
+
+    @property
+    def session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+            self._local.session.auth = self._auth
+        return self._local.session
+
+    def send(self) -> None:
+        cmd = dict(self._command, id=str(uuid.uuid4()))
+        start = time.perf_counter()
+        try:
+            rsp = self.session.put(f"{self._api}/command/send/", json={"actuator": self._actuator, "command": cmd})
+            status = str(rsp.status_code)
+        except requests.RequestException as e:
+            status = e.__class__.__name__
+
+        if status == "200":
+            self.latency.append(time.perf_counter() - start)
+            self.sent.append(cmd["id"])
+        else:
+            self.failed[status] = self.failed.get(status, 0) + 1
+
+    def response_latency(self, command_id: str) -> Optional[float]:
+        """
+        Time from the orchestrator receiving a command to receiving the first response
+        :param command_id: ID of the command
+        :return: latency in seconds, None if no response was received
+        """
+        rsp = self.session.get(f"{self._api}/command/{command_id}/")
+        if rsp.status_code != 200:
+            return None
+        cmd = rsp.json()
+        received = [parse_time(r["received_on"]) for r in cmd.get("responses", [])]
+        return (min(received) - parse_time(cmd["received_on"])).total_seconds() if received else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Orchestrator command load test")
+    parser.add_argument("url", help="orchestrator URL - Ex) http://localhost:8080")
+    parser.add_argument("--username", default="admin", help="username to send commands as")
+    parser.add_argument("--password", default="password", help="password of the user")
+    parser.add_argument("--actuator", default="profile/slpf", help="actuator or profile to send to")
+    parser.add_argument("--command", default="query", choices=list(COMMANDS), help="command to send")
+    parser.add_argument("-n", "--count", type=int, default=1000, help="number of commands to send")
+    parser.add_argument("-c", "--concurrency", type=int, default=10, help="number of concurrent senders")
+    parser.add_argument("--settle", type=float, default=5, help="seconds to wait for responses before measuring their latency")
+    parser.add_argument("--sample", type=int, default=200, help="number of commands to measure the response latency of")
+    args = parser.parse_args()
+
+    test = LoadTest(args.url, args.username, args.password, args.actuator, COMMANDS[args.command])
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for _ in range(args.count):
+            pool.submit(test.send)
+    elapsed = time.perf_counter() - start
+
+    print(f"Sent {len(test.sent)}/{args.count} commands in {elapsed:.2f}s - {len(test.sent) / elapsed:.1f} commands/sec")
+    if test.failed:
+        print(f"Failed: {', '.join(f'{k}: {v}' for k, v in test.failed.items())}")
+    print(f"API latency: {percentiles(test.latency)}")
+
+    time.sleep(args.settle)
+    sample = test.sent[::max(1, len(test.sent) // args.sample)] if args.sample else []
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        rsp_latency = list(pool.map(test.response_latency, sample))
+    answered = [lat for lat in rsp_latency if lat is not None]
+    print(f"Responses received for {len(answered)}/{len(sample)} sampled commands")
+    print(f"Response latency: {percentiles(answered)}")
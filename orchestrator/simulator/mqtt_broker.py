@@ -0,0 +1,259 @@
+"""
+mqtt_broker.py
+Minimal asyncio MQTT v3.1.1 broker for local load testing, not intended as a production broker.
+Supports QoS 0-2 publish/subscribe with `+`/`#` wildcards, retained messages, wills and in-process subscribers.
+"""
+import asyncio
+import struct
+
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# Packet Types
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP, SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = range(1, 15)
+
+Subscriber = Callable[[str, bytes], None]
+
+
+def topic_matches(topic_filter: str, topic: str) -> bool:
+    """
+    Check if a topic matches a subscription filter
+    :param topic_filter: subscription filter, may contain `+` and `#` wildcards
+    :param topic: topic of a published message
+    :return: topic matches
+    """
+    f_levels = topic_filter.split("/")
+    t_levels = topic.split("/")
+    for idx, level in enumerate(f_levels):
+        if level == "#":
+            return True
+        if idx >= len(t_levels) or (level != "+" and level != t_levels[idx]):
+            return False
+    return len(f_levels) == len(t_levels)
+
+
+def encode_str(val: str) -> bytes:
+    val = val.encode("utf-8")
+    return struct.pack("!H", len(val)) + val
+
+
+def encode_packet(ptype: int, flags: int, body: bytes) -> bytes:
+    """
+    Encode an MQTT control packet
+    :param ptype: packet type
+    :param flags: fixed header flags
+    :param body: variable header and payload
+    :return: encoded packet
+    """
+    header = bytearray([ptype << 4 | flags])
+    length = len(body)
+    while True:
+        byte, length = length % 128, length // 128
+        header.append(byte | (0x80 if length else 0))
+        if not length:
+            break
+    return bytes(header) + body
+
+
+class Session:
+    """
+    Connection of a client to the broker
+    """
+    def __init__(self, broker: "MqttBroker", reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = ""
+        self.subscriptions: Dict[str, int] = {}
+        self.will: Optional[Tuple[str, bytes, int, bool]] = None
+        self._pid = 0
+
+    def next_pid(self) -> int:
+        self._pid = self._pid % 0xFFFF + 1
+        return self._pid
+
+    def send(self, ptype: int, flags: int = 0, body: bytes = b"") -> None:
+        if not self.writer.is_closing():
+            self.writer.write(encode_packet(ptype, flags, body))
+
+    def deliver(self, topic: str, payload: bytes, qos: int, retain: bool = False) -> None:
+        body = encode_str(topic)
+        if qos:
+            body += struct.pack("!H", self.next_pid())
+        self.send(PUBLISH, qos << 1 | int(retain), body + payload)
+
+    async def read_packet(self) -> Tuple[int, int, bytes]:
+        first = (await self.reader.readexactly(1))[0]
+        length, mult = 0, 1
+        while True:
+            byte = (await self.reader.readexactly(1))[0]
+            length += (byte & 0x7F) * mult
+            mult *= 128
+            if not byte & 0x80:
+                break
+        return first >> 4, first & 0x0F, await self.reader.readexactly(length)
+
+    async def run(self) -> None:
+        clean = False
+        try:
+            while True:
+                ptype, flags, body = await self.read_packet()
+                if ptype == CONNECT:
+                    self._connect(body)
+                elif ptype == PUBLISH:
+                    self._publish(flags, body)
+                elif ptype == PUBREL:
+                    self.send(PUBCOMP, 0, body[:2])
+                elif ptype == SUBSCRIBE:
+                    self._subscribe(body)
+                elif ptype == UNSUBSCRIBE:
+                    self._unsubscribe(body)
+                elif ptype == PINGREQ:
+                    self.send(PINGRESP)
+                elif ptype == DISCONNECT:
+                    clean = True
+                    break
+                await self.writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.broker.sessions.discard(self)
+            if not clean and self.will:
+                self.broker.publish(*self.will)
+            self.writer.close()
+
+    def _connect(self, body: bytes) -> None:
+        idx = struct.unpack("!H", body[:2])[0] + 2
+        flags = body[idx + 1]
+        idx += 4  # level, flags, keep alive
+
+        def read_field():
+            nonlocal idx
+            size = struct.unpack("!H", body[idx:idx + 2])[0]
+            val = body[idx + 2:idx + 2 + size]
+            idx += 2 + size
+            return val
+
+        self.client_id = read_field().decode("utf-8")
+        if flags & 0x04:
+            topic = read_field().decode("utf-8")
+            self.will = (topic, read_field(), flags >> 3 & 0x03, bool(flags & 0x20))
+        self.send(CONNACK, 0, b"\x00\x00")
+
+    def _publish(self, flags: int, body: bytes) -> None:
+        qos, retain = flags >> 1 & 0x03, bool(flags & 0x01)
+        size = struct.unpack("!H", body[:2])[0]
+        topic = body[2:2 + size].decode("utf-8")
+        idx = 2 + size
+        if qos:
+            pid = body[idx:idx + 2]
+            idx += 2
+            self.send(PUBACK if qos == 1 else PUBREC, 0, pid)
+        self.broker.publish(topic, body[idx:], qos, retain)
+
+    def _subscribe(self, body: bytes) -> None:
+        pid, idx, granted = body[:2], 2, bytearray()
+        while idx < len(body):
+            size = struct.unpack("!H", body[idx:idx + 2])[0]
+            topic_filter = body[idx + 2:idx + 2 + size].decode("utf-8")
+            qos = min(body[idx + 2 + size], 2)
+            idx += 3 + size
+            self.subscriptions[topic_filter] = qos
+            granted.append(qos)
+        self.send(SUBACK, 0, pid + bytes(granted))
+
+        for topic_filter, qos in self.subscriptions.items():
+            for topic, (payload, r_qos) in self.broker.retained.items():
+                if topic_matches(topic_filter, topic):
+                    self.deliver(topic, payload, min(qos, r_qos), True)
+
+    def _unsubscribe(self, body: bytes) -> None:
+        idx = 2
+        while idx < len(body):
+            size = struct.unpack("!H", body[idx:idx + 2])[0]
+            self.subscriptions.pop(body[idx + 2:idx + 2 + size].decode("utf-8"), None)
+            idx += 2 + size
+        self.send(UNSUBACK, 0, body[:2])
+
+
+class MqttBroker:
+    """
+    Minimal MQTT broker, clients connect over TCP and in-process subscribers receive messages directly
+    """
+    def __init__(self):
+        self.sessions: Set[Session] = set()
+        self.retained: Dict[str, Tuple[bytes, int]] = {}
+        self._local: List[Tuple[str, Subscriber]] = []
+        self._server = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 1883) -> "MqttBroker":
+        """
+        Start listening for clients
+        :param host: address to listen on
+        :param port: port to listen on, 0 for any
+        :return: started broker
+        """
+        self._server = await asyncio.start_server(self._accept, host, port)
+        return self
+
+    @property
+    def sockname(self) -> Tuple[str, int]:
+        return self._server.sockets[0].getsockname()[:2]
+
+    def close(self) -> None:
+        if self._server:
+            self._server.close()
+        for session in list(self.sessions):
+            session.writer.close()
+
+    async def _accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        session = Session(self, reader, writer)
+        self.sessions.add(session)
+        await session.run()
+
+    def subscribe(self, topic_filter: str, callback: Subscriber) -> None:
+        """
+        Subscribe an in-process callback to a topic
+        :param topic_filter: subscription filter, may contain `+` and `#` wildcards
+        :param callback: function called with the topic and payload of each matching message
+        """
+        self._local.append((topic_filter, callback))
+
+    def publish(self, topic: str, payload: bytes, qos: int = 0, retain: bool = False) -> None:
+        """
+        Publish a message to all matching subscribers
+        :param topic: topic to publish to
+        :param payload: message payload
+        :param qos: max QoS to deliver with
+        :param retain: retain the message for future subscribers
+        """
+        if retain:
+            if payload:
+                self.retained[topic] = (payload, qos)
+            else:
+                self.retained.pop(topic, None)
+
+        for session in list(self.sessions):
+            matched = [q for f, q in session.subscriptions.items() if topic_matches(f, topic)]
+            if matched:
+                session.deliver(topic, payload, min(qos, max(matched)))
+
+        for topic_filter, callback in self._local:
+            if topic_matches(topic_filter, topic):
+                callback(topic, payload)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Minimal MQTT broker for local testing")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("-p", "--port", type=int, default=1883, help="port to listen on")
+    args = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    broker = loop.run_until_complete(MqttBroker().start(args.host, args.port))
+    print(f"Broker listening on {args.host}:{args.port}")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        broker.close()
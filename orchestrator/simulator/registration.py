@@ -0,0 +1,91 @@
+"""
+registration.py
+Register simulated devices and their actuators with an orchestrator through its REST API.
+"""
+import uuid
+
+from typing import List
+
+import requests
+
+from devices import SimDevice
+
+# Namespace of the deterministic device/actuator IDs, a restarted simulator replaces its previous registrations
+SIM_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_DNS, "simulator.oif.openc2")
+
+# Serialization names as registered in the orchestrator fixtures
+SERIALIZATIONS = {
+    "msgpack": "MsgPack"
+}
+
+
+class Registrar:
+    """
+    Registers simulated devices with an orchestrator, one actuator per device
+    """
+    def __init__(self, url: str, username: str, password: str, verify: bool = False):
+        """
+        :param url: base URL of the orchestrator - Ex) http://localhost:8080
+        :param username: admin username
+        :param password: admin password
+        :param verify: verify the TLS certificate of the orchestrator
+        """
+        self._api = f"{url.rstrip('/')}/api"
+        self._session = requests.Session()
+        self._session.auth = (username, password)
+        self._session.verify = verify
+        self._registered: List[str] = []
+
+    @staticmethod
+    def device_id(device: SimDevice) -> str:
+        return str(uuid.uuid5(SIM_NAMESPACE, f"device/{device.protocol}/{device.socket}"))
+
+    @staticmethod
+    def actuator_id(device: SimDevice) -> str:
+        return str(uuid.uuid5(SIM_NAMESPACE, f"actuator/{device.protocol}/{device.socket}/{device.actuator.profile}"))
+
+    def register(self, device: SimDevice) -> None:
+        """
+        Register a device and its actuator, replacing an existing registration of the same device
+        :param device: simulated device
+        """
+        dev_id = self.device_id(device)
+        name = f"sim-{device.protocol.lower()}-{device.port}"
+        rsp = self._session.delete(f"{self._api}/device/{dev_id}/")
+        if rsp.status_code not in (204, 404):
+            # Stored responses protect the actuators of a previous run, keep its registration
+            print(f"Keeping existing registration of {name} - {rsp.status_code}")
+            return
+
+        self._request("post", "device", {
+            "device_id": dev_id,
+            "name": name,
+            "transport": [{
+                "host": device.host,
+                "port": device.port,
+                "protocol": device.protocol,
+                "serialization": [SERIALIZATIONS.get(device.encoding, device.encoding.upper())]
+            }],
+            "note": "Simulated device"
+        })
+        self._registered.append(dev_id)
+
+        self._request("post", "actuator", {
+            "actuator_id": self.actuator_id(device),
+            "name": f"{name}-{device.actuator.profile}",
+            "device": dev_id,
+            "schema": device.actuator.schema
+        })
+
+    def unregister(self) -> None:
+        """
+        Remove the registered devices, their actuators are removed with them
+        """
+        while self._registered:
+            self._session.delete(f"{self._api}/device/{self._registered.pop()}/")
+
+    def _request(self, method: str, endpoint: str, data: dict) -> dict:
+        rsp = self._session.request(method, f"{self._api}/{endpoint}/", json=data)
+        if rsp.status_code >= 400:
+            raise ValueError(f"Cannot {method.upper()} {endpoint} - {rsp.status_code} {rsp.text[:500]}")
+        return rsp.json()
@@ -0,0 +1,104 @@
+"""
+simulator.py
+Run a fleet of simulated OpenC2 devices over HTTPS, MQTT and CoAP for load testing the orchestrator.
+"""
+import argparse
+import asyncio
+import itertools
+import signal
+
+from typing import List
+
+from actuator import PROFILES, SimActuator, parse_latency
+from devices import CoapDevice, HttpsDevice, MqttDevice, SimDevice, ssl_context
+from registration import Registrar
+
+
+def build_fleet(args: argparse.Namespace) -> List[SimDevice]:
+    """
+    Create the simulated devices, profiles and encodings are assigned round-robin
+    :param args: parsed command line arguments
+    :return: simulated devices
+    """
+    latency = parse_latency(args.latency)
+    profiles = itertools.cycle(args.profiles)
+    encodings = itertools.cycle(args.encodings)
+    ports = itertools.count(args.base_port)
+    context = ssl_context(args.cert, args.key) if args.https else None
+    orc_server = None
+    if args.coap_server:
+        host, port = args.coap_server.rsplit(":", 1)
+        orc_server = (host, int(port))
+
+    fleet: List[SimDevice] = []
+    for protocol, count in ((HttpsDevice, args.https), (MqttDevice, args.mqtt), (CoapDevice, args.coap)):
+        for _ in range(count):
+            kwargs = dict(
+                actuator=SimActuator(next(profiles), latency, args.error_rate),
+                host=args.host,
+                port=next(ports),
+                encoding=next(encodings)
+            )
+            if protocol is HttpsDevice:
+                kwargs["context"] = context
+            elif protocol is CoapDevice:
+                kwargs["orc_server"] = orc_server
+            fleet.append(protocol(**kwargs))
+    return fleet
+
+
+async def run(args: argparse.Namespace) -> None:
+    fleet = build_fleet(args)
+    await asyncio.gather(*[device.start() for device in fleet])
+    for device in fleet:
+        print(f"{device.protocol:5} {device.socket} {device.actuator.profile} {device.encoding}")
+
+    registrar = None
+    if args.register:
+        registrar = Registrar(args.register, args.username, args.password)
+        for device in fleet:
+            registrar.register(device)
+        print(f"Registered {len(fleet)} devices with {args.register}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), args.report)
+            except asyncio.TimeoutError:
+                commands = sum(d.actuator.stats["commands"] for d in fleet)
+                errors = sum(d.actuator.stats["errors"] for d in fleet)
+                print(f"Commands processed: {commands}, simulated errors: {errors}")
+    finally:
+        for device in fleet:
+            device.close()
+        if registrar and not args.keep:
+            registrar.unregister()
+            print("Unregistered devices")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated OpenC2 actuator fleet")
+    parser.add_argument("--https", type=int, default=0, help="number of HTTPS devices")
+    parser.add_argument("--mqtt", type=int, default=0, help="number of MQTT devices, each runs its own broker")
+    parser.add_argument("--coap", type=int, default=0, help="number of CoAP devices")
+    parser.add_argument("--profiles", nargs="+", default=["slpf"], choices=list(PROFILES), help="actuator profiles, assigned round-robin")
+    parser.add_argument("--encodings", nargs="+", default=["json"], help="device serializations, assigned round-robin")
+    parser.add_argument("--latency", default="const:0", help="actuator latency distribution in seconds - Ex) normal:0.02,0.005")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of commands that fail")
+    parser.add_argument("--host", default="127.0.0.1", help="address devices listen on and are registered with")
+    parser.add_argument("--base-port", type=int, default=20000, help="port of the first device, following devices use consecutive ports")
+    parser.add_argument("--cert", help="TLS certificate of the HTTPS devices, self-signed if not given")
+    parser.add_argument("--key", help="TLS private key of the HTTPS devices")
+    parser.add_argument("--coap-server", help="orchestrator CoAP server host:port, overrides the socket sent by the transport")
+    parser.add_argument("--register", metavar="URL", help="orchestrator URL to register the devices with - Ex) http://localhost:8080")
+    parser.add_argument("--username", default="admin", help="orchestrator admin username")
+    parser.add_argument("--password", default="password", help="orchestrator admin password")
+    parser.add_argument("--keep", action="store_true", help="keep the registered devices on exit")
+    parser.add_argument("--report", type=float, default=10, help="seconds between progress reports")
+
+    asyncio.get_event_loop().run_until_complete(run(parser.parse_args()))
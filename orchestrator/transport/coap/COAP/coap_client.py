@@ -1,67 +1,270 @@
-import json
+import asyncio
+import contextlib
+import os
+import threading
 
 from coapthon import defines
-from coapthon.client.helperclient import HelperClient
-from coapthon.messages.option import Option
-from coapthon.utils import generate_random_token
+from typing import Dict, List, Tuple
 
-from sb_utils import encode_msg, safe_cast, Consumer
+from sb_utils import safe_cast, TransportRuntime
+from coap_protocol import CoapEndpoint, CoapError, Message, Remote, CON, NON, POST, URI_HOST, LOCATION_PATH, code_str
 
 
-class CoapClient(HelperClient):
-    def post(self, path, payload, callback=None, timeout=5, no_response=False, **kwargs):
+class CoapTransport(TransportRuntime):
+    """
+    Asynchronous CoAP client, all destinations share one endpoint socket and are sent to concurrently.
+    When ordered, the commands to a device are sent one at a time in the order consumed
+    """
+    name = "coap"
+
+    def __init__(self, max_inflight: int = 256, timeout: float = 30, block_size: int = defines.BLOCKWISE_SIZE,
+                 multicast: bool = False, multicast_wait: float = 2, multicast_ttl: int = 1, multicast_if: str = None, **kwargs):
         """
-        Perform a POST on a certain path.
-        :param path: the path
-        :param payload: the request payload
-        :param callback: the callback function to invoke upon response
-        :param timeout: the timeout of the request
-        :return: the response
+        :param max_inflight: max number of outstanding requests
+        :param timeout: max time for a request, including retransmissions and block-wise transfers
+        :param block_size: preferred block size for large commands/responses
+        :param multicast: send one request per multicast group instead of one per device
+        :param multicast_wait: max time to collect the responses of group members
+        :param multicast_ttl: time-to-live (hops) of multicast requests
+        :param multicast_if: IP of the local interface to send multicast requests from
+        :param kwargs: runtime options
         """
-        request = kwargs.pop("request", self.mk_request(defines.Codes.POST, path))
-        request.payload = payload
-        request.token = generate_random_token(2)
-        request.version = 1
+        super().__init__(**kwargs)
+        self._max_inflight = max_inflight
+        self._timeout = timeout
+        self._block_size = block_size
+        self._multicast = multicast
+        self._multicast_wait = multicast_wait
+        self._multicast_ttl = multicast_ttl
+        self._multicast_if = multicast_if
+        self._loop_lock = threading.Lock()
+        self._loop = None
+        self._endpoint = None
+        self._inflight = None
+        # Device socket -> last send to the device, set when done, only used from the loop when ordered
+        self._turns: Dict[str, asyncio.Future] = {}
+        # Device socket -> concurrent sends to the device, only used from the loop
+        self._send_limits: Dict[str, asyncio.Semaphore] = {}
 
-        if no_response:
-            request.add_no_response()
-            request.type = defines.Types["NON"]
+    def start_loop(self) -> None:
+        """
+        Start the event loop and endpoint, called lazily from the process consuming messages
+        """
+        with self._loop_lock:
+            if self._loop is not None:
+                return
 
-        for k, v in kwargs.items():
-            if hasattr(request, k):
-                setattr(request, k, v)
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name="CoapClientLoop", daemon=True).start()
+            asyncio.run_coroutine_threadsafe(self._init(), self._loop).result()
 
-        return self.send_request(request, callback, timeout)
+    async def _init(self) -> None:
+        self._endpoint = await CoapEndpoint.create(block_size=self._block_size)
+        self._inflight = asyncio.Semaphore(self._max_inflight)
+        if self._multicast:
+            self._endpoint.set_multicast(self._multicast_ttl, self._multicast_if)
 
+    def targets(self, device):
+        # The profile is routed by the device-side transport, only the first is used
+        return device.get("profile", [""])[:1]
 
-def send_coap(body, message):
-    """
-    AMQP Callback when we receive a message from internal buffer to be published
-    :param body: Contains the message to be sent.
-    :param message: Contains data about the message as well as headers
-    """
-    # Set destination and build requests for multiple potential endpoints.
-    for device in message.headers.get("destination", {}):
+    def dispatch(self, cmd, headers, destinations):
+        """
+        Schedule a command to be sent to all of its destinations, returns without waiting for the devices
+        :param cmd: OpenC2 command
+        :param headers: headers of the AMQP message
+        :param destinations: destination device, encoded command pairs
+        """
+        self.start_loop()
+        fut = asyncio.run_coroutine_threadsafe(self._process(headers, destinations), self._loop)
+        fut.add_done_callback(self._log_exception)
+
+    def send(self, device, profile, payload, headers):
+        """
+        Send an encoded command to a device and wait for the response
+        :param device: destination device from the message headers
+        :param profile: actuator profile to send to
+        :param payload: command encoded with the device encoding
+        :param headers: headers of the AMQP message
+        """
+        self.start_loop()
+        response = asyncio.run_coroutine_threadsafe(self._request(device, payload, headers), self._loop).result()
+        self._handle_response(device, response, headers)
+
+    async def _process(self, headers: dict, destinations: List[Tuple[dict, bytes]]) -> None:
+        groups, devices = self._group_destinations(destinations)
+        sends = [
+            *[(self._send_group(headers, group, members), [device["socket"] for device, _ in members]) for group, members in groups.items()],
+            *[(self._send_device(device, payload, headers), [device["socket"]]) for device, payload in devices]
+        ]
+        if self._ordered:
+            # Turns are taken before the first await, in the order the commands were dispatched
+            await asyncio.gather(*[self._in_turn(send, *self._take_turn(sockets)) for send, sockets in sends])
+        else:
+            await asyncio.gather(*[send for send, _ in sends])
+
+    def _take_turn(self, sockets: List[str]) -> Tuple[List[asyncio.Future], Dict[str, asyncio.Future]]:
+        """
+        Queue a send behind the earlier sends to the same devices
+        :param sockets: sockets of the destination devices
+        :return: earlier sends to wait for, device socket -> future to set when the send is done
+        """
+        sockets = set(sockets)
+        earlier = [self._turns[socket] for socket in sockets if socket in self._turns]
+        done = {}
+        for socket in sockets:
+            done[socket] = self._turns[socket] = self._loop.create_future()
+        return earlier, done
+
+    async def _in_turn(self, send, earlier: List[asyncio.Future], done: Dict[str, asyncio.Future]) -> None:
+        try:
+            if earlier:
+                await asyncio.wait(earlier)
+            await send
+        finally:
+            # Not started if cancelled while waiting
+            send.close()
+            for socket, fut in done.items():
+                fut.set_result(None)
+                if self._turns.get(socket) is fut:
+                    del self._turns[socket]
+
+    @contextlib.asynccontextmanager
+    async def _limit(self, sockets: List[str]):
+        """
+        Concurrency limit of devices, the loop counterpart of `limit`, a slot of each device is taken in socket order
+        :param sockets: sockets of the destination devices
+        """
+        async with contextlib.AsyncExitStack() as stack:
+            for socket in sorted(set(sockets)):
+                if socket not in self._send_limits:
+                    self._send_limits[socket] = asyncio.Semaphore(self._max_per_destination)
+                await stack.enter_async_context(self._send_limits[socket])
+            yield
+
+    def _group_destinations(self, destinations: List[Tuple[dict, bytes]]) -> Tuple[Dict[Tuple[str, str, str], List[Tuple[dict, bytes]]], List[Tuple[dict, bytes]]]:
+        """
+        Split destinations into multicast groups and unicast devices.
+        Devices share a group request if they are in the same group and use the same encoding and profile,
+        commands that need a block-wise transfer are always sent unicast
+        :param destinations: destination device, encoded command pairs
+        :return: (group, encoding, profile) -> member device, encoded command pairs, unicast device, encoded command pairs
+        """
+        if not self._multicast:
+            return {}, destinations
+
+        groups: Dict[Tuple[str, str, str], List[Tuple[dict, bytes]]] = {}
+        devices = []
+        for device, payload in destinations:
+            if device.get("group") and len(payload) <= self._endpoint.block_size:
+                groups.setdefault((device["group"], device["encoding"], self.targets(device)[0]), []).append((device, payload))
+            else:
+                devices.append((device, payload))
+
+        # A group of one gains nothing over a confirmable request
+        for key in [k for k, v in groups.items() if len(v) == 1]:
+            devices.extend(groups.pop(key))
+        return groups, devices
+
+    async def _request(self, device: dict, payload: bytes, headers: dict) -> Message:
+        """
+        Send the command to a single device
+        :param device: destination device
+        :param payload: encoded command
+        :param headers: headers of the AMQP message
+        :return: response of the device
+        """
         host, port = device["socket"].split(":", 1)
-        encoding = device["encoding"]
-
-        # Check necessary headers exist
-        if host and port and encoding:
-            path = "transport"
-            client = CoapClient(server=(host, safe_cast(port, int, 5683)))
-            request = client.mk_request(defines.Codes.POST, path)
-            response = client.post(
-                path=path,
-                payload=encode_msg(json.loads(body), encoding),
-                request=build_request(request, message.headers.get("source", {}), device)
-            )
-
-            if response:
-                print(f"Response from device: {response}")
-            client.stop()
+        async with self._inflight:
+            request = build_request(Message(mtype=CON, code=POST, payload=payload), headers.get("source", {}), device)
+            return await self._endpoint.request(request, (host, safe_cast(port, int, 5683)), self._timeout)
+
+    async def _send_device(self, device: dict, payload: bytes, headers: dict) -> None:
+        """
+        Send the command to a single device and handle the response
+        :param device: destination device
+        :param payload: encoded command
+        :param headers: headers of the AMQP message
+        """
+        if self.drop_expired(headers, [device]):
+            return
+        async with self._limit([device["socket"]]):
+            self.metrics.incr("inflight")
+            self.trace_sent(headers.get("source", {}).get("correlationID", ""), device["socket"], headers)
+            try:
+                with self.metrics.time("send"):
+                    response = await self._request(device, payload, headers)
+                self.metrics.incr("sent")
+            except (CoapError, asyncio.TimeoutError, OSError, ValueError) as err:
+                self.metrics.incr("errors")
+                self.send_failed(f"CoAP error sending to {device['socket']} - {getattr(err, 'message', str(err)) or err.__class__.__name__}", device, headers)
+                return
+            finally:
+                self.metrics.incr("inflight", -1)
+
+        self._handle_response(device, response, headers)
+
+    async def _send_group(self, headers: dict, group: Tuple[str, str, str], destinations: List[Tuple[dict, bytes]]) -> None:
+        """
+        Send the command to a multicast group as a single non-confirmable request and handle the member responses
+        :param headers: headers of the AMQP message
+        :param group: group socket, encoding, profile
+        :param destinations: member device, encoded command pairs of the group
+        """
+        group_socket = group[0]
+        g_host, g_port = (group_socket.split(":", 1) + [""])[:2]
+        devices = [device for device, _ in destinations]
+        if self.drop_expired(headers, devices):
+            return
+
+        correlation_id = headers.get("source", {}).get("correlationID", "")
+        async with self._limit([device["socket"] for device in devices]), self._inflight:
+            for device in devices:
+                self.trace_sent(correlation_id, device["socket"], headers)
+            try:
+                members = {}
+                for device in devices:
+                    host, port = device["socket"].split(":", 1)
+                    members[await self._endpoint.resolve((host, safe_cast(port, int, 5683)))] = device
+
+                request = build_request(Message(mtype=NON, code=POST, payload=destinations[0][1]), headers.get("source", {}), devices[0])
+                with self.metrics.time("send_group"):
+                    responses = await self._endpoint.multicast(request, (g_host, safe_cast(g_port, int, 5683)), self._multicast_wait, members.keys())
+            except (CoapError, OSError, ValueError) as err:
+                self.metrics.incr("errors", len(devices))
+                for device in devices:
+                    self.send_failed(f"CoAP error sending to {device['socket']} via group {group_socket} - {getattr(err, 'message', str(err)) or err.__class__.__name__}", device, headers)
+                return
+
+        # Match responses to members by ip and port, a member responding from another port is matched by its IP only if no other member shares it
+        by_ip: Dict[str, List[Remote]] = {}
+        for remote in members:
+            by_ip.setdefault(remote[0], []).append(remote)
+        answered = set()
+        for remote, response in responses.items():
+            member = remote if remote in members else None
+            if member is None and len(by_ip.get(remote[0], [])) == 1:
+                member = by_ip[remote[0]][0]
+            if member is None or member in answered:
+                continue
+            answered.add(member)
+            self.metrics.incr("sent")
+            self._handle_response(members[member], response, headers)
+
+        for member in set(members) - answered:
+            self.metrics.incr("errors")
+            self.send_failed(f"CoAP no response from {members[member]['socket']} to group {group_socket}", members[member], headers)
+
+    def _handle_response(self, device: dict, response: Message, headers: dict) -> None:
+        if response.code >= 4 << 5:
+            self.send_error(f"CoAP error response from {device['socket']} - {code_str(response.code)} {response.payload.decode('utf-8', 'backslashreplace')}", dict(headers, destination=[device]))
         else:
-            # send error back to orch
-            print(f"Error: not enough data - {host}, {port}, {encoding}")
+            print(f"Response from device {device['socket']}: {code_str(response.code)} {response.payload.decode('utf-8', 'backslashreplace')}")
+
+    @staticmethod
+    def _log_exception(fut) -> None:
+        if fut.exception():
+            print(f"CoAP send error: {fut.exception()}")
 
 
 def build_request(request, headers, device):
@@ -71,39 +274,31 @@ def build_request(request, headers, device):
     :param headers: Data from AMQP message which contains data to forward OpenC2 Command.
     :param device:  Device specific data from headers sent by O.I.F.
     """
-    orc_host, orc_port = headers["transport"]["socket"].split(":", 1)    # location of orchestrator-side CoAP server
-    request.source = (orc_host, safe_cast(orc_port, int, 5683))
-
-    dev_host, dev_port = device["socket"].split(":", 1)    # location of device-side CoAP server
-    request.destination = (dev_host, safe_cast(dev_port, int, 5683))
+    request.uri_path = "transport"
 
-    encoding = f"application/{device['encoding']}"         # Content Serialization
-    request.content_type = defines.Content_types[encoding]   # using application/json, TODO: add define to openc2+json
-    request.mid = int("0x" + headers["correlationID"], 16)   # 16-bit correlationID
-    request.timestamp = headers["date"]                      # time message was sent from orchestrator
+    encoding = f"application/{device['encoding']}"  # Content Serialization
+    request.content_format = defines.Content_types.get(encoding, defines.Content_types["application/octet-stream"])
+    request.mid = int(headers["correlationID"], 16) & 0xFFFF  # 16-bit correlationID
+    request.token = CoapEndpoint.new_token(2)
 
     # Add OIF-unique value used for routing to the desired actuator
-    profile = Option()
-    profile.number = 8
-    profile.value = device.get("profile", "")[0]
-    request.add_option(profile)
+    request.add_option(LOCATION_PATH, device.get("profile", [""])[0])
 
-    source_socket = Option()
-    source_socket.number = 3
-    source_socket.value = headers["transport"]["socket"]
-    request.add_option(source_socket)
+    # Location of the orchestrator-side CoAP server, the request source is the client socket
+    request.add_option(URI_HOST, headers["transport"]["socket"])
 
     return request
 
 
 if __name__ == "__main__":
+    transport = CoapTransport(
+        max_inflight=safe_cast(os.environ.get("COAP_MAX_INFLIGHT", 256), int, 256),
+        timeout=safe_cast(os.environ.get("COAP_TIMEOUT", 30), float, 30),
+        block_size=safe_cast(os.environ.get("COAP_BLOCK_SIZE", defines.BLOCKWISE_SIZE), int, defines.BLOCKWISE_SIZE),
+        multicast=os.environ.get("COAP_MULTICAST", "").lower() in ("1", "true", "yes"),
+        multicast_wait=safe_cast(os.environ.get("COAP_MULTICAST_WAIT", 2), float, 2),
+        multicast_ttl=safe_cast(os.environ.get("COAP_MULTICAST_TTL", 1), int, 1),
+        multicast_if=os.environ.get("COAP_MULTICAST_IF") or None
+    )
     # Begin consuming messages from internal message queue
-    try:
-        consumer = Consumer(
-            exchange="transport",
-            routing_key="coap",
-            callbacks=[send_coap]
-        )
-    except Exception as e:
-        print(f"Consumer error: {e}")
-        consumer.shutdown()
+    transport.run()
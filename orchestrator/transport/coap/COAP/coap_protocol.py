@@ -0,0 +1,576 @@
+"""
+coap_protocol.py
+Lightweight asyncio CoAP (RFC 7252) endpoint with block-wise transfer (RFC 7959) support.
+A single endpoint owns one UDP socket and can have many confirmable requests outstanding at once.
+"""
+import asyncio
+import random
+import socket
+
+from coapthon import defines
+from typing import Collection, Dict, List, Optional, Tuple, Union
+
+# Message Types
+CON, NON, ACK, RST = range(4)
+
+# Message Codes - class << 5 | detail
+EMPTY = 0
+GET, POST, PUT, DELETE = range(1, 5)
+CREATED = 2 << 5 | 1
+CHANGED = 2 << 5 | 4
+CONTENT = 2 << 5 | 5
+CONTINUE = 2 << 5 | 31
+BAD_REQUEST = 4 << 5 | 0
+NOT_FOUND = 4 << 5 | 4
+METHOD_NOT_ALLOWED = 4 << 5 | 5
+REQUEST_ENTITY_INCOMPLETE = 4 << 5 | 8
+REQUEST_ENTITY_TOO_LARGE = 4 << 5 | 13
+INTERNAL_SERVER_ERROR = 5 << 5 | 0
+
+# Option Numbers
+URI_HOST = 3
+LOCATION_PATH = 8
+URI_PATH = 11
+CONTENT_FORMAT = 12
+BLOCK2 = 23
+BLOCK1 = 27
+SIZE2 = 28
+SIZE1 = 60
+
+# Transmission Parameters
+ACK_TIMEOUT = defines.ACK_TIMEOUT
+ACK_RANDOM_FACTOR = defines.ACK_RANDOM_FACTOR
+MAX_RETRANSMIT = defines.MAX_RETRANSMIT
+BLOCK_SIZE = defines.BLOCKWISE_SIZE
+PAYLOAD_MARKER = 0xFF
+
+Remote = Tuple[str, int]
+
+
+class CoapError(Exception):
+    """
+    Base CoAP exchange error
+    """
+
+
+class CoapTimeout(CoapError):
+    """
+    Remote endpoint did not acknowledge or respond in time
+    """
+
+
+class CoapReset(CoapError):
+    """
+    Remote endpoint rejected the message with a reset
+    """
+
+
+def code_str(code: int) -> str:
+    """
+    Format a message code as `class.detail`
+    :param code: message code
+    :return: formatted code - Ex) 2.05
+    """
+    return f"{code >> 5}.{code & 0x1F:02d}"
+
+
+def is_request(code: int) -> bool:
+    return 1 <= code <= 31
+
+
+def is_response(code: int) -> bool:
+    return 64 <= code <= 191
+
+
+def encode_uint(val: int) -> bytes:
+    """
+    Encode an unsigned integer option value in the minimum number of bytes
+    :param val: value to encode
+    :return: encoded value
+    """
+    return val.to_bytes((val.bit_length() + 7) // 8, "big")
+
+
+def decode_uint(val: bytes) -> int:
+    return int.from_bytes(val, "big")
+
+
+def encode_block(num: int, more: bool, szx: int) -> int:
+    """
+    Encode the value of a Block1/Block2 option
+    :param num: block number
+    :param more: more blocks follow
+    :param szx: block size exponent, size = 2 ** (szx + 4)
+    :return: option value
+    """
+    return num << 4 | int(more) << 3 | szx
+
+
+def decode_block(val: int) -> Tuple[int, bool, int]:
+    """
+    Decode the value of a Block1/Block2 option
+    :param val: option value
+    :return: block number, more flag, size exponent
+    """
+    return val >> 4, bool(val >> 3 & 0x01), val & 0x07
+
+
+def size_exponent(size: int) -> int:
+    """
+    Get the block size exponent for the given block size, rounded down to a valid size
+    :param size: block size in bytes (16-1024)
+    :return: block size exponent
+    """
+    size = max(16, min(1024, size))
+    return size.bit_length() - 5
+
+
+class Message:
+    """
+    CoAP Message
+    """
+    def __init__(self, mtype: int = CON, code: int = EMPTY, mid: int = None, token: bytes = b"",
+                 options: List[Tuple[int, bytes]] = None, payload: Union[bytes, str] = b""):
+        self.mtype = mtype
+        self.code = code
+        self.mid = mid
+        self.token = token
+        self.options = list(options or [])
+        self.payload = payload.encode("utf-8") if isinstance(payload, str) else bytes(payload)
+        self.remote = None
+
+    def __repr__(self) -> str:
+        return f"<Message {('CON', 'NON', 'ACK', 'RST')[self.mtype]} {code_str(self.code)} mid={self.mid} token={self.token.hex()} len={len(self.payload)}>"
+
+    # Option Helpers
+    def add_option(self, number: int, value: Union[bytes, int, str]) -> None:
+        if isinstance(value, int):
+            value = encode_uint(value)
+        elif isinstance(value, str):
+            value = value.encode("utf-8")
+        self.options.append((number, value))
+
+    def set_option(self, number: int, value: Union[bytes, int, str]) -> None:
+        self.del_option(number)
+        self.add_option(number, value)
+
+    def del_option(self, number: int) -> None:
+        self.options = [(n, v) for n, v in self.options if n != number]
+
+    def get_option(self, number: int, default: bytes = None) -> Optional[bytes]:
+        for n, v in self.options:
+            if n == number:
+                return v
+        return default
+
+    def get_uint(self, number: int, default: int = None) -> Optional[int]:
+        val = self.get_option(number)
+        return default if val is None else decode_uint(val)
+
+    def get_str(self, number: int, default: str = None) -> Optional[str]:
+        val = self.get_option(number)
+        return default if val is None else val.decode("utf-8", "backslashreplace")
+
+    @property
+    def uri_path(self) -> str:
+        return "/".join(v.decode("utf-8") for n, v in self.options if n == URI_PATH)
+
+    @uri_path.setter
+    def uri_path(self, path: str) -> None:
+        self.del_option(URI_PATH)
+        for part in filter(None, path.split("/")):
+            self.add_option(URI_PATH, part)
+
+    @property
+    def content_format(self) -> Optional[int]:
+        return self.get_uint(CONTENT_FORMAT)
+
+    @content_format.setter
+    def content_format(self, fmt: int) -> None:
+        self.set_option(CONTENT_FORMAT, fmt)
+
+    def copy(self, **kwargs) -> "Message":
+        """
+        Copy the message, overriding the given attributes
+        :param kwargs: attributes to override
+        :return: copied message
+        """
+        msg = Message(
+            mtype=kwargs.get("mtype", self.mtype),
+            code=kwargs.get("code", self.code),
+            mid=kwargs.get("mid", self.mid),
+            token=kwargs.get("token", self.token),
+            options=kwargs.get("options", self.options),
+            payload=kwargs.get("payload", self.payload)
+        )
+        msg.remote = kwargs.get("remote", self.remote)
+        return msg
+
+    # Serialization
+    def encode(self) -> bytes:
+        """
+        Serialize the message to its RFC7252 binary format
+        :return: encoded message
+        """
+        if len(self.token) > 8:
+            raise ValueError("Token cannot be longer than 8 bytes")
+
+        data = bytearray([1 << 6 | self.mtype << 4 | len(self.token), self.code])
+        data += (self.mid or 0).to_bytes(2, "big")
+        data += self.token
+
+        last = 0
+        for number, value in sorted(self.options, key=lambda o: o[0]):
+            delta, d_ext = self._opt_nibble(number - last)
+            length, l_ext = self._opt_nibble(len(value))
+            data.append(delta << 4 | length)
+            data += d_ext + l_ext + value
+            last = number
+
+        if self.payload:
+            data.append(PAYLOAD_MARKER)
+            data += self.payload
+        return bytes(data)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "Message":
+        """
+        Parse a message from its RFC7252 binary format
+        :param data: encoded message
+        :return: parsed message
+        """
+        if len(data) < 4:
+            raise ValueError("Message too short")
+
+        version, mtype, tkl = data[0] >> 6, data[0] >> 4 & 0x03, data[0] & 0x0F
+        if version != 1 or tkl > 8:
+            raise ValueError("Invalid message header")
+
+        msg = cls(mtype=mtype, code=data[1], mid=int.from_bytes(data[2:4], "big"), token=bytes(data[4:4 + tkl]))
+        idx = 4 + tkl
+        number = 0
+        while idx < len(data):
+            if data[idx] == PAYLOAD_MARKER:
+                msg.payload = bytes(data[idx + 1:])
+                if not msg.payload:
+                    raise ValueError("Payload marker without payload")
+                break
+
+            delta, length = data[idx] >> 4, data[idx] & 0x0F
+            idx += 1
+            delta, idx = cls._opt_value(delta, data, idx)
+            length, idx = cls._opt_value(length, data, idx)
+            number += delta
+            msg.options.append((number, bytes(data[idx:idx + length])))
+            idx += length
+
+        return msg
+
+    @staticmethod
+    def _opt_nibble(val: int) -> Tuple[int, bytes]:
+        if val < 13:
+            return val, b""
+        if val < 269:
+            return 13, bytes([val - 13])
+        return 14, (val - 269).to_bytes(2, "big")
+
+    @staticmethod
+    def _opt_value(nibble: int, data: bytes, idx: int) -> Tuple[int, int]:
+        if nibble == 13:
+            return data[idx] + 13, idx + 1
+        if nibble == 14:
+            return int.from_bytes(data[idx:idx + 2], "big") + 269, idx + 2
+        if nibble == 15:
+            raise ValueError("Invalid option delta/length")
+        return nibble, idx
+
+
+class CoapEndpoint(asyncio.DatagramProtocol):
+    """
+    Asynchronous CoAP endpoint, multiplexes any number of concurrent exchanges over a single socket
+    """
+    def __init__(self, block_size: int = BLOCK_SIZE, ack_timeout: float = ACK_TIMEOUT, max_retransmit: int = MAX_RETRANSMIT):
+        """
+        Create an endpoint, use `CoapEndpoint.create` to bind it to a socket
+        :param block_size: preferred block size for block-wise transfers
+        :param ack_timeout: initial time to wait for an acknowledgement before retransmitting
+        :param max_retransmit: number of retransmissions of a confirmable message before giving up
+        """
+        self._transport = None
+        self._szx = size_exponent(block_size)
+        self._ack_timeout = ack_timeout
+        self._max_retransmit = max_retransmit
+        self._mid = random.getrandbits(16)
+        self._pending_acks: Dict[Tuple[Remote, int], asyncio.Future] = {}
+        self._pending_rsps: Dict[Tuple[Remote, bytes], asyncio.Future] = {}
+        self._pending_groups: Dict[bytes, Tuple[Dict[Remote, Message], Collection[Remote], asyncio.Event]] = {}
+
+    @classmethod
+    async def create(cls, bind: Remote = ("0.0.0.0", 0), **kwargs) -> "CoapEndpoint":
+        """
+        Create an endpoint bound to the given address
+        :param bind: local address to bind
+        :param kwargs: endpoint options
+        :return: bound endpoint
+        """
+        loop = asyncio.get_event_loop()
+        _, endpoint = await loop.create_datagram_endpoint(lambda: cls(**kwargs), local_addr=bind, family=socket.AF_INET)
+        return endpoint
+
+    @property
+    def block_size(self) -> int:
+        return 2 ** (self._szx + 4)
+
+    @property
+    def sockname(self) -> Remote:
+        return self._transport.get_extra_info("sockname")
+
+    def close(self) -> None:
+        if self._transport:
+            self._transport.close()
+
+    def set_multicast(self, ttl: int = 1, interface: str = None) -> None:
+        """
+        Configure the socket for sending multicast requests
+        :param ttl: time-to-live (hops) of multicast datagrams
+        :param interface: IP of the local interface to send from, default route if not given
+        """
+        sock = self._transport.get_extra_info("socket")
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, ttl)
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+        if interface:
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+
+    def join_group(self, group: str, interface: str = "0.0.0.0") -> None:
+        """
+        Join a multicast group to receive group requests, the endpoint must be bound to the group port
+        :param group: multicast IP of the group
+        :param interface: IP of the local interface to join on
+        """
+        sock = self._transport.get_extra_info("socket")
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(group) + socket.inet_aton(interface))
+
+    # DatagramProtocol
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self._transport = transport
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        for fut in (*self._pending_acks.values(), *self._pending_rsps.values()):
+            if not fut.done():
+                fut.set_exception(CoapError(f"Endpoint closed - {exc}"))
+
+    def datagram_received(self, data: bytes, addr: Remote) -> None:
+        try:
+            msg = Message.decode(data)
+        except ValueError:
+            return
+        msg.remote = addr[:2]
+
+        if msg.mtype in (ACK, RST):
+            fut = self._pending_acks.get((msg.remote, msg.mid))
+            if fut and not fut.done():
+                fut.set_result(msg)
+
+        if is_response(msg.code):
+            if msg.mtype == CON:
+                self.send(Message(mtype=ACK, code=EMPTY, mid=msg.mid), msg.remote)
+            self._response_received(msg)
+
+        elif is_request(msg.code):
+            self._request_received(msg)
+
+    def _response_received(self, msg: Message) -> None:
+        """
+        Route a response to the request waiting on it
+        :param msg: received response
+        """
+        fut = self._pending_rsps.get((msg.remote, msg.token))
+        if fut and not fut.done():
+            fut.set_result(msg)
+
+        if msg.token in self._pending_groups:
+            responses, members, done = self._pending_groups[msg.token]
+            responses.setdefault(msg.remote, msg)
+            if members and all(m in responses for m in members):
+                done.set()
+
+    def _request_received(self, msg: Message) -> None:
+        """
+        Handle a request from a remote endpoint, client-only endpoints reject them
+        :param msg: received request
+        """
+        if msg.mtype == CON:
+            self.send(Message(mtype=RST, code=EMPTY, mid=msg.mid), msg.remote)
+
+    # Helper Functions
+    def next_mid(self) -> int:
+        self._mid = (self._mid + 1) & 0xFFFF
+        return self._mid
+
+    @staticmethod
+    def new_token(length: int = 4) -> bytes:
+        return random.getrandbits(length * 8).to_bytes(length, "big")
+
+    @staticmethod
+    async def resolve(remote: Remote) -> Remote:
+        """
+        Resolve a hostname to the address responses will be received from
+        :param remote: host, port to resolve
+        :return: ip, port
+        """
+        loop = asyncio.get_event_loop()
+        info = await loop.getaddrinfo(remote[0], remote[1], family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        return info[0][4][:2]
+
+    def send(self, msg: Message, remote: Remote) -> None:
+        self._transport.sendto(msg.encode(), remote)
+
+    async def _transmit(self, msg: Message, remote: Remote) -> Optional[Message]:
+        """
+        Send a message, retransmitting a confirmable message with exponential back-off until acknowledged
+        :param msg: message to send
+        :param remote: ip, port to send the message
+        :return: ACK/RST received or None for a non-confirmable message
+        """
+        if msg.mtype != CON:
+            self.send(msg, remote)
+            return None
+
+        key = (remote, msg.mid)
+        fut = self._pending_acks[key] = asyncio.get_event_loop().create_future()
+        timeout = self._ack_timeout * random.uniform(1, ACK_RANDOM_FACTOR)
+        try:
+            for _ in range(self._max_retransmit + 1):
+                self.send(msg, remote)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(fut), timeout)
+                except asyncio.TimeoutError:
+                    timeout *= 2
+            raise CoapTimeout(f"{remote[0]}:{remote[1]} did not acknowledge message {msg.mid}")
+        finally:
+            self._pending_acks.pop(key, None)
+
+    async def _exchange(self, msg: Message, remote: Remote) -> Message:
+        """
+        Send a single request message and wait for its piggybacked or separate response
+        :param msg: request to send
+        :param remote: ip, port to send the request
+        :return: response message
+        """
+        # A message ID can only be in flight once per remote, the remote would drop it as a duplicate
+        if msg.mid is None or (remote, msg.mid) in self._pending_acks:
+            msg.mid = self.next_mid()
+        msg.token = msg.token or self.new_token()
+
+        key = (remote, msg.token)
+        fut = self._pending_rsps[key] = asyncio.get_event_loop().create_future()
+        try:
+            ack = await self._transmit(msg, remote)
+            if ack is not None and ack.mtype == RST:
+                raise CoapReset(f"{remote[0]}:{remote[1]} reset message {msg.mid}")
+            if ack is not None and ack.code != EMPTY:
+                return ack
+            return await fut
+        finally:
+            self._pending_rsps.pop(key, None)
+
+    async def request(self, msg: Message, remote: Remote, timeout: float = None) -> Message:
+        """
+        Send a request and wait for the complete response.
+        Payloads larger than the block size are sent using Block1, responses using Block2 are reassembled
+        :param msg: request to send
+        :param remote: host, port to send the request
+        :param timeout: max time to wait for the complete exchange
+        :return: response message
+        """
+        return await asyncio.wait_for(self._request(msg, await self.resolve(remote)), timeout)
+
+    async def multicast(self, msg: Message, group: Remote, wait: float, members: Collection[Remote] = ()) -> Dict[Remote, Message]:
+        """
+        Send a non-confirmable request to a multicast group and collect the responses of its members.
+        Responses are correlated by the request token and keyed by their source address
+        :param msg: request to send
+        :param group: multicast ip, port of the group
+        :param wait: max time to collect responses
+        :param members: addresses expected to respond, stop waiting once all have responded
+        :return: source address -> response
+        """
+        msg.mtype = NON
+        msg.mid = self.next_mid() if msg.mid is None else msg.mid
+        msg.token = msg.token or self.new_token()
+
+        responses: Dict[Remote, Message] = {}
+        done = asyncio.Event()
+        self._pending_groups[msg.token] = (responses, tuple(members), done)
+        try:
+            self.send(msg, await self.resolve(group))
+            await asyncio.wait_for(done.wait(), wait)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._pending_groups.pop(msg.token, None)
+        return responses
+
+    async def _request(self, msg: Message, remote: Remote) -> Message:
+        if len(msg.payload) > self.block_size:
+            rsp = await self._request_block1(msg, remote)
+        else:
+            rsp = await self._exchange(msg, remote)
+
+        if rsp.get_option(BLOCK2) is not None:
+            rsp = await self._request_block2(msg, rsp, remote)
+        return rsp
+
+    async def _request_block1(self, msg: Message, remote: Remote) -> Message:
+        """
+        Send a large request payload as a sequence of Block1 requests
+        :param msg: request to send
+        :param remote: ip, port to send the request
+        :return: response to the final block
+        """
+        szx = self._szx
+        offset = 0
+        payload = msg.payload
+        token = msg.token or self.new_token()
+        while True:
+            size = 2 ** (szx + 4)
+            more = offset + size < len(payload)
+            block = msg.copy(mid=msg.mid if offset == 0 else None, token=token, payload=payload[offset:offset + size])
+            block.set_option(BLOCK1, encode_block(offset // size, more, szx))
+            if offset == 0:
+                block.set_option(SIZE1, len(payload))
+
+            rsp = await self._exchange(block, remote)
+            if not more or rsp.code != CONTINUE:
+                return rsp
+
+            # Server may request a smaller block size
+            rsp_block = rsp.get_uint(BLOCK1)
+            if rsp_block is not None:
+                szx = min(szx, decode_block(rsp_block)[2])
+            offset += size
+
+    async def _request_block2(self, msg: Message, rsp: Message, remote: Remote) -> Message:
+        """
+        Retrieve the remaining blocks of a Block2 response
+        :param msg: original request
+        :param rsp: first block of the response
+        :param remote: ip, port to send the request
+        :return: response with the reassembled payload
+        """
+        body = bytearray(rsp.payload)
+        num, more, szx = decode_block(rsp.get_uint(BLOCK2))
+        options = [(n, v) for n, v in msg.options if n not in (BLOCK1, SIZE1)]
+        while more:
+            block = Message(mtype=msg.mtype, code=msg.code, options=options)
+            block.set_option(BLOCK2, encode_block(num + 1, False, szx))
+            rsp = await self._exchange(block, remote)
+            if rsp.get_option(BLOCK2) is None:
+                raise CoapError(f"{remote[0]}:{remote[1]} ended block-wise response unexpectedly - {code_str(rsp.code)}")
+
+            num, more, szx = decode_block(rsp.get_uint(BLOCK2))
+            body += rsp.payload
+
+        rsp.payload = bytes(body)
+        rsp.del_option(BLOCK2)
+        return rsp
@@ -1,62 +1,195 @@
+import asyncio
 import os
+import time
 
+from collections import OrderedDict
 from coapthon import defines
-from coapthon.resources.resource import Resource
-from coapthon.server.coap import CoAP
+from typing import Dict, Tuple
 
-from sb_utils import decode_msg, encode_msg, Producer
+from sb_utils import decode_msg, make_producer, new_trace, safe_cast, BatchPublisher, EncodeCache
+from coap_protocol import (
+    CoapEndpoint, Message, ACK, CON, NON, POST, CONTENT, CONTINUE, BAD_REQUEST, NOT_FOUND, METHOD_NOT_ALLOWED,
+    REQUEST_ENTITY_INCOMPLETE, REQUEST_ENTITY_TOO_LARGE, BLOCK1, decode_block, encode_block
+)
 
+# Reverse content format lookup, content format number -> encoding (ex. 50: "json")
+CONTENT_FORMATS = {v: k.split("/")[1] for k, v in defines.Content_types.items()}
 
-class TransportResource(Resource):
-    def __init__(self, name="TransportResource", coap_server=None):
-        super(TransportResource, self).__init__(name, coap_server, visible=True, observable=True, allow_children=True)
+EXCHANGE_LIFETIME = 247  # seconds, RFC7252 - 4.8.2
+
+# Acknowledgement of a received response, encoded once per encoding
+RECEIVED = EncodeCache({
+    "status": 200,
+    "status_text": "received"
+})
+
+
+class CoapServer(CoapEndpoint):
+    """
+    Asynchronous CoAP server, receives responses from devices and forwards them to the orchestrator
+    """
+    def __init__(self, publisher: BatchPublisher, max_body: int = 1024 * 1024, **kwargs):
+        """
+        :param publisher: publisher to forward responses to the orchestrator
+        :param max_body: max size, in bytes, of a block-wise request body
+        :param kwargs: endpoint options
+        """
+        super().__init__(**kwargs)
+        self._publisher = publisher
+        self._max_body = max_body
+        self._recent: OrderedDict = OrderedDict()
+        self._blocks: Dict[Tuple[Tuple[str, int], str], Tuple[int, bytearray, float]] = {}
+        self._last_sweep = time.monotonic()
+
+    def _request_received(self, msg: Message) -> None:
+        """
+        Handle a request from a device, retransmitted requests are answered with the original response
+        :param msg: received request
+        """
+        key = (msg.remote, msg.mid)
+        if key in self._recent:
+            if self._recent[key] is not None:
+                self._transport.sendto(self._recent[key], msg.remote)
+            return
+
+        rsp = self.render(msg)
+        rsp.mtype = ACK if msg.mtype == CON else NON
+        rsp.mid = msg.mid if msg.mtype == CON else self.next_mid()
+        rsp.token = msg.token
+
+        data = rsp.encode()
+        self._transport.sendto(data, msg.remote)
+        self._remember(key, data if msg.mtype == CON else None)
+
+    def _remember(self, key, data) -> None:
+        """
+        Remember the response to a request to answer retransmissions, bounded to the most recent requests
+        :param key: remote, message ID of the request
+        :param data: encoded response, None if retransmissions should be ignored
+        """
+        self._recent[key] = data
+        while len(self._recent) > 65536:
+            self._recent.popitem(last=False)
+
+        # Expire stale block-wise transfers
+        now = time.monotonic()
+        if now - self._last_sweep > EXCHANGE_LIFETIME:
+            self._last_sweep = now
+            self._blocks = {k: v for k, v in self._blocks.items() if now - v[2] < EXCHANGE_LIFETIME}
+
+    def render(self, request: Message) -> Message:
+        """
+        Process a request to the transport resource
+        :param request: received request
+        :return: response
+        """
+        if request.uri_path.strip("/") != "transport":
+            return Message(code=NOT_FOUND)
+        if request.code != POST:
+            return Message(code=METHOD_NOT_ALLOWED)
 
-    def render_POST_advanced(self, request, response):
         # retrieve Content_type stored as dict of types:values (ex. "application/json": 50)
-        encoding = [k for k, v in defines.Content_types.items() if v == request.content_type]
-        encoding = "json" if len(encoding) != 1 else encoding[0].split("/")[1]
+        encoding = CONTENT_FORMATS.get(request.content_format, "json")
+        mid = request.mid
+
+        block1 = request.get_uint(BLOCK1)
+        if block1 is not None:
+            payload, mid, rsp = self._block1(request, block1)
+            if rsp is not None:
+                return rsp
+        else:
+            payload = request.payload
 
-        # read custom options added for O.I.F. and retrieve them based on their number
-        # opts = {o.name: o.value for o in request.options}
+        try:
+            message = decode_msg(payload, encoding)
+        except Exception as e:  # pylint: disable=broad-except
+            return Message(code=BAD_REQUEST, payload=f"Cannot decode {encoding} payload - {e}")
 
         # Create headers for the orchestrator from the request
         headers = dict(
-            correlationID=f"{request.mid:x}",
-            socket=(request.source[0] + ":" + str(request.source[1])),
+            correlationID=f"{mid:x}",
+            socket=f"{request.remote[0]}:{request.remote[1]}",
             encoding=encoding,
             transport="coap",
+            # The command trace is held by the client, the orchestrator joins the response to it by the correlation ID
+            trace=new_trace("", transport_responded=time.time()),
             # orchestratorID="orchid1234",  # orchestratorID is currently an unused field, this is a placeholder
         )
 
         # Send response back to Orchestrator
-        producer = Producer(os.environ.get("QUEUE_HOST", "localhost"), os.environ.get("QUEUE_PORT", "5672"))
-        producer.publish(
-            message=decode_msg(request.payload, encoding),
-            headers=headers,
-            exchange="orchestrator",
-            routing_key="response"
-        )
+        self.received(message, headers, request)
 
         # build and send response
-        response.payload = encode_msg({
-            "status": 200,
-            "status_text": "received"
-        }, encoding)
-        response.code = defines.Codes.CONTENT.number
-        return self, response
+        rsp = Message(code=CONTENT, payload=self._ack_body(encoding))
+        rsp.content_format = request.content_format or defines.Content_types["application/json"]
+        if block1 is not None:
+            rsp.set_option(BLOCK1, block1)
+        return rsp
+
+    def received(self, message: dict, headers: dict, request: Message) -> None:
+        """
+        Handle a decoded message from a device, forwards it to the orchestrator
+        :param message: decoded message
+        :param headers: headers for the orchestrator
+        :param request: received request, the last block if block-wise
+        """
+        self._publisher.put(message, headers)
 
+    def _block1(self, request: Message, block1: int):
+        """
+        Reassemble a block-wise request body
+        :param request: received block
+        :param block1: Block1 option value
+        :return: payload, message ID of the first block, response if the body is incomplete
+        """
+        num, more, szx = decode_block(block1)
+        size = 2 ** (szx + 4)
+        key = (request.remote, request.token.hex())
 
-class CoAPServer(CoAP):
-    def __init__(self, host, port):
-        CoAP.__init__(self, (host, port))
-        self.add_resource("transport/", TransportResource())
+        if num == 0:
+            self._blocks[key] = (request.mid, bytearray(), time.monotonic())
+        elif key not in self._blocks or len(self._blocks[key][1]) != num * size:
+            self._blocks.pop(key, None)
+            return None, None, Message(code=REQUEST_ENTITY_INCOMPLETE)
 
+        mid, body, _ = self._blocks[key]
+        body += request.payload
+        if len(body) > self._max_body:
+            self._blocks.pop(key, None)
+            rsp = Message(code=REQUEST_ENTITY_TOO_LARGE)
+            rsp.set_option(BLOCK1, encode_block(0, False, szx))
+            return None, None, rsp
+
+        if more:
+            self._blocks[key] = (mid, body, time.monotonic())
+            rsp = Message(code=CONTINUE)
+            rsp.set_option(BLOCK1, encode_block(num, True, szx))
+            return None, None, rsp
+
+        self._blocks.pop(key, None)
+        return bytes(body), mid, None
+
+    def _ack_body(self, encoding: str) -> bytes:
+        """
+        Encoded body of the received acknowledgement, cached per encoding
+        :param encoding: encoding of the request
+        :return: encoded body
+        """
+        return RECEIVED.encode_bytes(encoding)
 
 if __name__ == "__main__":
-    server = CoAPServer("0.0.0.0", 5683)
+    publisher = BatchPublisher(
+        make_producer(host=os.environ.get("QUEUE_HOST", "localhost"), port=os.environ.get("QUEUE_PORT", "5672")),
+        batch_size=safe_cast(os.environ.get("COAP_BATCH_SIZE", 100), int, 100),
+        interval=safe_cast(os.environ.get("COAP_BATCH_INTERVAL", 0.05), float, 0.05)
+    )
+    publisher.start()
+
+    loop = asyncio.get_event_loop()
+    server = loop.run_until_complete(CoapServer.create(("0.0.0.0", 5683), publisher=publisher))
     try:
         print("Server listening on 0.0.0.0:5683")
-        server.listen(10)
+        loop.run_forever()
     except KeyboardInterrupt:
         print("Server Shutdown")
         server.close()
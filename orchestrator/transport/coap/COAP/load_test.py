@@ -0,0 +1,107 @@
+"""
+load_test.py
+Load test the CoAP receive server using local CoAP clients standing in for devices.
+Responses are counted by a local publisher instead of being published to the orchestrator unless `--publish` is given.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+from coapthon import defines
+
+from sb_utils import encode_msg, make_producer, BatchPublisher
+from coap_protocol import CoapEndpoint, Message, CON, NON, POST
+from coap_server import CoapServer
+
+
+class CountingPublisher:
+    """
+    Publisher stand-in that counts the messages that would be published to the orchestrator
+    """
+    def __init__(self):
+        self.count = 0
+
+    def put(self, message, headers: dict) -> None:
+        self.count += 1
+
+
+async def device(server: tuple, requests: int, payload: bytes, confirmable: bool, latencies: list) -> int:
+    """
+    Simulated device, sends responses to the server one at a time
+    :param server: ip, port of the server
+    :param requests: number of requests to send
+    :param payload: encoded OpenC2 response
+    :param confirmable: send confirmable requests
+    :param latencies: list to record request latencies to
+    :return: number of failed requests
+    """
+    endpoint = await CoapEndpoint.create(("127.0.0.1", 0))
+    errors = 0
+    for _ in range(requests):
+        msg = Message(mtype=CON if confirmable else NON, code=POST, payload=payload)
+        msg.uri_path = "transport"
+        msg.content_format = defines.Content_types["application/json"]
+
+        start = time.perf_counter()
+        try:
+            if confirmable:
+                await endpoint.request(msg, server, 10)
+            else:
+                endpoint.send(msg.copy(mid=endpoint.next_mid(), token=endpoint.new_token()), server)
+            latencies.append(time.perf_counter() - start)
+        except Exception:  # pylint: disable=broad-except
+            errors += 1
+    endpoint.close()
+    return errors
+
+
+async def run(args) -> None:
+    if args.publish:
+        publisher = BatchPublisher(make_producer(host=os.environ.get("QUEUE_HOST", "localhost"), port=os.environ.get("QUEUE_PORT", "5672")))
+        publisher.start()
+    else:
+        publisher = CountingPublisher()
+
+    server = await CoapServer.create(("127.0.0.1", 0), publisher=publisher)
+    payload = encode_msg({
+        "status": 200,
+        "status_text": "x" * args.size,
+    }, "json").encode("utf-8")
+
+    latencies = []
+    start = time.perf_counter()
+    errors = await asyncio.gather(*[
+        device(server.sockname, args.requests, payload, not args.non, latencies) for _ in range(args.clients)
+    ])
+    elapsed = time.perf_counter() - start
+    server.close()
+
+    total = args.clients * args.requests
+    latencies.sort()
+    print(json.dumps({
+        "clients": args.clients,
+        "requests": total,
+        "errors": sum(errors),
+        "published": getattr(publisher, "count", None),
+        "seconds": round(elapsed, 3),
+        "requests/sec": round(total / elapsed, 1),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 3) if latencies else None,
+            "p50": round(latencies[len(latencies) // 2] * 1000, 3) if latencies else None,
+            "p99": round(latencies[int(len(latencies) * 0.99)] * 1000, 3) if latencies else None
+        }
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CoAP receive server load test")
+    parser.add_argument("-c", "--clients", type=int, default=50, help="number of concurrent clients")
+    parser.add_argument("-n", "--requests", type=int, default=200, help="number of requests per client")
+    parser.add_argument("-s", "--size", type=int, default=64, help="size of the response status text, sizes over the block size are sent block-wise")
+    parser.add_argument("--non", action="store_true", help="send non-confirmable requests")
+    parser.add_argument("--publish", action="store_true", help="publish responses to the orchestrator queue")
+
+    asyncio.get_event_loop().run_until_complete(run(parser.parse_args()))
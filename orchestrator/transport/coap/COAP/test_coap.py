@@ -0,0 +1,259 @@
+"""
+test_coap.py
+Block-wise transfers and multicast requests over 127.0.0.1, run from this directory with `python -m unittest test_coap`
+"""
+import asyncio
+import socket
+import time
+import unittest
+
+from coap_client import CoapTransport
+from coap_protocol import (
+    CoapEndpoint, Message, ACK, CON, NON, POST, CONTENT, CONTINUE, BLOCK1, BLOCK2, decode_block, encode_block, size_exponent
+)
+from coap_server import CoapServer
+
+GROUP = "239.255.76.67"
+HEADERS = {"source": {"correlationID": "1a2b", "transport": {"socket": "127.0.0.1:5683"}}}
+
+
+def loopback_multicast() -> bool:
+    """
+    Check that a multicast datagram sent from 127.0.0.1 is received on the loopback interface
+    :return: loopback multicast supported
+    """
+    recv = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    send = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        recv.bind(("0.0.0.0", 0))
+        recv.settimeout(0.5)
+        recv.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, socket.inet_aton(GROUP) + socket.inet_aton("127.0.0.1"))
+        send.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton("127.0.0.1"))
+        send.sendto(b"probe", (GROUP, recv.getsockname()[1]))
+        return recv.recv(16) == b"probe"
+    except OSError:
+        return False
+    finally:
+        recv.close()
+        send.close()
+
+
+class BlockDevice(CoapEndpoint):
+    """
+    Device reassembling a Block1 request and answering with the reversed body as a Block2 response
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.body = bytearray()
+        self.response = b""
+
+    def _request_received(self, msg: Message) -> None:
+        rsp = Message(mtype=ACK, code=CONTENT, mid=msg.mid, token=msg.token)
+        szx = size_exponent(self.block_size)
+        block2 = msg.get_uint(BLOCK2)
+        num = decode_block(block2)[0] if block2 is not None else 0
+
+        if block2 is None:
+            block1 = msg.get_uint(BLOCK1)
+            if block1 is None:
+                self.body = bytearray(msg.payload)
+            else:
+                num1, more, _ = decode_block(block1)
+                self.body = (self.body if num1 else bytearray()) + msg.payload
+                rsp.set_option(BLOCK1, encode_block(num1, more, szx))
+                if more:
+                    rsp.code = CONTINUE
+                    self.send(rsp, msg.remote)
+                    return
+            self.response = bytes(self.body[::-1])
+
+        rsp.payload = self.response[num * self.block_size:(num + 1) * self.block_size]
+        rsp.set_option(BLOCK2, encode_block(num, (num + 1) * self.block_size < len(self.response), szx))
+        self.send(rsp, msg.remote)
+
+
+class GroupMember(CoapEndpoint):
+    """
+    Member of a multicast group, answering group requests from its own unicast endpoint
+    """
+    def __init__(self, reply: CoapEndpoint, **kwargs):
+        super().__init__(**kwargs)
+        self.reply = reply
+
+    def _request_received(self, msg: Message) -> None:
+        rsp = Message(mtype=NON, code=CONTENT, mid=self.next_mid(), token=msg.token, payload=str(self.reply.sockname))
+        self.reply.send(rsp, msg.remote)
+
+
+class RecordingServer(CoapServer):
+    def __init__(self, **kwargs):
+        super().__init__(publisher=None, **kwargs)
+        self.messages = []
+
+    def received(self, message, headers, request):
+        self.messages.append(message)
+
+
+class SlowDevice(CoapEndpoint):
+    """
+    Device answering after a delay, counting the requests it is handling at once
+    """
+    def __init__(self, delay: float, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+
+    def _request_received(self, msg: Message) -> None:
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        asyncio.get_event_loop().call_later(self.delay, self._respond, msg)
+
+    def _respond(self, msg: Message) -> None:
+        self.active -= 1
+        self.send(Message(mtype=ACK, code=CONTENT, mid=msg.mid, token=msg.token, payload=b"{}"), msg.remote)
+
+
+class RecordingTransport(CoapTransport):
+    def __init__(self, **kwargs):
+        kwargs.setdefault("ordered", False)
+        super().__init__(url="local://", **kwargs)
+        self.responses = {}
+        self.errors = []
+        self.expired = []
+
+    def _handle_response(self, device, response, headers):
+        self.responses[device["socket"]] = response
+
+    def send_error(self, err, headers):
+        self.errors.append(err)
+
+    def expire(self, message, headers):
+        self.expired.append(headers["destination"])
+
+
+class BlockwiseTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.transport = RecordingTransport(block_size=64)
+        await self.transport._init()
+        self.endpoints = [self.transport._endpoint]
+
+    async def asyncTearDown(self):
+        for endpoint in self.endpoints:
+            endpoint.close()
+
+    async def test_block1_block2_request(self):
+        device = await BlockDevice.create(("127.0.0.1", 0), block_size=64)
+        self.endpoints.append(device)
+        payload = bytes(range(256)) * 4
+        dest = {"socket": f"127.0.0.1:{device.sockname[1]}", "encoding": "json", "profile": ["slpf"]}
+
+        await self.transport._process(HEADERS, [(dest, payload)])
+        self.assertEqual(self.transport.errors, [])
+        self.assertEqual(bytes(device.body), payload)
+        response = self.transport.responses[dest["socket"]]
+        self.assertEqual(response.payload, payload[::-1])
+        self.assertIsNone(response.get_option(BLOCK2))
+
+    async def test_server_block1(self):
+        server = await RecordingServer.create(("127.0.0.1", 0), block_size=64)
+        self.endpoints.append(server)
+        message = {"status": 200, "results": {"data": "x" * 500}}
+        request = Message(mtype=CON, code=POST, payload=b'{"status": 200, "results": {"data": "' + b"x" * 500 + b'"}}')
+        request.uri_path = "transport"
+
+        response = await self.transport._endpoint.request(request, server.sockname, 10)
+        self.assertEqual(response.code, CONTENT)
+        self.assertEqual(server.messages, [message])
+
+
+class DeliveryTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.transport = RecordingTransport(max_per_destination=1, ordered=True)
+        self.transport._loop = asyncio.get_event_loop()
+        await self.transport._init()
+        self.endpoints = [self.transport._endpoint]
+
+    async def asyncTearDown(self):
+        for endpoint in self.endpoints:
+            endpoint.close()
+
+    async def device(self, delay: float) -> dict:
+        device = await SlowDevice.create(("127.0.0.1", 0), delay=delay)
+        self.endpoints.append(device)
+        return {"socket": f"127.0.0.1:{device.sockname[1]}", "encoding": "json", "profile": ["slpf"]}, device
+
+    async def test_expired_while_waiting_for_turn(self):
+        dest, device = await self.device(0.3)
+        expiring = {"source": dict(HEADERS["source"], expires=time.time() + 0.1, trace={"traceID": "t", "hops": {}})}
+
+        await asyncio.gather(
+            self.transport._process(HEADERS, [(dest, b"{}")]),
+            self.transport._process(expiring, [(dest, b"{}")])
+        )
+        self.assertEqual(self.transport.expired, [[dest]])
+        self.assertIn(dest["socket"], self.transport.responses)
+        self.assertIsNone(self.transport.traces.pop("1a2b", dest["socket"]))
+
+    async def test_sent_traced_and_limited(self):
+        dest, device = await self.device(0.1)
+        traced = {"source": dict(HEADERS["source"], trace={"traceID": "t", "hops": {}})}
+
+        await asyncio.gather(*[self.transport._send_device(dest, b"{}", traced) for _ in range(3)])
+        self.assertEqual(device.max_active, 1)
+        self.assertEqual(self.transport.errors, [])
+        self.assertIn("transport_sent", self.transport.traces.pop("1a2b", dest["socket"])["hops"])
+
+
+@unittest.skipUnless(loopback_multicast(), "multicast over the loopback interface is not supported")
+class MulticastTests(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.transport = RecordingTransport(multicast=True, multicast_wait=1, multicast_if="127.0.0.1")
+        await self.transport._init()
+        self.endpoints = [self.transport._endpoint]
+
+    async def asyncTearDown(self):
+        for endpoint in self.endpoints:
+            endpoint.close()
+
+    async def endpoint(self, ip: str) -> CoapEndpoint:
+        endpoint = await CoapEndpoint.create((ip, 0))
+        self.endpoints.append(endpoint)
+        return endpoint
+
+    async def member(self, reply: CoapEndpoint, port: int) -> GroupMember:
+        loop = asyncio.get_event_loop()
+        _, member = await loop.create_datagram_endpoint(lambda: GroupMember(reply), local_addr=("0.0.0.0", port), family=socket.AF_INET, reuse_port=True)
+        member.join_group(GROUP, "127.0.0.1")
+        self.endpoints.append(member)
+        return member
+
+    async def test_group_responses_matched_by_socket(self):
+        # Exact socket, another port of a shared IP (ambiguous) and another port of an IP of one member
+        exact = await self.endpoint("127.0.0.1")
+        shared, shared_device = await self.endpoint("127.0.0.1"), await self.endpoint("127.0.0.1")
+        unique, unique_device = await self.endpoint("127.0.0.2"), await self.endpoint("127.0.0.2")
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("0.0.0.0", 0))
+            group_port = sock.getsockname()[1]
+        for reply in (exact, shared, unique):
+            await self.member(reply, group_port)
+
+        def dest(device: CoapEndpoint) -> dict:
+            ip, port = device.sockname
+            return {"socket": f"{ip}:{port}", "group": f"{GROUP}:{group_port}", "encoding": "json", "profile": ["slpf"]}
+
+        destinations = [(dest(device), b'{"action": "query"}') for device in (exact, shared_device, unique_device)]
+        await self.transport._process(HEADERS, destinations)
+
+        exact_socket, shared_socket, unique_socket = [d["socket"] for d, _ in destinations]
+        self.assertEqual(set(self.transport.responses), {exact_socket, unique_socket})
+        self.assertEqual(self.transport.responses[exact_socket].payload, str(exact.sockname).encode())
+        self.assertEqual(self.transport.responses[unique_socket].payload, str(unique.sockname).encode())
+        self.assertEqual(len(self.transport.errors), 1)
+        self.assertIn(shared_socket, self.transport.errors[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,93 +2,88 @@ import re
 import urllib3
 
 from datetime import datetime
-from sb_utils import Producer, Consumer, default_encode, decode_msg, encode_msg, safe_json
+from sb_utils import TransportRuntime, decode_msg, safe_json, server_timing
 
 
-def process_message(body, message):
+class HttpsTransport(TransportRuntime):
     """
-    Callback when we receive a message from internal buffer to publish to waiting flask.
-    :param body: Contains the message to be sent.
-    :param message: Contains data about the message as well as headers
+    HTTPS transport, commands are POSTed to the device and the response is forwarded to the orchestrator
     """
-    http = urllib3.PoolManager(cert_reqs="CERT_NONE")
-    producer = Producer()
-
-    body = body if isinstance(body, dict) else safe_json(body)
-    rcv_headers = message.headers
-
-    orc_socket = rcv_headers["source"]["transport"]["socket"]  # orch IP:port
-    orc_id = rcv_headers["source"]["orchestratorID"]  # orchestrator ID
-    corr_id = rcv_headers["source"]["correlationID"]  # correlation ID
-
-    for device in rcv_headers["destination"]:
+    name = "https"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = None
+
+    @property
+    def http(self) -> urllib3.PoolManager:
+        """
+        Connection pool shared by all sends, keeps up to one connection per concurrent send to each device
+        """
+        if self._http is None:
+            self._http = urllib3.PoolManager(cert_reqs="CERT_NONE", maxsize=self._max_per_destination)
+        return self._http
+
+    def send(self, device, profile, payload, headers):
+        """
+        POST a command to an actuator and forward the response to the orchestrator
+        :param device: destination device from the message headers
+        :param profile: actuator profile to send to
+        :param payload: command encoded with the device encoding
+        :param headers: headers of the AMQP message
+        """
         device_socket = device["socket"]  # device IP:port
         encoding = device["encoding"]  # message encoding
+        orc_socket = headers["source"]["transport"]["socket"]  # orch IP:port
+        orc_id = headers["source"]["orchestratorID"]  # orchestrator ID
+        corr_id = headers["source"]["correlationID"]  # correlation ID
+
+        print(f"Sending command to {profile}@{device_socket}")
+        rsp = self.http.request(
+            method="POST",
+            url=f"https://{device_socket}",
+            body=payload,  # command being encoded
+            headers={
+                "Content-type": f"application/openc2-cmd+{encoding};version=1.0",
+                # "Status": ...,  # Numeric status code supplied by Actuator's OpenC2-Response
+                "X-Request-ID": corr_id,
+                "Date": f"{datetime.utcnow():%a, %d %b %Y %H:%M:%S GMT}",  # RFC7231-7.1.1.1 -> Sun, 06 Nov 1994 08:49:37 GMT
+                "From": f"{orc_id}@{orc_socket}",
+                "Host": f"{profile}@{device_socket}",
+            }
+        )
 
-        if device_socket and encoding and orc_socket:
-            for profile in device["profile"]:
-                print(f"Sending command to {profile}@{device_socket}")
-
-                try:
-                    rsp = http.request(
-                        method="POST",
-                        url=f"https://{device_socket}",
-                        body=encode_msg(body, encoding),  # command being encoded
-                        headers={
-                            "Content-type": f"application/openc2-cmd+{encoding};version=1.0",
-                            # "Status": ...,  # Numeric status code supplied by Actuator's OpenC2-Response
-                            "X-Request-ID": corr_id,
-                            "Date": f"{datetime.utcnow():%a, %d %b %Y %H:%M:%S GMT}",  # RFC7231-7.1.1.1 -> Sun, 06 Nov 1994 08:49:37 GMT
-                            "From": f"{orc_id}@{orc_socket}",
-                            "Host": f"{profile}@{device_socket}",
-                        }
-                    )
-
-                    rsp_headers = dict(rsp.headers)
-                    if "Content-type" in rsp_headers:
-                        rsp_enc = re.sub(r"^application/openc2-(cmd|rsp)\+", "", rsp_headers["Content-type"])
-                        rsp_enc = re.sub(r"(;version=\d+\.\d+)?$", "", rsp_enc)
-                    else:
-                        rsp_enc = "json"
+        rsp_headers = dict(rsp.headers)
+        if "Content-type" in rsp_headers:
+            rsp_enc = re.sub(r"^application/openc2-(cmd|rsp)\+", "", rsp_headers["Content-type"])
+            rsp_enc = re.sub(r"(;version=\d+\.\d+)?$", "", rsp_enc)
+        else:
+            rsp_enc = "json"
 
-                    rsp_headers = {
-                        "socket": device_socket,
-                        "correlationID": corr_id,
-                        "profile": profile,
-                        "encoding": rsp_enc,
-                        "transport": "https"
-                    }
+        rsp_headers = {
+            "socket": device_socket,
+            "correlationID": corr_id,
+            "profile": profile,
+            "encoding": rsp_enc,
+            "transport": "https"
+        }
 
-                    data = {
-                        "headers": rsp_headers,
-                        "content": decode_msg(rsp.data.decode("utf-8"), rsp_enc)
-                    }
+        # Devices can report their processing time as `Server-Timing: actuator;dur=<ms>`
+        actuator_ms = server_timing(rsp.headers.get("Server-Timing"))
+        trace = self.traces.pop(corr_id, device_socket)
+        if trace is not None:
+            if actuator_ms is not None:
+                trace["actuator_ms"] = actuator_ms
+            rsp_headers["trace"] = trace
 
-                    print(f"Response from request: {rsp.status} - {safe_json(data)}")
-                    producer.publish(message=data["content"], headers=rsp_headers, exchange="orchestrator", routing_key="response")
-                except Exception as err:
-                    err = str(getattr(err, "message", err))
-                    rcv_headers["error"] = True
-                    producer.publish(message=err, headers=rcv_headers, exchange="orchestrator", routing_key="response")
-                    print(f"HTTPS error: {err}")
+        data = {
+            "headers": rsp_headers,
+            "content": decode_msg(rsp.data.decode("utf-8"), rsp_enc)
+        }
 
-        else:
-            response = "Destination/Encoding/Orchestrator Socket of command not specified"
-            rcv_headers["error"] = True
-            producer.publish(message=str(response), headers=rcv_headers, exchange="orchestrator", routing_key="response")
-            print(response)
+        print(f"Response from request: {rsp.status} - {safe_json(data)}")
+        self.respond(data["content"], rsp_headers)
 
 
 if __name__ == "__main__":
-    print("Connecting to RabbitMQ...")
-    try:
-        consumer = Consumer(
-            exchange="transport",
-            routing_key="https",
-            callbacks=[process_message],
-            debug=True
-        )
-
-    except Exception as err:
-        print(f"Consumer Error: {err}")
-        consumer.shutdown()
+    HttpsTransport(debug=True).run()
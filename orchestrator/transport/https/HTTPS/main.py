@@ -2,9 +2,17 @@ import re
 
 from datetime import datetime
 from flask import Flask, request, make_response
-from sb_utils import Producer, decode_msg, encode_msg, default_encode, safe_json
+from sb_utils import decode_msg, safe_json, EncodeCache
+from https_transport import HttpsTransport
 
 app = Flask(__name__)
+transport = HttpsTransport()
+
+# Acknowledgement of a received response, encoded once per encoding
+received = EncodeCache({
+    "status": 200,
+    "status_text": "received"
+})
 
 
 @app.route("/", methods=["POST"])
@@ -22,26 +30,20 @@ def result():
     })
     print(f"Received {status} response from {profile}@{device_socket} - {data}")
     print("Writing to buffer.")
-    producer = Producer()
-    producer.publish(
-        message=decode_msg(request.data, encode),  # message being decoded
-        headers={
+    transport.respond(
+        decode_msg(request.data, encode),  # message being decoded
+        {
             "socket": device_socket,
             "correlationID": corr_id,
             "profile": profile,
             "encoding": encode,
             "transport": "https"
-        },
-        exchange="orchestrator",
-        routing_key="response"
+        }
     )
 
     return make_response(
         # Body
-        encode_msg({
-            "status": 200,
-            "status_text": "received"
-        }, encode),
+        received.encode_bytes(encode),
         # Status Code
         200,
         # Headers
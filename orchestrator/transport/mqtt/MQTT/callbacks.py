@@ -5,16 +5,15 @@ import os
 import paho.mqtt.client as mqtt
 import paho.mqtt.publish as publish
 import re
+import threading
 
-from sb_utils import Consumer, Producer, encode_msg, decode_msg, safe_cast
+from functools import partial
+from typing import Dict, Tuple
 
-# maintains a list of active devices we can receive responses from
-ACTIVE_CONNECTIONS = []
+from sb_utils import TransportRuntime, decode_msg, safe_cast
 
 
 class Callbacks(object):
-    required_device_keys = {"encoding", "profile", "socket"}
-
     @staticmethod
     def on_connect(client, userdata, flags, rc):
         """
@@ -35,12 +34,25 @@ class Callbacks(object):
                 print(f"Listening on {topic.lower()}")
 
     @staticmethod
-    def on_message(client, userdata, msg):
+    def on_subscribe(client, userdata, mid, granted_qos, subscribed):
+        """
+        MQTT Callback for when the server acknowledges a subscription.
+        :param client: Class instance of connection to server
+        :param userdata: User-defined data passed to callbacks
+        :param mid: Message ID of the subscribe request
+        :param granted_qos: QoS granted for each topic
+        :param subscribed: event set once the response topic is subscribed
+        """
+        subscribed.set()
+
+    @staticmethod
+    def on_message(client, userdata, msg, transport):
         """
         MQTT Callback for when a PUBLISH message is received from the server.
         :param client: Class instance of connection to server.
         :param userdata: User-defined data passed to callbacks
         :param msg: Contains payload, topic, qos, retain
+        :param transport: transport publishing the response to the orchestrator
         """
         payload = json.loads(msg.payload)
         payload_header = payload.get("header", {})
@@ -57,114 +69,85 @@ class Callbacks(object):
             "encoding": encoding,
         }
 
-        # Connect and publish to internal buffer
-        exchange = "orchestrator"
-        route = "response"
-        producer = Producer(
-            os.environ.get("QUEUE_HOST", "localhost"),
-            os.environ.get("QUEUE_PORT", "5672")
-        )
-
-        producer.publish(
-            headers=header,
-            message=decode_msg(payload.get("body", ""), encoding),
-            exchange=exchange,
-            routing_key=route
-        )
+        # Publish to internal buffer
+        transport.respond(decode_msg(payload.get("body", ""), encoding), header)
+        print(f"Received: {payload} \nPlaced message onto exchange [orchestrator] queue [response].")
 
-        print(f"Received: {payload} \nPlaced message onto exchange [{exchange}] queue [{route}].")
 
-    @ staticmethod
-    def send_mqtt(body, message):
-        """
-        AMQP Callback when we receive a message from internal buffer to be published
-        :param body: Contains the message to be sent.
-        :param message: Contains data about the message as well as headers
-        """
+class MqttTransport(TransportRuntime):
+    """
+    MQTT transport, commands are published to the actuator topic on the device broker and
+    responses are received on the orchestrator topic of each broker commands were sent to
+    """
+    name = "mqtt"
+    # The command is embedded in a JSON payload with its headers
+    binary_payload = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # active brokers we can receive responses from -> set once their response topic is subscribed
+        self._connections: Dict[Tuple[str, str], threading.Event] = {}
+        self._conn_lock = threading.Lock()
+        self._subscribe_timeout = safe_cast(os.environ.get("MQTT_SUBSCRIBE_TIMEOUT", 5), float, 5)
+
+    @property
+    def tls(self):
         # check for certs if TLS is enabled
         if os.environ.get("MQTT_TLS_ENABLED", False) and os.listdir("/opt/transport/MQTT/certs"):
-            tls = dict(
+            return dict(
                 ca_certs=os.environ.get("MQTT_CAFILE", None),
                 certfile=os.environ.get("MQTT_CLIENT_CERT", None),
                 keyfile=os.environ.get("MQTT_CLIENT_KEY", None)
             )
-        else:
-            tls = None
-
-        # iterate through all devices within the list of destinations
-        for device in message.headers.get("destination", []):
-            # check that all necessary parameters exist for device
-            key_diff = Callbacks.required_device_keys.difference({*device.keys()})
-            if len(key_diff) == 0:
-                encoding = device.get("encoding", "json")
-                ip, port = device.get("socket", "localhost:1883").split(":")
-
-                # iterate through actuator profiles to send message to
-                for actuator in device.get("profile", []):
-                    payload = {
-                        "header": format_header(message.headers, device, actuator),
-                        "body": encode_msg(json.loads(body), encoding)
-                    }
-                    print(f"Sending {ip}:{port} - {payload}")
-
-                    try:
-                        publish.single(
-                            actuator,
-                            payload=json.dumps(payload),
-                            qos=1,
-                            hostname=ip,
-                            port=safe_cast(port, int, 1883),
-                            will={
-                                "topic": actuator,
-                                "payload": json.dumps(payload),
-                                "qos": 1
-                            },
-                            tls=tls
-                        )
-                        print(f"Placed payload onto topic {actuator} Payload Sent: {payload}")
-                    except Exception as e:
-                        print(f"There was an error sending command to {ip}:{port} - {e}")
-                        send_error_response(e, payload["header"])
-                        return
-                get_response(ip, port, message.headers.get("source", {}).get("orchestratorID", ""))
-            else:
-                err_msg = f"Missing required header data to successfully transport message - {', '.join(key_diff)}"
-                send_error_response(err_msg, payload["header"])
-
-
-def send_error_response(e, header):
-    """
-    If error occurs before leaving the transport on the orchestrator side, then send back a message
-    response to the internal buffer indicating so.
-    :param e: Exception thrown 
-    :param header: Include headers which would have been sent for Orchestrator to read.
-    """
-    producer = Producer(
-        os.environ.get("QUEUE_HOST", "localhost"),
-        os.environ.get("QUEUE_PORT", "5672")
-    )
-
-    err = json.dumps(str(e))
-    print(f"Send error response: {err}")
+        return None
 
-    producer.publish(
-        headers=header,
-        message=err,
-        exchange="orchestrator",
-        routing_key="response"
-    )
+    def send(self, device, profile, payload, headers):
+        """
+        Publish a command to the topic of an actuator
+        :param device: destination device from the message headers
+        :param profile: actuator profile to send to
+        :param payload: command encoded with the device encoding
+        :param headers: headers of the AMQP message
+        """
+        ip, port = device["socket"].split(":")
+        msg = json.dumps({
+            "header": format_header(headers, device, profile),
+            "body": payload
+        })
+        print(f"Sending {ip}:{port} - {msg}")
+
+        # Wait for the response subscription so a fast actuator cannot respond before it
+        if not self.listen(ip, port, headers.get("source", {}).get("orchestratorID", "")).wait(self._subscribe_timeout):
+            print(f"Not subscribed to responses from {ip}:{port} after {self._subscribe_timeout}s, publishing anyway")
+        publish.single(
+            profile,
+            payload=msg,
+            qos=1,
+            hostname=ip,
+            port=safe_cast(port, int, 1883),
+            will={
+                "topic": profile,
+                "payload": msg,
+                "qos": 1
+            },
+            tls=self.tls
+        )
+        print(f"Placed payload onto topic {profile} Payload Sent: {msg}")
 
+    def listen(self, ip, port, orc_id) -> threading.Event:
+        """
+        Waits for response from actuator at server at given ip:port
+        :param ip: IP Address specified from destination sent from orchestrator
+        :param port: Port specified from destination sent from orchestrator
+        :param orc_id: Indicates where message was sent from - used in topic to receive responses
+        :return: event set once the response topic is subscribed, or the connection failed
+        """
+        # if we are already connected to a broker, don"t try to connect again
+        with self._conn_lock:
+            if (ip, port) in self._connections:
+                return self._connections[(ip, port)]
+            subscribed = self._connections[(ip, port)] = threading.Event()
 
-def get_response(ip, port, orc_id):
-    """
-    Waits for response from actuator at server at given ip:port
-    :param ip: IP Address specified from destination sent from orchestrator
-    :param port: Port specified from destination sent from orchestrator
-    :param orc_id: Indicates where message was sent from - used in topic to receive responses
-    """
-    # if we are already connected to an ip, don"t try to connect again
-    if ip not in ACTIVE_CONNECTIONS:
-        ACTIVE_CONNECTIONS.append(ip)
         client = mqtt.Client()
         print(f"New connection: {ip}:{port}")
 
@@ -172,12 +155,16 @@ def get_response(ip, port, orc_id):
             client.connect(ip, int(port))
         except Exception as e:
             print(f"ERROR: Connection to {ip}:{port} has been refused - {e}")
+            # Nothing to wait for, the publish fails the same way
+            subscribed.set()
 
         response_topic = f"{orc_id}/response"
         client.user_data_set([response_topic])
         client.on_connect = Callbacks.on_connect
-        client.on_message = Callbacks.on_message
+        client.on_subscribe = partial(Callbacks.on_subscribe, subscribed=subscribed)
+        client.on_message = partial(Callbacks.on_message, transport=self)
         client.loop_start()
+        return subscribed
 
 
 def format_header(header, device, actuator):